@@ -1,3 +1,21 @@
 from django.contrib import admin
+from .models import Job, GeocodedAddress, IdempotencyKey
 
-# Register your models here.
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'attempts', 'run_after', 'created_at')
+    list_filter = ('status', 'kind')
+
+
+@admin.register(GeocodedAddress)
+class GeocodedAddressAdmin(admin.ModelAdmin):
+    list_display = ('normalized_address', 'latitude', 'longitude', 'geocoded_at')
+    search_fields = ('normalized_address',)
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('scope', 'key', 'status', 'response_status', 'created_at')
+    list_filter = ('scope', 'status')
+    search_fields = ('key',)
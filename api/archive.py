@@ -0,0 +1,163 @@
+import base64
+import binascii
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from orders.models import ArchivedOrder, Order, OrderTracking, Rating
+from payments.models import ArchivedPayment, Payment
+from .serializers import OrderSerializer, PaymentSerializer
+
+# 'failed' is a push that took no money; payout_failed still holds escrow.
+ARCHIVABLE_PAYMENT_STATUSES = ('released', 'refunded', 'failed')
+ARCHIVABLE_ORDER_STATUSES = ('completed', 'rejected')
+TRACKING_FIELDS = ('id', 'status', 'description', 'artisan_upload', 'buyer_approval', 'approval_timestamp', 'created_at')
+
+
+def archive_cutoff(months=None):
+    months = settings.ARCHIVE_AFTER_MONTHS if months is None else months
+    return timezone.now() - timedelta(days=30 * months)
+
+
+def _to_json(data):
+    return json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+
+
+def archivable_payments(cutoff):
+    return Payment.objects.filter(status__in=ARCHIVABLE_PAYMENT_STATUSES, created_at__lt=cutoff)
+
+
+def archivable_orders(cutoff):
+    """
+    Settled orders with nothing left in the hot tables that points at them.
+    Rated orders stay put because ratings keep referencing them.
+    """
+    return Order.objects.filter(status__in=ARCHIVABLE_ORDER_STATUSES, updated_at__lt=cutoff).exclude(
+        Exists(Payment.objects.filter(order_id=OuterRef('pk')))
+    ).exclude(
+        Exists(Rating.objects.filter(order_id=OuterRef('pk')))
+    )
+
+
+def archive_payments(cutoff, batch_size=1000):
+    moved = 0
+    while True:
+        with transaction.atomic():
+            batch = list(archivable_payments(cutoff).order_by('id')[:batch_size])
+            if not batch:
+                return moved
+            ArchivedPayment.objects.bulk_create([
+                ArchivedPayment(
+                    id=payment.id,
+                    order_id=payment.order_id_id,
+                    artisan_id=payment.artisan_id_id,
+                    transaction_code=payment.transaction_code,
+                    status=payment.status,
+                    created_at=payment.created_at,
+                    data=_to_json(PaymentSerializer(payment).data),
+                )
+                for payment in batch
+            ], ignore_conflicts=True)
+            Payment.objects.filter(id__in=[payment.id for payment in batch]).delete()
+        moved += len(batch)
+
+
+def archive_orders(cutoff, batch_size=1000):
+    moved = 0
+    while True:
+        with transaction.atomic():
+            batch = list(archivable_orders(cutoff).order_by('id')[:batch_size])
+            if not batch:
+                return moved
+            ids = [order.id for order in batch]
+            tracking = {}
+            for row in OrderTracking.objects.filter(order_id__in=ids).order_by('created_at').values('order_id', *TRACKING_FIELDS):
+                tracking.setdefault(row.pop('order_id'), []).append(row)
+            ArchivedOrder.objects.bulk_create([
+                ArchivedOrder(
+                    id=order.id,
+                    buyer_id=order.buyer_id_id,
+                    artisan_id=order.artisan_id_id,
+                    status=order.status,
+                    created_at=order.created_at,
+                    data=_to_json(dict(OrderSerializer(order).data, tracking=tracking.get(order.id, []))),
+                )
+                for order in batch
+            ], ignore_conflicts=True)
+            Order.objects.filter(id__in=ids).delete()
+        moved += len(batch)
+
+
+def encode_archive_cursor(created_at, pk):
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{pk}".encode()).decode()
+
+
+def decode_archive_cursor(cursor):
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        parsed = parse_datetime(created_at)
+        if parsed is None:
+            raise ValueError(created_at)
+        return parsed, int(pk)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        raise ValidationError({'archive_cursor': 'Invalid cursor.'})
+
+
+def include_archived(request):
+    return request.query_params.get('include_archived', '').lower() in ('1', 'true', 'yes')
+
+
+class IncludeArchivedMixin:
+    """
+    Viewset mixin: the hot table only, unless the client explicitly asks for
+    ``?include_archived=1``, in which case list() appends the matching
+    archived rows (marked ``"archived": true``) and retrieve() falls back to
+    the archive. Paginated lists return one page of archived rows under
+    ``archived`` with their own ``archived_next`` keyset link.
+    """
+    archive_model = None
+
+    def get_archived_queryset(self):
+        return self.archive_model.objects.all()
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if not include_archived(request):
+            return response
+        archived = self.get_archived_queryset().order_by('-created_at', '-id')
+        if not (isinstance(response.data, dict) and 'results' in response.data):
+            response.data = list(response.data) + [dict(data, archived=True) for data in archived.values_list('data', flat=True)]
+            return response
+        page_size = self.paginator.get_page_size(request)
+        cursor = request.query_params.get('archive_cursor')
+        if cursor:
+            created_at, pk = decode_archive_cursor(cursor)
+            archived = archived.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+        rows = list(archived.values_list('pk', 'created_at', 'data')[:page_size + 1])
+        next_link = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_link = replace_query_param(
+                request.build_absolute_uri(), 'archive_cursor', encode_archive_cursor(rows[-1][1], rows[-1][0])
+            )
+        response.data['archived'] = [dict(data, archived=True) for _, _, data in rows]
+        response.data['archived_next'] = next_link
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        if include_archived(request):
+            lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+            if not self.get_queryset().filter(pk=lookup).exists():
+                data = self.get_archived_queryset().filter(pk=lookup).values_list('data', flat=True).first()
+                if data is not None:
+                    return Response(dict(data, archived=True))
+        return super().retrieve(request, *args, **kwargs)
@@ -0,0 +1,193 @@
+import datetime
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from payments.models import DarajaCallback, Payment
+from .ledger import record_transitions
+from .notifications import hub
+from .streams import STATE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_FIELDS = [
+    'status', 'result_description', 'mpesa_receipt_number', 'transaction_date',
+    'amount', 'buyer_phone', 'paid_at', 'released_at', 'held_by_platform',
+]
+# A late or replayed callback must never move a payment backwards out of
+# these states.
+SETTLED_STATUSES = {'releasing', 'released', 'refunded', 'payout_failed'}
+B2C_KINDS = ('b2c_result', 'b2c_timeout')
+
+
+def record_callback(kind, payload):
+    return DarajaCallback.objects.create(kind=kind, payload=payload)
+
+
+def claim_callbacks(limit):
+    now = timezone.now()
+    queryset = DarajaCallback.objects.filter(status='pending').order_by('id')
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(queryset.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            DarajaCallback.objects.filter(id__in=ids).update(status='processing', locked_at=now)
+    else:
+        ids = [
+            callback_id for callback_id in queryset.values_list('id', flat=True)[:limit]
+            if DarajaCallback.objects.filter(id=callback_id, status='pending').update(
+                status='processing', locked_at=now
+            )
+        ]
+    return list(DarajaCallback.objects.filter(id__in=ids).order_by('id'))
+
+
+def requeue_stale_callbacks():
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    return DarajaCallback.objects.filter(status='processing', locked_at__lt=cutoff).update(
+        status='pending', locked_at=None
+    )
+
+
+def replay_callbacks(queryset):
+    """Queue already handled callbacks to be applied again."""
+    return queryset.exclude(status='processing').update(
+        status='pending', error=None, locked_at=None, processed_at=None
+    )
+
+
+def parse_stk_callback(payload):
+    stk_callback = payload['Body']['stkCallback']
+    return stk_callback['CheckoutRequestID'], stk_callback
+
+
+def apply_stk_callback(payment, stk_callback, now):
+    if payment.status in SETTLED_STATUSES:
+        return False
+    result_code = int(stk_callback['ResultCode'])
+    payment.result_description = stk_callback.get('ResultDesc')
+    if result_code == 0:
+        payment.status = 'held'
+        items = stk_callback.get('CallbackMetadata', {}).get('Item', [])
+        item_dict = {item['Name']: item.get('Value') for item in items}
+        payment.mpesa_receipt_number = item_dict.get('MpesaReceiptNumber', payment.mpesa_receipt_number)
+        if item_dict.get('TransactionDate'):
+            trans_date = datetime.datetime.strptime(str(item_dict['TransactionDate']), '%Y%m%d%H%M%S')
+            payment.transaction_date = timezone.make_aware(trans_date, timezone.get_current_timezone())
+        payment.amount = item_dict.get('Amount', payment.amount)
+        payment.buyer_phone = item_dict.get('PhoneNumber', payment.buyer_phone)
+        payment.paid_at = now
+    elif result_code == 1:
+        payment.status = 'refunded'
+    elif payment.status == 'pending':
+        payment.status = 'failed'
+    return True
+
+
+def parse_b2c_result(payload):
+    result = payload['Result']
+    return result['ConversationID'], result
+
+
+def apply_b2c_result(payment, result, now, timed_out=False):
+    if payment.status != 'releasing':
+        return False
+    if timed_out:
+        payment.status = 'payout_failed'
+        payment.result_description = result.get('ResultDesc') or 'B2C request timed out in the queue'
+    elif int(result['ResultCode']) == 0:
+        payment.status = 'released'
+        payment.released_at = now
+        payment.held_by_platform = False
+        payment.result_description = result.get('ResultDesc')
+    else:
+        payment.status = 'payout_failed'
+        payment.result_description = result.get('ResultDesc')
+    return True
+
+
+def process_callbacks(batch_size=500):
+    """
+    Apply one batch of pending inbox rows: one query loads every payment the
+    batch refers to, one bulk_update writes them back and the inbox rows are
+    marked in bulk. Returns the number of callbacks handled.
+    """
+    callbacks = claim_callbacks(batch_size)
+    if not callbacks:
+        return 0
+    now = timezone.now()
+    parsed = {}
+    errors = {}
+    for callback in callbacks:
+        parse = parse_stk_callback if callback.kind == 'stk' else parse_b2c_result
+        try:
+            parsed[callback.id] = parse(callback.payload)
+        except (KeyError, TypeError) as exc:
+            errors[callback.id] = f"Malformed callback: missing {exc}"
+
+    stk_keys = {parsed[c.id][0] for c in callbacks if c.id in parsed and c.kind == 'stk'}
+    b2c_keys = {parsed[c.id][0] for c in callbacks if c.id in parsed and c.kind != 'stk'}
+    by_checkout, by_conversation, loaded_status = {}, {}, {}
+    for payment in Payment.objects.filter(
+        Q(checkout_request_id__in=stk_keys) | Q(transaction_code__in=stk_keys) | Q(b2c_conversation_id__in=b2c_keys)
+    ):
+        loaded_status[payment.pk] = payment.status
+        by_checkout.setdefault(payment.transaction_code, payment)
+        if payment.checkout_request_id:
+            by_checkout[payment.checkout_request_id] = payment
+        if payment.b2c_conversation_id:
+            by_conversation[payment.b2c_conversation_id] = payment
+
+    changed = {}
+    for callback in callbacks:
+        if callback.id not in parsed:
+            continue
+        key, body = parsed[callback.id]
+        payment = (by_checkout if callback.kind == 'stk' else by_conversation).get(key)
+        if payment is None:
+            errors[callback.id] = f"No payment for {'CheckoutRequestID' if callback.kind == 'stk' else 'ConversationID'} {key}"
+            continue
+        try:
+            if callback.kind == 'stk':
+                applied = apply_stk_callback(payment, body, now)
+            else:
+                applied = apply_b2c_result(payment, body, now, timed_out=callback.kind == 'b2c_timeout')
+            if applied:
+                changed[payment.pk] = payment
+        except (KeyError, TypeError, ValueError) as exc:
+            errors[callback.id] = f"Could not apply callback: {exc}"
+
+    with transaction.atomic():
+        if changed:
+            Payment.objects.bulk_update(list(changed.values()), PAYMENT_FIELDS)
+            record_transitions([p for p in changed.values() if p.status != loaded_status[p.pk]])
+            transaction.on_commit(lambda: notify_payments(changed.values()))
+        done = [callback.id for callback in callbacks if callback.id not in errors]
+        DarajaCallback.objects.filter(id__in=done).update(status='processed', processed_at=now, locked_at=None)
+        for callback_id, error in errors.items():
+            DarajaCallback.objects.filter(id=callback_id).update(
+                status='failed', error=error, processed_at=now, locked_at=None
+            )
+    if errors:
+        logger.warning("%d of %d Daraja callbacks failed", len(errors), len(callbacks))
+    return len(callbacks)
+
+
+def notify_payments(payments):
+    """Wake status waiters in this process without waiting for the watcher."""
+    for payment in payments:
+        if payment.transaction_code:
+            hub.publish('payment', payment.transaction_code, {field: getattr(payment, field) for field in STATE_FIELDS})
+
+
+def replay_orphaned_b2c_results(conversation_id):
+    """
+    Re-queue B2C results that arrived before their ConversationID was stored
+    on the payment and were therefore marked failed.
+    """
+    return replay_callbacks(DarajaCallback.objects.filter(
+        kind__in=B2C_KINDS, status='failed', payload__Result__ConversationID=conversation_id,
+    ))
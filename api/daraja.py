@@ -1,8 +1,156 @@
 import requests
 from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 import base64
 import datetime
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TOKEN_EXPIRY_MARGIN = 60
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+STK_IN_PROGRESS = "500.001.1001"
+_local_tokens = {}
+_local_tokens_lock = threading.Lock()
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+class DarajaUnavailable(Exception):
+    """Raised without touching the network while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after ``threshold`` consecutive failures and rejects calls for
+    ``cooldown`` seconds. After the cooldown a single trial call is let
+    through; its outcome closes the breaker again or restarts the cooldown.
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning("Daraja circuit opened after %d consecutive failures", self.failures)
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+circuit_breaker = CircuitBreaker(
+    settings.DARAJA_CIRCUIT_FAILURE_THRESHOLD,
+    settings.DARAJA_CIRCUIT_COOLDOWN_SECONDS,
+)
+
+
+def get_session():
+    """
+    Keep-alive session shared by every thread in this process. Recreated
+    after a fork so worker processes never share pooled sockets.
+    """
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=settings.DARAJA_POOL_SIZE,
+                max_retries=0,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session, _session_pid = session, os.getpid()
+        return _session
+
+
+def _backoff(attempt):
+    delay = settings.DARAJA_RETRY_BACKOFF_SECONDS * (2 ** attempt)
+    return random.uniform(0, min(delay, settings.DARAJA_RETRY_BACKOFF_MAX_SECONDS))
+
+
+def request(method, url, idempotent=False, expected_statuses=(), **kwargs):
+    """
+    Send one Daraja call through the pooled session.
+
+    Idempotent calls are retried up to DARAJA_MAX_RETRIES times on connection
+    errors, timeouts and 429/5xx answers, with full-jitter exponential backoff.
+    Anything that may already have moved money is only retried when the
+    connection was never established. Repeated failures open the circuit
+    breaker, after which calls fail fast with DarajaUnavailable.
+    ``expected_statuses`` are answers the caller handles itself; they are
+    neither retried nor counted as failures.
+    """
+    kwargs.setdefault("timeout", (settings.DARAJA_CONNECT_TIMEOUT, settings.DARAJA_READ_TIMEOUT))
+    path = url.split("?", 1)[0]
+    attempt = 0
+    while True:
+        if not circuit_breaker.allow():
+            logger.warning("daraja request rejected method=%s path=%s circuit=open", method, path)
+            raise DarajaUnavailable("Daraja is unavailable; circuit breaker is open.")
+        started = time.perf_counter()
+        try:
+            response = get_session().request(method, url, **kwargs)
+        except requests.RequestException as exc:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            circuit_breaker.record_failure()
+            retryable = idempotent or isinstance(exc, requests.ConnectTimeout)
+            logger.warning(
+                "daraja request failed method=%s path=%s attempt=%d elapsed_ms=%.1f error=%s",
+                method, path, attempt + 1, elapsed_ms, type(exc).__name__,
+            )
+            if not retryable or attempt >= settings.DARAJA_MAX_RETRIES:
+                raise
+        else:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            expected = response.status_code in expected_statuses
+            if response.status_code >= 500 and not expected:
+                circuit_breaker.record_failure()
+            else:
+                circuit_breaker.record_success()
+            logger.info(
+                "daraja request method=%s path=%s status=%s attempt=%d elapsed_ms=%.1f",
+                method, path, response.status_code, attempt + 1, elapsed_ms,
+            )
+            retryable = idempotent and response.status_code in RETRY_STATUSES and not expected
+            if not retryable or attempt >= settings.DARAJA_MAX_RETRIES:
+                return response
+        time.sleep(_backoff(attempt))
+        attempt += 1
 
 class DarajaAPI:
     def __init__(self):
@@ -10,13 +158,20 @@ class DarajaAPI:
         self.consumer_secret = settings.DARAJA_CONSUMER_SECRET
         self.business_shortcode = settings.DARAJA_SHORTCODE
         self.passkey = settings.DARAJA_PASSKEY
-        self.base_url = "https://sandbox.safaricom.co.ke"
+        self.base_url = settings.DARAJA_BASE_URL.rstrip("/")
         self.callback_url = settings.DARAJA_CALLBACK_URL
 
-    def get_access_token(self):
+    @property
+    def token_cache_key(self):
+        digest = hashlib.sha256(f"{self.base_url}|{self.consumer_key}".encode()).hexdigest()[:16]
+        return f"daraja:access-token:{digest}"
+
+    def fetch_access_token(self):
         url = f"{self.base_url}/oauth/v1/generate?grant_type=client_credentials"
-        response = requests.get(
+        response = request(
+            "GET",
             url,
+            idempotent=True,
             auth=HTTPBasicAuth(self.consumer_key, self.consumer_secret),
         )
         response.raise_for_status()
@@ -24,17 +179,78 @@ class DarajaAPI:
         token = data.get("access_token")
         if not token:
             raise Exception(f"Failed to get access token: {data}")
+        return token, int(data.get("expires_in", 3599))
+
+    def get_access_token(self):
+        """
+        Access token shared by every worker through the Django cache. Only one
+        process refreshes an expired token; the others wait for it to land in
+        the cache (up to DARAJA_TOKEN_WAIT_SECONDS) instead of stampeding the
+        OAuth endpoint.
+        """
+        key = self.token_cache_key
+        with _local_tokens_lock:
+            token, expires_at = _local_tokens.get(key, (None, 0))
+        if token and time.time() < expires_at:
+            return token
+
+        lock_key = f"{key}:lock"
+        deadline = time.monotonic() + settings.DARAJA_TOKEN_WAIT_SECONDS
+        while True:
+            cached = cache.get(key)
+            if cached:
+                return self._remember_token(key, *cached)
+            if cache.add(lock_key, True, timeout=settings.DARAJA_TOKEN_WAIT_SECONDS):
+                try:
+                    cached = cache.get(key)
+                    if cached:
+                        return self._remember_token(key, *cached)
+                    return self._store_token(key)
+                finally:
+                    cache.delete(lock_key)
+            if time.monotonic() > deadline:
+                return self._store_token(key)
+            time.sleep(0.05)
+
+    def _store_token(self, key):
+        token, expires_in = self.fetch_access_token()
+        expires_at = time.time() + max(expires_in - TOKEN_EXPIRY_MARGIN, 1)
+        cache.set(key, (token, expires_at), timeout=max(expires_in - TOKEN_EXPIRY_MARGIN, 1))
+        return self._remember_token(key, token, expires_at)
+
+    def _remember_token(self, key, token, expires_at):
+        with _local_tokens_lock:
+            _local_tokens[key] = (token, expires_at)
         return token
 
+    def invalidate_access_token(self):
+        key = self.token_cache_key
+        cache.delete(key)
+        with _local_tokens_lock:
+            _local_tokens.pop(key, None)
+
+    def _post(self, path, payload, idempotent=False, expected_statuses=()):
+        for attempt in range(2):
+            headers = {
+                "Authorization": f"Bearer {self.get_access_token()}",
+                "Content-Type": "application/json",
+            }
+            response = request(
+                "POST",
+                f"{self.base_url}{path}",
+                idempotent=idempotent,
+                expected_statuses=expected_statuses,
+                headers=headers,
+                json=payload,
+            )
+            if response.status_code != 401 or attempt:
+                return response
+            self.invalidate_access_token()
+
     def stk_push(self, buyer_phone, amount, transaction_id, transaction_desc):
-        access_token = self.get_access_token()
         timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
         data_to_encode = f"{self.business_shortcode}{self.passkey}{timestamp}"
         password = base64.b64encode(data_to_encode.encode("utf-8")).decode("utf-8")
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json",
-        }
         payload = {
             "BusinessShortCode": self.business_shortcode,
             "Password": password,
@@ -48,9 +264,8 @@ class DarajaAPI:
             "AccountReference": transaction_id,
             "TransactionDesc": transaction_desc,
         }
-        url = f"{self.base_url}/mpesa/stkpush/v1/processrequest"
-        response = requests.post(url, headers=headers, json=payload)
-        print("Daraja raw response:", response.text)
+        response = self._post("/mpesa/stkpush/v1/processrequest", payload)
+        logger.debug("Daraja STK push response: %s", response.text)
         response.raise_for_status()
         return response.json()
 
@@ -67,15 +282,32 @@ class DarajaAPI:
 
 
 
-    def b2c_payment(self, artisan_phone, amount, transaction_id, transaction_desc, occassion=""):
-        access_token = self.get_access_token()
+    def stk_query(self, checkout_request_id):
+        """
+        Final result of an STK push. Daraja answers 500 with errorCode
+        500.001.1001 while the buyer has not yet responded; that comes back
+        as None.
+        """
         timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
         data_to_encode = f"{self.business_shortcode}{self.passkey}{timestamp}"
         password = base64.b64encode(data_to_encode.encode("utf-8")).decode("utf-8")
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json",
+        payload = {
+            "BusinessShortCode": self.business_shortcode,
+            "Password": password,
+            "Timestamp": timestamp,
+            "CheckoutRequestID": checkout_request_id,
         }
+        response = self._post("/mpesa/stkpushquery/v1/query", payload, idempotent=True, expected_statuses=(500,))
+        logger.debug("Daraja STK query response: %s", response.text)
+        if response.status_code == 500 and STK_IN_PROGRESS in response.text:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    def b2c_payment(self, artisan_phone, amount, transaction_id, transaction_desc, occassion=""):
+        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        data_to_encode = f"{self.business_shortcode}{self.passkey}{timestamp}"
+        password = base64.b64encode(data_to_encode.encode("utf-8")).decode("utf-8")
         payload = {
             "InitiatorName": settings.DARAJA_INITIATOR_NAME,    
             "SecurityCredential": settings.DARAJA_SECURITY_CREDENTIAL, 
@@ -88,9 +320,8 @@ class DarajaAPI:
             "ResultURL": settings.DARAJA_B2C_RESULT_URL,        
             "Occasion": occassion,
         }
-        url = f"{self.base_url}/mpesa/b2c/v1/paymentrequest"
-        response = requests.post(url, headers=headers, json=payload)
-        print("Daraja B2C raw response:", response.text)
+        response = self._post("/mpesa/b2c/v1/paymentrequest", payload)
+        logger.debug("Daraja B2C response: %s", response.text)
         response.raise_for_status()
         return response.json()
 
@@ -0,0 +1,311 @@
+import heapq
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from .utils import EARTH_RADIUS_KM
+
+logger = logging.getLogger(__name__)
+
+LEAF_SIZE = 16
+ENTRY_FIELDS = ('user_id', 'first_name', 'last_name', 'latitude', 'longitude')
+
+
+def _to_xyz(lat, lon):
+    phi = math.radians(float(lat))
+    lam = math.radians(float(lon))
+    return math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi)
+
+
+def _to_xyz_many(lats, lons):
+    phi = np.radians(np.asarray(lats, dtype=np.float64))
+    lam = np.radians(np.asarray(lons, dtype=np.float64))
+    return np.column_stack((np.cos(phi) * np.cos(lam), np.cos(phi) * np.sin(lam), np.sin(phi)))
+
+
+def _chord_sq_to_km(chord_sq):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(chord_sq) / 2))
+
+
+def _km_to_chord_sq(km):
+    angle = min(float(km) / EARTH_RADIUS_KM, math.pi)
+    return (2 * math.sin(angle / 2)) ** 2
+
+
+class _KDTree:
+    """
+    Immutable KD-tree over unit vectors, stored implicitly: the node splitting
+    positions ``lo:hi`` sits at ``(lo + hi) // 2`` and splits on ``axes[mid]``.
+    Straight-line distance between unit vectors grows with great-circle
+    distance, so nearest in 3D is nearest on the globe.
+    """
+
+    def __init__(self, ids, points):
+        size = len(ids)
+        coords = np.asarray(points, dtype=np.float64).reshape(size, 3)
+        order = np.arange(size)
+        axes = np.zeros(size, dtype=np.int8)
+        stack = [(0, size)]
+        while stack:
+            lo, hi = stack.pop()
+            if hi - lo <= LEAF_SIZE:
+                continue
+            segment = order[lo:hi]
+            spread = coords[segment].max(axis=0) - coords[segment].min(axis=0)
+            axis = int(np.argmax(spread))
+            mid = (lo + hi) // 2
+            order[lo:hi] = segment[np.argpartition(coords[segment, axis], mid - lo)]
+            axes[mid] = axis
+            stack.append((lo, mid))
+            stack.append((mid + 1, hi))
+        self.size = size
+        self.ids = [ids[i] for i in order.tolist()]
+        self.coords = [tuple(point) for point in coords[order].tolist()]
+        self.axes = axes.tolist()
+
+    def search(self, target, k, max_chord_sq, accept):
+        heap = []
+        coords, axes, ids = self.coords, self.axes, self.ids
+        tx, ty, tz = target
+
+        def consider(pos):
+            x, y, z = coords[pos]
+            dist_sq = (x - tx) ** 2 + (y - ty) ** 2 + (z - tz) ** 2
+            if len(heap) < k:
+                if dist_sq <= max_chord_sq and accept(ids[pos]):
+                    heapq.heappush(heap, (-dist_sq, ids[pos]))
+            elif dist_sq < -heap[0][0] and accept(ids[pos]):
+                heapq.heapreplace(heap, (-dist_sq, ids[pos]))
+
+        def visit(lo, hi):
+            if hi - lo <= LEAF_SIZE:
+                for pos in range(lo, hi):
+                    consider(pos)
+                return
+            mid = (lo + hi) // 2
+            diff = target[axes[mid]] - coords[mid][axes[mid]]
+            if diff < 0:
+                near, far = (lo, mid), (mid + 1, hi)
+            else:
+                near, far = (mid + 1, hi), (lo, mid)
+            visit(*near)
+            consider(mid)
+            bound = -heap[0][0] if len(heap) == k else max_chord_sq
+            if diff * diff <= bound:
+                visit(*far)
+
+        if self.size and k > 0:
+            visit(0, self.size)
+        return [(-neg_dist_sq, user_id) for neg_dist_sq, user_id in heap]
+
+
+class ArtisanIndex:
+    """
+    Process-local nearest-neighbour index over artisan coordinates.
+
+    The KD-tree and the ``_entries`` it was built from are never mutated.
+    Saves and deletes seen by this process go to ``_overlay`` (None for a
+    delete), which is replaced rather than changed, so a query can use the
+    three without holding the lock. Queries skip overlay ids in the tree and
+    scan the overlay entries linearly instead. Once the overlay grows
+    past ARTISAN_INDEX_COMPACT_RATIO of the index, the tree is rebuilt in
+    the background from memory. Every ARTISAN_INDEX_REFRESH_SECONDS it is
+    rebuilt from the database, which picks up changes made by other worker
+    processes.
+
+    Memory budget: roughly 500 bytes per artisan (entry tuple and names, dict
+    slot, tree coordinates and id), so the default ARTISAN_INDEX_MAX_ENTRIES
+    of 200,000 stays around 100 MB. Over that limit the index refuses to
+    build and callers fall back to the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._tree = None
+        self._overlay = {}
+        self._pending = None
+        self.built_at = None
+        self.disabled_until = None
+
+    @property
+    def ready(self):
+        return self._tree is not None
+
+    @property
+    def disabled(self):
+        """True for ARTISAN_INDEX_REFRESH_SECONDS after a build refused to go over the size limit."""
+        return self.disabled_until is not None and time.monotonic() < self.disabled_until
+
+    def __len__(self):
+        with self._lock:
+            entries, overlay = self._entries, self._overlay
+        added = sum(1 for user_id, entry in overlay.items() if entry is not None and user_id not in entries)
+        removed = sum(1 for user_id, entry in overlay.items() if entry is None and user_id in entries)
+        return len(entries) + added - removed
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._tree = None
+            self._overlay = {}
+            self.built_at = None
+            self.disabled_until = None
+
+    def load_rows(self):
+        from users.models import User
+
+        return [
+            (user_id, first_name, last_name, float(lat), float(lon))
+            for user_id, first_name, last_name, lat, lon in User.objects.filter(
+                user_type=User.UserType.ARTISAN,
+                latitude__isnull=False,
+                longitude__isnull=False,
+            ).values_list(*ENTRY_FIELDS).iterator(chunk_size=5000)
+        ]
+
+    def build(self, rows=None):
+        with self._lock:
+            if self._pending is not None:
+                return False
+            self._pending = {}
+        try:
+            started = time.perf_counter()
+            if rows is None:
+                rows = self.load_rows()
+            if len(rows) > settings.ARTISAN_INDEX_MAX_ENTRIES:
+                logger.warning(
+                    "Artisan index disabled: %d artisans exceeds ARTISAN_INDEX_MAX_ENTRIES=%d",
+                    len(rows), settings.ARTISAN_INDEX_MAX_ENTRIES,
+                )
+                self.clear()
+                self.disabled_until = time.monotonic() + settings.ARTISAN_INDEX_REFRESH_SECONDS
+                return False
+            entries = {row[0]: row for row in rows}
+            tree = _KDTree(
+                list(entries),
+                _to_xyz_many([row[3] for row in entries.values()], [row[4] for row in entries.values()]),
+            )
+            with self._lock:
+                self._entries = entries
+                self._tree = tree
+                self._overlay = dict(self._pending)
+                self.built_at = time.monotonic()
+            logger.info(
+                "Artisan index built: %d entries in %.1f ms",
+                len(entries), (time.perf_counter() - started) * 1000,
+            )
+            return True
+        finally:
+            with self._lock:
+                self._pending = None
+
+    def rebuild_async(self, from_db=True):
+        with self._lock:
+            if self._pending is not None:
+                return
+            entries, overlay = self._entries, self._overlay
+        rows = None
+        if not from_db:
+            merged = dict(entries)
+            merged.update(overlay)
+            rows = [entry for entry in merged.values() if entry is not None]
+
+        def run():
+            try:
+                self.build(rows)
+            except Exception:
+                logger.exception("Artisan index rebuild failed")
+            finally:
+                connection.close()
+
+        threading.Thread(target=run, name='artisan-index-rebuild', daemon=True).start()
+
+    def upsert(self, user_id, first_name, last_name, latitude, longitude):
+        self._apply(user_id, (user_id, first_name, last_name, float(latitude), float(longitude)))
+
+    def remove(self, user_id):
+        self._apply(user_id, None)
+
+    def _apply(self, user_id, entry):
+        with self._lock:
+            if self._pending is not None:
+                self._pending[user_id] = entry
+            if self._tree is None:
+                return
+            self._overlay = {**self._overlay, user_id: entry}
+            compact = len(self._overlay) > max(256, len(self._entries) * settings.ARTISAN_INDEX_COMPACT_RATIO)
+        if compact:
+            self.rebuild_async(from_db=False)
+
+    def k_nearest(self, lat, lon, k, filters=None, max_distance_km=None):
+        with self._lock:
+            tree, entries, overlay = self._tree, self._entries, self._overlay
+        if tree is None:
+            raise RuntimeError("Artisan index is not built.")
+        if self.built_at and time.monotonic() - self.built_at > settings.ARTISAN_INDEX_REFRESH_SECONDS:
+            self.rebuild_async()
+
+        matches = self._matcher(filters)
+        target = _to_xyz(lat, lon)
+        max_chord_sq = 4.0 if max_distance_km is None else _km_to_chord_sq(max_distance_km)
+        found = tree.search(
+            target, k, max_chord_sq,
+            lambda user_id: user_id not in overlay and matches(entries.get(user_id)),
+        )
+        for entry in overlay.values():
+            if entry is None:
+                continue
+            x, y, z = _to_xyz(entry[3], entry[4])
+            dist_sq = (x - target[0]) ** 2 + (y - target[1]) ** 2 + (z - target[2]) ** 2
+            if dist_sq <= max_chord_sq and matches(entry):
+                found.append((dist_sq, entry[0]))
+
+        results = []
+        for dist_sq, user_id in heapq.nsmallest(k, found):
+            entry = overlay[user_id] if user_id in overlay else entries.get(user_id)
+            if entry is None:
+                continue
+            result = dict(zip(ENTRY_FIELDS, entry))
+            result['distance_km'] = _chord_sq_to_km(dist_sq)
+            results.append(result)
+        return results
+
+    def _matcher(self, filters):
+        if not filters:
+            return lambda entry: entry is not None
+        positions = [(ENTRY_FIELDS.index(field), value) for field, value in filters.items()]
+
+        def matches(entry):
+            if entry is None:
+                return False
+            for position, value in positions:
+                if isinstance(value, (set, frozenset, list, tuple)):
+                    if entry[position] not in value:
+                        return False
+                elif entry[position] != value:
+                    return False
+            return True
+
+        return matches
+
+
+artisan_index = ArtisanIndex()
+
+
+def get_artisan_index():
+    """
+    The shared index, or None while it is still being built in the
+    background or after it refused to build because there are too many
+    artisans; callers then use the database.
+    """
+    if artisan_index.ready:
+        return artisan_index
+    if not artisan_index.disabled:
+        artisan_index.rebuild_async()
+    return None
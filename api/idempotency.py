@@ -0,0 +1,128 @@
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+
+
+def _to_json(data):
+    return json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+
+
+def from_field(name):
+    """derive_key that uses one field of the request body."""
+    def derive(request):
+        data = request.data
+        return data.get(name) if hasattr(data, 'get') else None
+    return derive
+
+
+def purge_expired():
+    cutoff = timezone.now() - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
+
+
+def request_fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _replay(record):
+    return Response(record.response_body, status=record.response_status, headers={'Idempotent-Replayed': 'true'})
+
+
+def _claim(scope, key, fingerprint, check_body):
+    """
+    Returns (record, None) when this request owns the key, or (None, response)
+    when it must not run: a stored response to replay, or a conflict.
+    """
+    now = timezone.now()
+    record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+    if record is None:
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(scope=scope, key=key, request_hash=fingerprint), None
+        except IntegrityError:
+            record = IdempotencyKey.objects.get(scope=scope, key=key)
+
+    if record.created_at < now - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS):
+        expired = IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at)
+        if expired.update(request_hash=fingerprint, status='in_progress', created_at=now,
+                          response_status=None, response_body=None, completed_at=None):
+            record.refresh_from_db()
+            return record, None
+        record.refresh_from_db()
+    if check_body and record.request_hash != fingerprint:
+        return None, Response(
+            {"detail": f"{HEADER} was already used with a different request body."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if record.status == 'completed':
+        return None, _replay(record)
+    stale = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+    if record.created_at < stale and IdempotencyKey.objects.filter(
+        pk=record.pk, status='in_progress', created_at=record.created_at
+    ).update(created_at=now):
+        record.created_at = now
+        return record, None
+    return None, Response(
+        {"detail": "A request with this idempotency key is already in progress."},
+        status=status.HTTP_409_CONFLICT,
+    )
+
+
+def idempotent(scope, derive_key=None, check_body=True):
+    """
+    Make a view (function or APIView method) replay its first response for a
+    repeated request. The key is the client's Idempotency-Key header or, when
+    absent, ``derive_key(request)``; without either the view runs normally.
+    Keys are scoped per authenticated user. Only successful responses are
+    stored; errors and exceptions release the key so the client can retry.
+    With ``check_body`` a reused key with a different body is rejected.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            request = next(arg for arg in args if isinstance(arg, Request))
+            key = request.headers.get(HEADER)
+            if key:
+                if request.user and request.user.is_authenticated:
+                    key = f'{request.user.pk}:{key}'
+            elif derive_key is not None:
+                key = derive_key(request)
+                key = f'derived:{key}' if key else None
+            if not key:
+                return view(*args, **kwargs)
+
+            record, early = _claim(scope, key[:255], request_fingerprint(request), check_body)
+            if early is not None:
+                return early
+            try:
+                response = view(*args, **kwargs)
+            except Exception:
+                record.delete()
+                raise
+            if response.status_code >= 400:
+                record.delete()
+                return response
+            IdempotencyKey.objects.filter(pk=record.pk).update(
+                status='completed',
+                response_status=response.status_code,
+                response_body=_to_json(response.data),
+                completed_at=timezone.now(),
+            )
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,108 @@
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+_failure_handlers = {}
+
+
+def job_handler(kind, on_failure=None):
+    """
+    Register ``func(**payload)`` for jobs of ``kind``. ``on_failure(job)`` is
+    called once the job has used up its attempts.
+    """
+    def register(func):
+        _handlers[kind] = func
+        if on_failure is not None:
+            _failure_handlers[kind] = on_failure
+        return func
+    return register
+
+
+def enqueue(kind, payload=None, run_after=None, max_attempts=5):
+    return Job.objects.create(
+        kind=kind,
+        payload=payload or {},
+        run_after=run_after or timezone.now(),
+        max_attempts=max_attempts,
+    )
+
+
+def claim_jobs(limit, kinds=None):
+    now = timezone.now()
+    queryset = Job.objects.filter(status='queued', run_after__lte=now).order_by('run_after', 'id')
+    if kinds:
+        queryset = queryset.filter(kind__in=kinds)
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(queryset.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            Job.objects.filter(id__in=ids).update(status='running', locked_at=now, attempts=F('attempts') + 1)
+    else:
+        ids = [
+            job_id for job_id in queryset.values_list('id', flat=True)[:limit]
+            if Job.objects.filter(id=job_id, status='queued').update(
+                status='running', locked_at=now, attempts=F('attempts') + 1
+            )
+        ]
+    return list(Job.objects.filter(id__in=ids).order_by('run_after', 'id'))
+
+
+def requeue_stale_jobs():
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    return Job.objects.filter(status='running', locked_at__lt=cutoff).update(status='queued', locked_at=None)
+
+
+def run_job(job):
+    handler = _handlers.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job kind '{job.kind}'")
+        job.result = handler(**job.payload)
+        job.status = 'done'
+        job.last_error = None
+    except Exception as exc:
+        logger.exception("Job %s (%s) failed on attempt %s", job.id, job.kind, job.attempts)
+        job.last_error = str(exc)
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            backoff = min(2 ** job.attempts, 300)
+            job.run_after = timezone.now() + timedelta(seconds=backoff * random.uniform(0.5, 1.5))
+        else:
+            job.status = 'failed'
+            on_failure = _failure_handlers.get(job.kind)
+            if on_failure is not None:
+                try:
+                    on_failure(job)
+                except Exception:
+                    logger.exception("Failure handler for job %s (%s) raised", job.id, job.kind)
+    job.locked_at = None
+    job.save(update_fields=['status', 'result', 'last_error', 'run_after', 'locked_at', 'updated_at'])
+    return job
+
+
+def _run_in_thread(job):
+    try:
+        return run_job(job)
+    finally:
+        connection.close()
+
+
+def work(batch_size=50, workers=1, kinds=None):
+    jobs = claim_jobs(batch_size, kinds)
+    if workers <= 1:
+        for job in jobs:
+            run_job(job)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_run_in_thread, jobs))
+    return len(jobs)
@@ -0,0 +1,120 @@
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+
+from payments.models import AccountBalance, BalanceSnapshot, LedgerEntry
+
+logger = logging.getLogger(__name__)
+
+PLATFORM_FLOAT = 'platform:float'
+UNASSIGNED = 'unassigned'
+DEPOSIT_STATUSES = {'held'}
+WITHDRAWAL_STATUSES = {'released', 'refunded'}
+
+
+def escrow_account(artisan_id):
+    return f'escrow:artisan:{artisan_id or UNASSIGNED}'
+
+
+def record_transitions(payments):
+    """
+    Write ledger entries for payments whose status has just changed and
+    apply them to the running balances. A payment entering ``held`` is
+    deposited into its artisan's escrow account from the platform float; one
+    leaving escrow as released or refunded is withdrawn again. Payments that
+    are already deposited (or withdrawn, or never deposited) are skipped, so
+    replays and repeated calls are harmless. Call inside the transaction
+    that changes the status.
+    """
+    payments = [payment for payment in payments if payment.status in DEPOSIT_STATUSES | WITHDRAWAL_STATUSES]
+    if not payments:
+        return []
+    existing = set(LedgerEntry.objects.filter(payment__in=payments).values_list('payment_id', 'kind'))
+    now = timezone.now()
+    entries = []
+    for payment in payments:
+        escrow = escrow_account(payment.artisan_id_id)
+        if payment.status in DEPOSIT_STATUSES and (payment.pk, 'deposit') not in existing:
+            entries.append(LedgerEntry(
+                payment=payment, kind='deposit', transition=payment.status,
+                debit_account=PLATFORM_FLOAT, credit_account=escrow, amount=payment.amount, created_at=now,
+            ))
+        elif (
+            payment.status in WITHDRAWAL_STATUSES
+            and (payment.pk, 'deposit') in existing
+            and (payment.pk, 'withdrawal') not in existing
+        ):
+            entries.append(LedgerEntry(
+                payment=payment, kind='withdrawal', transition=payment.status,
+                debit_account=escrow, credit_account=PLATFORM_FLOAT, amount=payment.amount, created_at=now,
+            ))
+    if entries:
+        with transaction.atomic():
+            LedgerEntry.objects.bulk_create(entries)
+            apply_to_balances(entries)
+    return entries
+
+
+def apply_to_balances(entries):
+    deltas = defaultdict(Decimal)
+    for entry in entries:
+        deltas[entry.debit_account] += entry.amount
+        deltas[entry.credit_account] -= entry.amount
+    AccountBalance.objects.bulk_create(
+        [AccountBalance(account=account) for account in deltas], ignore_conflicts=True
+    )
+    # Sorted so concurrent writers always lock balance rows in the same order.
+    for account in sorted(deltas):
+        AccountBalance.objects.filter(account=account).update(
+            balance=F('balance') + deltas[account], updated_at=timezone.now()
+        )
+
+
+def balance(account):
+    row = AccountBalance.objects.filter(account=account).values_list('balance', flat=True).first()
+    return row if row is not None else Decimal('0.00')
+
+
+def held_for_artisan(artisan_id):
+    """Amount held in escrow for one artisan (a single primary-key lookup)."""
+    return -balance(escrow_account(artisan_id))
+
+
+def platform_float():
+    """Total buyer money the platform is holding for artisans."""
+    return balance(PLATFORM_FLOAT)
+
+
+def take_snapshot():
+    """Copy every running balance into BalanceSnapshot, tagged with the last ledger entry it covers."""
+    with transaction.atomic():
+        last_entry_id = LedgerEntry.objects.aggregate(last=Max('id'))['last'] or 0
+        now = timezone.now()
+        snapshots = [
+            BalanceSnapshot(account=account, balance=amount, last_entry_id=last_entry_id, taken_at=now)
+            for account, amount in AccountBalance.objects.values_list('account', 'balance')
+        ]
+        BalanceSnapshot.objects.bulk_create(snapshots)
+    return len(snapshots)
+
+
+def ledger_drift():
+    """
+    Accounts whose running balance disagrees with the sum of their ledger
+    entries. Empty when the ledger is consistent.
+    """
+    totals = defaultdict(Decimal)
+    for account, amount in LedgerEntry.objects.values_list('debit_account').annotate(total=Sum('amount')):
+        totals[account] += amount
+    for account, amount in LedgerEntry.objects.values_list('credit_account').annotate(total=Sum('amount')):
+        totals[account] -= amount
+    running = dict(AccountBalance.objects.values_list('account', 'balance'))
+    return {
+        account: {'running': running.get(account, Decimal('0.00')), 'ledger': totals.get(account, Decimal('0.00'))}
+        for account in set(totals) | set(running)
+        if running.get(account, Decimal('0.00')) != totals.get(account, Decimal('0.00'))
+    }
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from api.archive import archive_cutoff, archive_orders, archive_payments
+
+
+class Command(BaseCommand):
+    help = (
+        "Move settled payments and completed or rejected orders older than "
+        "--months (default ARCHIVE_AFTER_MONTHS) into the archive tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=None)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options['months'])
+        payments = archive_payments(cutoff, options['batch_size'])
+        orders = archive_orders(cutoff, options['batch_size'])
+        self.stdout.write(f"Archived {payments} payments and {orders} orders older than {cutoff:%Y-%m-%d}")
@@ -0,0 +1,95 @@
+import math
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.nearby import load_candidates
+from api.utils import KM_PER_DEGREE, geohash_encode, within_radius
+from users.models import User
+
+NAIROBI = (-1.286389, 36.817223)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the nearby-artisan candidate query at growing table sizes. "
+        "Artisans are spread at a constant density so every search sees a similar "
+        "number of candidates; flat latency across sizes means the index is doing "
+        "the work. All rows are rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000,1000000',
+                            help='Comma separated artisan counts')
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--radius', type=float, default=10.0)
+        parser.add_argument('--density', type=float, default=1.0, help='Artisans per square km')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        rng = random.Random(options['seed'])
+        self.stdout.write(f"{'artisans':>10} {'median ms':>10} {'p95 ms':>10} {'candidates':>11} {'matches':>8}")
+        with transaction.atomic():
+            created = 0
+            for size in sizes:
+                half_side_km = math.sqrt(size / options['density']) / 2
+                self.seed(created, size, half_side_km, rng, options['batch_size'])
+                created = size
+                self.report(size, half_side_km, rng, options['queries'], options['radius'])
+            transaction.set_rollback(True)
+
+    def seed(self, start, stop, half_side_km, rng, batch_size):
+        # Rows already created at a smaller size keep their positions; the
+        # new ones fill the larger area so density stays roughly constant.
+        batch = []
+        for i in range(start, stop):
+            lat, lon = self.random_point(half_side_km, rng)
+            batch.append(User(
+                user_type=User.UserType.ARTISAN,
+                email=f'bench-artisan-{i}@example.com',
+                phone_number=f'9{i:09d}',
+                national_id=f'{i:010d}',
+                password='!',
+                latitude=round(lat, 6),
+                longitude=round(lon, 6),
+                geohash=geohash_encode(lat, lon),
+            ))
+            if len(batch) >= batch_size:
+                User.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            User.objects.bulk_create(batch)
+
+    def random_point(self, half_side_km, rng):
+        d_lat = half_side_km / KM_PER_DEGREE
+        d_lon = half_side_km / (KM_PER_DEGREE * math.cos(math.radians(NAIROBI[0])))
+        return (
+            NAIROBI[0] + rng.uniform(-d_lat, d_lat),
+            NAIROBI[1] + rng.uniform(-d_lon, d_lon),
+        )
+
+    def report(self, size, half_side_km, rng, queries, radius):
+        timings = []
+        candidates = []
+        matches = []
+        for _ in range(queries):
+            lat, lon = self.random_point(half_side_km, rng)
+            started = time.perf_counter()
+            rows = load_candidates(lat, lon, radius)
+            timings.append((time.perf_counter() - started) * 1000)
+            candidates.append(len(rows))
+            indices, _ = within_radius(
+                lat, lon, [row['latitude'] for row in rows], [row['longitude'] for row in rows], radius,
+            )
+            matches.append(len(indices))
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f"{size:>10} {statistics.median(timings):>10.2f} {p95:>10.2f} "
+            f"{statistics.mean(candidates):>11.1f} {statistics.mean(matches):>8.1f}"
+        )
@@ -0,0 +1,61 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from api.simulator import DarajaSimulator, SimulatorConfig
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local Daraja simulator for load and soak tests. Point the app at it "
+        "with DARAJA_BASE_URL=http://127.0.0.1:8090 and it answers OAuth, STK push, "
+        "B2C and STK query calls, then posts the result callbacks back to the app."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8090)
+        parser.add_argument('--latency-ms', type=float, default=150, help='Mean response latency')
+        parser.add_argument('--jitter-ms', type=float, default=50)
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of calls answered with 503')
+        parser.add_argument('--decline-rate', type=float, default=0.0, help='Fraction of STK pushes the buyer cancels')
+        parser.add_argument('--callback-delay', type=float, default=1.0, help='Seconds before a callback is sent')
+        parser.add_argument('--stk-callback-url', default=None, help='Send STK callbacks here instead of CallBackURL')
+        parser.add_argument('--b2c-result-url', default=None, help='Send B2C results here instead of ResultURL')
+        parser.add_argument('--drop-callback-rate', type=float, default=0.0, help='Fraction of callbacks never sent')
+        parser.add_argument('--callback-workers', type=int, default=8)
+        parser.add_argument('--result-ttl', type=float, default=600, help='Seconds an STK result stays queryable')
+        parser.add_argument('--stats-interval', type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        config = SimulatorConfig(
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            error_rate=options['error_rate'],
+            decline_rate=options['decline_rate'],
+            callback_delay=options['callback_delay'],
+            stk_callback_url=options['stk_callback_url'],
+            b2c_result_url=options['b2c_result_url'],
+            callback_workers=options['callback_workers'],
+            drop_callback_rate=options['drop_callback_rate'],
+            result_ttl=options['result_ttl'],
+        )
+        server = DarajaSimulator((options['host'], options['port']), config)
+        stop = threading.Event()
+        threading.Thread(target=self.report, args=(server, options['stats_interval'], stop), daemon=True).start()
+        self.stdout.write(f"Daraja simulator listening on {server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            server.server_close()
+            self.stdout.write(self.format_stats(server.stats))
+
+    def report(self, server, interval, stop):
+        while not stop.wait(interval):
+            self.stdout.write(self.format_stats(server.stats))
+
+    def format_stats(self, stats):
+        return " ".join(f"{name}={value}" for name, value in stats.items())
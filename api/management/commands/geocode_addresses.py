@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from api.geocoding import NOT_CACHED, cached_location, get_geocoder, normalize_address, store_location
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Geocode every user that has an address but no coordinates. Each distinct "
+        "normalized address is resolved once: from the geocoding cache when fresh, "
+        "otherwise through concurrent backend lookups limited to GEOCODER_RATE_PER_SECOND."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--limit', type=int, default=None, help='Maximum number of users to process')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(latitude__isnull=True, address__isnull=False).exclude(address='')
+        users = users.values_list('pk', 'address')
+        if options['limit']:
+            users = users[:options['limit']]
+        by_address = {}
+        for pk, address in users:
+            normalized = normalize_address(address)
+            if normalized:
+                by_address.setdefault(normalized, []).append(pk)
+        if not by_address:
+            self.stdout.write("Nothing to geocode.")
+            return
+
+        locations = {}
+        to_lookup = []
+        for address in by_address:
+            location = cached_location(address)
+            if location is NOT_CACHED:
+                to_lookup.append(address)
+            else:
+                locations[address] = location
+
+        geocoder = get_geocoder()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(geocoder.geocode, address): address for address in to_lookup}
+            for future in as_completed(futures):
+                address = futures[future]
+                try:
+                    locations[address] = store_location(address, future.result())
+                except Exception as exc:
+                    self.stderr.write(f"Failed to geocode '{address}': {exc}")
+
+        located = 0
+        for address, location in locations.items():
+            if location is None:
+                continue
+            for user in User.objects.filter(pk__in=by_address[address]):
+                user.latitude, user.longitude = location
+                user.save(update_fields=['latitude', 'longitude'])
+                located += 1
+        self.stdout.write(
+            f"Located {located} users from {len(by_address)} distinct addresses "
+            f"({len(to_lookup)} looked up, {len(by_address) - len(to_lookup)} from cache)."
+        )
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+
+from api.callbacks import process_callbacks, replay_callbacks, requeue_stale_callbacks
+from payments.models import DarajaCallback
+
+
+class Command(BaseCommand):
+    help = "Apply Daraja callbacks from the inbox in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the inbox is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the inbox once and exit')
+        parser.add_argument(
+            '--replay-since', default=None,
+            help='Queue callbacks received at or after this ISO timestamp to be applied again first',
+        )
+
+    def handle(self, *args, **options):
+        if options['replay_since']:
+            since = parse_datetime(options['replay_since'])
+            if since is None:
+                self.stderr.write("--replay-since must be an ISO 8601 timestamp")
+                return
+            replayed = replay_callbacks(DarajaCallback.objects.filter(received_at__gte=since))
+            self.stdout.write(f"Queued {replayed} callbacks for replay")
+        while True:
+            requeue_stale_callbacks()
+            processed = process_callbacks(options['batch_size'])
+            if processed:
+                self.stdout.write(f"Processed {processed} callbacks")
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['sleep'])
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.metrics import rebuild_metrics
+
+
+class Command(BaseCommand):
+    help = "Recompute artisan performance metrics from orders and ratings and fix any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Only report drifted profiles; exit non-zero if there are any')
+
+    def handle(self, *args, **options):
+        drift = rebuild_metrics(dry_run=options['verify'])
+        for artisan_id, differences in sorted(drift.items()):
+            details = ', '.join(f"{field}: {stored} -> {expected}" for field, (stored, expected) in differences.items())
+            self.stderr.write(f"artisan {artisan_id}: {details}")
+        if options['verify'] and drift:
+            raise CommandError(f"{len(drift)} artisan profiles disagree with their orders and ratings")
+        self.stdout.write(f"{'Found' if options['verify'] else 'Rebuilt'} {len(drift)} drifted artisan profiles")
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.callbacks import process_callbacks
+from api.reconcile import reconcile_metrics, reconcile_pending
+
+
+class Command(BaseCommand):
+    help = "Query Daraja for pending payments whose STK callback never arrived and apply the results."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Concurrent STK queries (default: STK_QUERY_WORKERS)')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--sleep', type=float, default=15.0, help='Seconds to wait when nothing is stale')
+        parser.add_argument('--once', action='store_true', help='Reconcile the current backlog once and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            queried = reconcile_pending(options['batch_size'], options['workers'])
+            if queried:
+                while process_callbacks():
+                    pass
+                metrics = reconcile_metrics()
+                self.stdout.write(f"Queried {queried} payments; " + " ".join(
+                    f"{name}={value}" for name, value in metrics.items()
+                ))
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['sleep'])
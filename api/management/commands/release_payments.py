@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from api.payouts import due_for_release, release_due_payments
+
+
+class Command(BaseCommand):
+    help = "Pay out held payments whose delivery was not confirmed within 24 hours."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Concurrent payouts (default: PAYOUT_WORKERS)')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--limit', type=int, default=None, help='Release at most this many payments')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many payments are due')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(f"{due_for_release().count()} payments due for release")
+            return
+        released = release_due_payments(options['workers'], options['batch_size'], options['limit'])
+        self.stdout.write(f"Released {released} payments")
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.jobs import requeue_stale_jobs, work
+
+
+class Command(BaseCommand):
+    help = "Process queued background jobs from the database queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--kinds', default='', help='Comma separated job kinds to process (default: all)')
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+
+    def handle(self, *args, **options):
+        kinds = [kind for kind in options['kinds'].split(',') if kind]
+        while True:
+            requeue_stale_jobs()
+            processed = work(options['batch_size'], options['workers'], kinds)
+            if processed:
+                self.stdout.write(f"Processed {processed} jobs")
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['sleep'])
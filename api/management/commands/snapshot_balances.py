@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.ledger import ledger_drift, take_snapshot
+
+
+class Command(BaseCommand):
+    help = "Snapshot the running escrow balances. Schedule it (e.g. hourly) from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='First check the running balances against the full ledger')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            drift = ledger_drift()
+            if drift:
+                for account, values in sorted(drift.items()):
+                    self.stderr.write(f"{account}: running={values['running']} ledger={values['ledger']}")
+                raise CommandError(f"{len(drift)} accounts disagree with the ledger; not taking a snapshot")
+        self.stdout.write(f"Snapshotted {take_snapshot()} account balances")
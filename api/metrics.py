@@ -0,0 +1,157 @@
+from datetime import datetime, time
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import Case, Count, DecimalField, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Greatest, NullIf, Round
+from django.utils import timezone
+
+from orders.models import ArchivedOrder, Order, Rating
+from users.models import ArtisanProfile, current_week_start
+
+FINAL_STATUSES = ('completed', 'rejected')
+METRIC_FIELDS = (
+    'total_orders', 'completed_orders', 'rejected_orders', 'fulfillment_rate', 'rejection_rate',
+    'rating_count', 'rating_total', 'average_rating', 'weekly_order_count', 'week_start',
+)
+
+
+def _count(field, delta):
+    return Greatest(F(field) + delta, Value(0))
+
+
+def _ratio(part, whole, places, max_digits):
+    ratio = Cast(part, FloatField()) / NullIf(whole, Value(0))
+    return Cast(Coalesce(Round(ratio, places), Value(0.0)), DecimalField(max_digits=max_digits, decimal_places=places))
+
+
+def _order_changes(total=0, completed=0, rejected=0):
+    total_orders = _count('total_orders', total)
+    completed_orders = _count('completed_orders', completed)
+    rejected_orders = _count('rejected_orders', rejected)
+    return {
+        'total_orders': total_orders,
+        'completed_orders': completed_orders,
+        'rejected_orders': rejected_orders,
+        'fulfillment_rate': _ratio(completed_orders * 100, total_orders, 2, 5),
+        'rejection_rate': _ratio(rejected_orders * 100, total_orders, 2, 5),
+    }
+
+
+def _refresh_verification(profiles):
+    profiles.update_verification()
+
+
+def order_created(artisan_id, status):
+    """Count a new order; also this week's order count, which restarts each Monday."""
+    week_start = current_week_start()
+    changes = _order_changes(1, int(status == 'completed'), int(status == 'rejected'))
+    ArtisanProfile.objects.filter(user_id=artisan_id).update(
+        weekly_order_count=Case(When(week_start=week_start, then=F('weekly_order_count') + 1), default=Value(1)),
+        week_start=week_start,
+        **changes,
+    )
+
+
+def order_status_changed(artisan_id, old, new):
+    completed = int(new == 'completed') - int(old == 'completed')
+    rejected = int(new == 'rejected') - int(old == 'rejected')
+    if not completed and not rejected:
+        return
+    profiles = ArtisanProfile.objects.filter(user_id=artisan_id)
+    profiles.update(**_order_changes(0, completed, rejected))
+    _refresh_verification(profiles)
+
+
+def rating_changed(order_id, count, total):
+    if not count and not total:
+        return
+    rating_count = _count('rating_count', count)
+    rating_total = _count('rating_total', total)
+    profiles = ArtisanProfile.objects.filter(user_id__in=Order.objects.filter(pk=order_id).values('artisan_id'))
+    profiles.update(
+        rating_count=rating_count,
+        rating_total=rating_total,
+        average_rating=_ratio(rating_total, rating_count, 1, 3),
+    )
+    _refresh_verification(profiles)
+
+
+def _percent(part, whole, places):
+    exponent = Decimal(10) ** -places
+    if not whole:
+        return Decimal(0).quantize(exponent)
+    return (Decimal(part) / whole).quantize(exponent, ROUND_HALF_UP)
+
+
+def _metrics(total=0, completed=0, rejected=0, weekly=0, rating_count=0, rating_total=0):
+    return {
+        'total_orders': total,
+        'completed_orders': completed,
+        'rejected_orders': rejected,
+        'fulfillment_rate': _percent(completed * 100, total, 2),
+        'rejection_rate': _percent(rejected * 100, total, 2),
+        'rating_count': rating_count,
+        'rating_total': rating_total,
+        'average_rating': _percent(rating_total, rating_count, 1),
+        'weekly_order_count': weekly,
+    }
+
+
+def expected_metrics():
+    """
+    Every artisan's metrics recomputed from scratch: one grouped aggregate
+    over live orders, one over archived orders and one over ratings.
+    """
+    week_began = timezone.make_aware(datetime.combine(current_week_start(), time.min))
+    counts = {}
+    for model in (Order, ArchivedOrder):
+        rows = model.objects.values_list('artisan_id').annotate(
+            total=Count('pk'),
+            completed=Count('pk', filter=Q(status='completed')),
+            rejected=Count('pk', filter=Q(status='rejected')),
+            weekly=Count('pk', filter=Q(created_at__gte=week_began)),
+        )
+        for artisan_id, *values in rows:
+            counts[artisan_id] = [a + b for a, b in zip(counts.get(artisan_id, (0, 0, 0, 0)), values)]
+    ratings = {
+        artisan_id: (count, total)
+        for artisan_id, count, total in Rating.objects.values_list('order_id__artisan_id').annotate(
+            count=Count('pk'), total=Sum('rating'),
+        )
+    }
+    return {
+        artisan_id: _metrics(*counts.get(artisan_id, (0, 0, 0, 0)), *ratings.get(artisan_id, (0, 0)))
+        for artisan_id in set(counts) | set(ratings)
+    }
+
+
+def rebuild_metrics(dry_run=False):
+    """
+    Compare every artisan profile with ``expected_metrics()`` and, unless
+    ``dry_run``, write back the ones that drifted. Returns
+    ``{artisan_id: {field: (stored, expected)}}`` for the drifted profiles.
+    A weekly count left over from an earlier week reads as zero.
+    """
+    expected = expected_metrics()
+    week_start = current_week_start()
+    drift = {}
+    changed = []
+    for profile in ArtisanProfile.objects.all():
+        values = expected.get(profile.user_id) or _metrics()
+        stored = {field: getattr(profile, field) for field in values}
+        if profile.week_start != week_start:
+            stored['weekly_order_count'] = 0
+        differences = {field: (stored[field], value) for field, value in values.items() if stored[field] != value}
+        if not differences:
+            continue
+        drift[profile.user_id] = differences
+        for field, value in values.items():
+            setattr(profile, field, value)
+        profile.week_start = week_start
+        changed.append(profile)
+    if changed and not dry_run:
+        ArtisanProfile.objects.bulk_update(changed, METRIC_FIELDS, batch_size=500)
+        ids = [profile.pk for profile in changed]
+        for start in range(0, len(ids), 500):
+            _refresh_verification(ArtisanProfile.objects.filter(pk__in=ids[start:start + 500]))
+    return drift
@@ -1,3 +1,67 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
\ No newline at end of file
+
+class Job(models.Model):
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='api_job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f'Job {self.id} {self.kind} - Status: {self.status}'
+
+
+class GeocodedAddress(models.Model):
+    normalized_address = models.CharField(max_length=255, unique=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    geocoded_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.normalized_address} ({self.latitude}, {self.longitude})'
+
+
+class IdempotencyKey(models.Model):
+    """
+    One row per (scope, key). The unique constraint doubles as the lock that
+    keeps concurrent duplicates from both running.
+    """
+    STATUS_CHOICES = (
+        ('in_progress', 'In progress'),
+        ('completed', 'Completed'),
+    )
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='in_progress')
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='api_idempotency_scope_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.scope}:{self.key} - {self.status}'
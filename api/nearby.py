@@ -0,0 +1,141 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from users.models import User, ArtisanPortfolio
+from .utils import BOUNDING_BOX_PAD, KM_PER_DEGREE, bounding_box, within_radius
+
+RADIUS_BUCKETS_KM = (1, 2, 5, 10, 25, 50, 100)
+REGION_DEGREES = 1.0
+CANDIDATE_FIELDS = ('user_id', 'first_name', 'last_name', 'latitude', 'longitude')
+STATS_KEYS = {'hits': 'nearby:stats:hits', 'misses': 'nearby:stats:misses'}
+
+
+def load_candidates(lat, lon, radius_km):
+    return list(
+        User.objects.near(lat, lon, radius_km).filter(
+            user_type=User.UserType.ARTISAN,
+            latitude__isnull=False,
+            longitude__isnull=False,
+        ).values(*CANDIDATE_FIELDS)
+    )
+
+
+def load_portfolios(artisan_ids):
+    portfolios = {}
+    rows = ArtisanPortfolio.objects.filter(artisan_id__in=artisan_ids).values(
+        'artisan_id', 'title', 'description', 'image_urls'
+    )
+    for portfolio in rows:
+        portfolios.setdefault(portfolio.pop('artisan_id'), []).append(portfolio)
+    return portfolios
+
+
+def tile_for(lat, lon):
+    size = settings.NEARBY_CACHE_TILE_DEGREES
+    return math.floor(float(lat) / size), math.floor(float(lon) / size)
+
+
+def radius_bucket(radius_km):
+    for bucket in RADIUS_BUCKETS_KM:
+        if radius_km <= bucket:
+            return bucket
+    return None
+
+
+def _region_keys(south, west, north, east):
+    if west > east:
+        lon_ranges = [(west, 180.0), (-180.0, east)]
+    else:
+        lon_ranges = [(west, east)]
+    keys = []
+    for row in range(math.floor(south / REGION_DEGREES), math.floor(north / REGION_DEGREES) + 1):
+        for w, e in lon_ranges:
+            for col in range(math.floor(w / REGION_DEGREES), math.floor(e / REGION_DEGREES) + 1):
+                keys.append(f'nearby:region:{row}:{col}')
+    return keys
+
+
+def _region_versions(keys):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return tuple(versions[key] for key in keys)
+
+
+def _record(outcome):
+    key = STATS_KEYS[outcome]
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def cache_is_shared():
+    """
+    False for a process-local cache, where invalidate_location() would only
+    reach the worker that saw the change and others would serve stale rows.
+    """
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def cached_candidates(lat, lon, radius_km):
+    """
+    Candidate artisans, with portfolios, for a search from any point in the
+    caller's tile with any radius up to the caller's radius bucket. Callers
+    re-rank the rows against their exact coordinates. Returns None when the
+    radius is too large to cache or the cache is not shared between workers.
+
+    Keys embed the versions of the coarse regions the tile's search area
+    touches, so invalidate_location() only has to bump one region version.
+    """
+    bucket = radius_bucket(radius_km)
+    if bucket is None or not cache_is_shared():
+        return None
+    size = settings.NEARBY_CACHE_TILE_DEGREES
+    row, col = tile_for(lat, lon)
+    center_lat, center_lon = (row + 0.5) * size, (col + 0.5) * size
+    half_diagonal_km = KM_PER_DEGREE * BOUNDING_BOX_PAD * size * math.sqrt(2) / 2
+    search_km = bucket + half_diagonal_km
+    versions = _region_versions(_region_keys(*bounding_box(center_lat, center_lon, search_km)))
+    key = f'nearby:tile:{row}:{col}:{bucket}:{hash(versions)}'
+
+    candidates = cache.get(key)
+    if candidates is not None:
+        _record('hits')
+        return candidates
+    _record('misses')
+    candidates = load_candidates(center_lat, center_lon, search_km)
+    indices, _ = within_radius(
+        center_lat, center_lon,
+        [artisan['latitude'] for artisan in candidates],
+        [artisan['longitude'] for artisan in candidates],
+        search_km,
+    )
+    candidates = [candidates[index] for index in indices]
+    portfolios = load_portfolios([artisan['user_id'] for artisan in candidates])
+    for artisan in candidates:
+        artisan['portfolio'] = portfolios.get(artisan['user_id'], [])
+    cache.set(key, candidates, settings.NEARBY_CACHE_TIMEOUT)
+    return candidates
+
+
+def invalidate_location(lat, lon):
+    if lat is None or lon is None:
+        return
+    for key in _region_keys(float(lat), float(lon), float(lat), float(lon)):
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def cache_stats():
+    values = cache.get_many(list(STATS_KEYS.values()))
+    stats = {name: values.get(key, 0) for name, key in STATS_KEYS.items()}
+    total = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / total, 4) if total else None
+    return stats
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, topic, state=None, queue=None):
+        self.topic = topic
+        self.state = state
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue() if queue is None else queue
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class NotificationHub:
+    """
+    In-process fan-out of change notifications to waiting async views.
+
+    Topics are ``(kind, key)`` pairs. Changes made in this process can be
+    published directly. Changes made by other processes (callback workers,
+    other web workers) are picked up by one watcher task per kind and event
+    loop, which checks the state of every watched key in a single query each
+    NOTIFICATION_POLL_SECONDS, however many clients are waiting on it.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._subscribers = defaultdict(set)
+        self._fetchers = {}
+        self._watchers = {}
+
+    def register(self, kind, fetch):
+        """``fetch(keys)`` returns ``{key: state}``; a changed state is published."""
+        self._fetchers[kind] = fetch
+
+    def subscribe(self, kind, key, state=None, queue=None):
+        """
+        ``state`` is what the caller has already seen; only different states
+        are delivered. Subscriptions sharing a ``queue`` let one client wait
+        on several keys at once.
+        """
+        subscription = Subscription((kind, key), state, queue)
+        with self._lock:
+            self._subscribers[subscription.topic].add(subscription)
+            watcher = self._watchers.get((kind, subscription.loop))
+            if kind in self._fetchers and (watcher is None or watcher.done()):
+                self._watchers[(kind, subscription.loop)] = subscription.loop.create_task(
+                    self._watch(kind, subscription.loop)
+                )
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.topic]
+
+    def publish(self, kind, key, state):
+        """Thread-safe: may be called from sync code or any event loop."""
+        delivered = []
+        with self._lock:
+            for subscription in self._subscribers.get((kind, key), ()):
+                if subscription.state != state:
+                    subscription.state = state
+                    delivered.append(subscription)
+        for subscription in delivered:
+            subscription.loop.call_soon_threadsafe(subscription.queue.put_nowait, state)
+        return len(delivered)
+
+    def is_watched(self, kind, key):
+        with self._lock:
+            return bool(self._subscribers.get((kind, key)))
+
+    def watched_keys(self, kind, loop=None):
+        with self._lock:
+            return {
+                key for (topic_kind, key), subscribers in self._subscribers.items()
+                if topic_kind == kind and any(loop is None or s.loop is loop for s in subscribers)
+            }
+
+    async def _watch(self, kind, loop):
+        fetch = sync_to_async(self._fetchers[kind])
+        while True:
+            await asyncio.sleep(settings.NOTIFICATION_POLL_SECONDS)
+            keys = self.watched_keys(kind, loop)
+            if not keys:
+                with self._lock:
+                    if not self.watched_keys(kind, loop):
+                        self._watchers.pop((kind, loop), None)
+                        return
+                continue
+            try:
+                current = await fetch(keys)
+            except Exception:
+                logger.exception("Notification watcher for %s failed", kind)
+                continue
+            for key, state in current.items():
+                self.publish(kind, key, state)
+
+
+hub = NotificationHub()
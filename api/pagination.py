@@ -0,0 +1,28 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OrderCursorPagination(CursorPagination):
+    """
+    Keyset pagination, newest first. Each page is an index range scan on
+    (buyer_id, created_at) or (artisan_id, status, created_at) however deep
+    the client pages, unlike OFFSET.
+    """
+    ordering = '-created_at'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class TrackingCursorPagination(CursorPagination):
+    """Oldest first, so a timeline reads top to bottom; served by (order_id, created_at)."""
+    ordering = 'created_at'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class RatingCursorPagination(CursorPagination):
+    ordering = '-created_at'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
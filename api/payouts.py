@@ -0,0 +1,153 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from payments.models import Payment
+from . import transitions
+from .callbacks import replay_orphaned_b2c_results
+from .daraja import DarajaAPI, DarajaUnavailable
+from .jobs import enqueue
+from .utils import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+AUTO_RELEASE_AFTER = timedelta(hours=24)
+_rate_limiter = None
+
+
+def get_rate_limiter():
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter(settings.PAYOUT_RATE_PER_SECOND, burst=settings.PAYOUT_WORKERS)
+    return _rate_limiter
+
+
+def due_for_release(now=None):
+    """Held payments older than 24 hours whose delivery was never confirmed."""
+    cutoff = (now or timezone.now()) - AUTO_RELEASE_AFTER
+    return Payment.objects.filter(
+        status='held',
+        paid_at__lte=cutoff,
+        order_id__delivery_confirmed=False,
+    )
+
+
+class PayoutRejected(Exception):
+    pass
+
+
+def claim_for_release(payment_id):
+    """
+    Move a held payment to releasing. The conditional update is the
+    per-payment lock: only the caller whose update matched a row may send
+    the payout, so a payment is never paid twice.
+    """
+    return bool(transitions.payments.apply('claim_release', {'pk': payment_id}))
+
+
+def send_payout(payment_id, transaction_desc):
+    """
+    Send the B2C request for a releasing payment and store its
+    ConversationID. The payment stays releasing until the B2C result or
+    timeout callback settles it.
+    """
+    payment = Payment.objects.only('id', 'artisan_phone', 'amount', 'transaction_code').get(pk=payment_id)
+    get_rate_limiter().acquire()
+    response = DarajaAPI().b2c_payment(
+        artisan_phone=payment.artisan_phone,
+        amount=payment.amount,
+        transaction_id=payment.transaction_code,
+        transaction_desc=transaction_desc,
+    )
+    conversation_id = response.get('ConversationID')
+    if not conversation_id:
+        raise PayoutRejected(str(response.get('errorMessage') or response.get('ResponseDescription')))
+    Payment.objects.filter(pk=payment_id, status='releasing').update(b2c_conversation_id=conversation_id)
+    replay_orphaned_b2c_results(conversation_id)
+    return conversation_id
+
+
+def payout_never_sent(exc):
+    """
+    True when a failed payout certainly moved no money: the breaker was
+    open, the connection was never made, or Daraja turned the request down
+    (no ConversationID, or a 4xx answer).
+    """
+    if isinstance(exc, (DarajaUnavailable, requests.ConnectTimeout, PayoutRejected)):
+        return True
+    response = getattr(exc, 'response', None)
+    return isinstance(exc, requests.HTTPError) and response is not None and 400 <= response.status_code < 500
+
+
+def release_payment(payment_id, transaction_desc="Auto-release after 24hr"):
+    """
+    Claim and pay out one held payment. Only a payout that certainly never
+    reached Daraja goes back to held for the next run; any other failure
+    leaves it releasing for the B2C result or reconciliation to settle, as
+    sending it again could pay the artisan twice.
+    """
+    if not claim_for_release(payment_id):
+        return False
+    try:
+        send_payout(payment_id, transaction_desc)
+    except Exception as exc:
+        logger.exception("Payout for payment %s failed", payment_id)
+        if payout_never_sent(exc):
+            transitions.payments.apply('return_to_held', {'pk': payment_id})
+        return False
+    return True
+
+
+def retry_failed_payouts(payment_ids):
+    """
+    Send ``payout_failed`` payments back to releasing and queue their payout
+    again; returns how many were queued. Their money never left escrow.
+    """
+    queued = 0
+    for payment_id in payment_ids:
+        with transaction.atomic():
+            if transitions.payments.apply('retry_payout', {'pk': payment_id}):
+                enqueue('b2c_payout', {'payment_id': payment_id, 'transaction_desc': "Payout retry"})
+                queued += 1
+    return queued
+
+
+def _release_in_thread(payment_id):
+    try:
+        return release_payment(payment_id)
+    finally:
+        connection.close()
+
+
+def release_due_payments(workers=None, batch_size=500, limit=None, now=None):
+    """
+    Pay out every payment due_for_release() through a pool of ``workers``
+    threads, reading ids in keyset-paginated batches. Returns the number of
+    payouts Daraja accepted.
+    """
+    workers = workers or settings.PAYOUT_WORKERS
+    due = due_for_release(now).order_by('id').values_list('id', flat=True)
+    released = 0
+    seen = 0
+    last_id = 0
+    pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        while limit is None or seen < limit:
+            size = batch_size if limit is None else min(batch_size, limit - seen)
+            ids = list(due.filter(id__gt=last_id)[:size])
+            if not ids:
+                break
+            last_id = ids[-1]
+            seen += len(ids)
+            outcomes = pool.map(_release_in_thread, ids) if pool else map(release_payment, ids)
+            released += sum(outcomes)
+    finally:
+        if pool:
+            pool.shutdown()
+    logger.info("Sent payouts for %d of %d due payments", released, seen)
+    return released
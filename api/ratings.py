@@ -0,0 +1,43 @@
+from django.db.models import F, Q, Value
+from django.db.models.functions import Greatest, Now
+
+from orders.models import Order, RatingSummary
+
+
+def _subjects(order_id):
+    row = Order.objects.filter(pk=order_id).values_list('artisan_id', 'product_id').first()
+    if row is None:
+        return []
+    artisan_id, product_id = row
+    subjects = [('artisan', artisan_id)]
+    if product_id is not None:
+        subjects.append(('product', product_id))
+    return subjects
+
+
+def update_summaries(order_id, old=None, new=None):
+    """
+    Move the artisan and product summaries of ``order_id`` from star value
+    ``old`` to ``new``: ``old=None`` for a new rating, ``new=None`` for a
+    deleted one. One insert-if-missing and one F() update, which also sets
+    ``updated_at`` since update() skips auto_now.
+    """
+    if old == new:
+        return 0
+    subjects = _subjects(order_id)
+    if not subjects:
+        return 0
+    deltas = {'count': int(new is not None) - int(old is not None), 'total': (new or 0) - (old or 0)}
+    for stars, delta in ((old, -1), (new, 1)):
+        if stars is not None:
+            deltas[f'stars_{stars}'] = deltas.get(f'stars_{stars}', 0) + delta
+    RatingSummary.objects.bulk_create(
+        [RatingSummary(scope=scope, subject_id=subject_id) for scope, subject_id in subjects],
+        ignore_conflicts=True,
+    )
+    matching = Q()
+    for scope, subject_id in subjects:
+        matching |= Q(scope=scope, subject_id=subject_id)
+    return RatingSummary.objects.filter(matching).update(updated_at=Now(), **{
+        field: Greatest(F(field) + delta, Value(0)) for field, delta in deltas.items() if delta
+    })
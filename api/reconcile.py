@@ -0,0 +1,95 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from payments.models import DarajaCallback, Payment
+from .daraja import DarajaAPI
+
+logger = logging.getLogger(__name__)
+
+
+def stale_pending(now=None):
+    """
+    Pushed payments still waiting on a callback after STK_QUERY_AFTER_SECONDS
+    that have not been queried in the last STK_QUERY_INTERVAL_SECONDS.
+    """
+    now = now or timezone.now()
+    return Payment.objects.filter(
+        status='pending',
+        created_at__lte=now - timedelta(seconds=settings.STK_QUERY_AFTER_SECONDS),
+        checkout_request_id__isnull=False,
+    ).filter(
+        Q(stk_queried_at__isnull=True)
+        | Q(stk_queried_at__lte=now - timedelta(seconds=settings.STK_QUERY_INTERVAL_SECONDS))
+    )
+
+
+def query_payment(checkout_request_id):
+    try:
+        result = DarajaAPI().stk_query(checkout_request_id)
+    except Exception:
+        logger.exception("STK query for %s failed", checkout_request_id)
+        return None
+    if result is None or 'ResultCode' not in result:
+        return None
+    return {'Body': {'stkCallback': {
+        'MerchantRequestID': result.get('MerchantRequestID'),
+        'CheckoutRequestID': checkout_request_id,
+        'ResultCode': int(result['ResultCode']),
+        'ResultDesc': result.get('ResultDesc'),
+    }}}
+
+
+def _query_in_thread(checkout_request_id):
+    try:
+        return query_payment(checkout_request_id)
+    finally:
+        connection.close()
+
+
+def reconcile_pending(batch_size=200, workers=None):
+    """
+    Query Daraja for one batch of stale pending payments. Final answers are
+    written to the callback inbox as synthetic STK callbacks, so they are
+    applied by process_callbacks() exactly like real ones. Returns the number
+    of payments queried.
+    """
+    workers = workers or settings.STK_QUERY_WORKERS
+    now = timezone.now()
+    batch = list(stale_pending(now).order_by('created_at').values_list('id', 'checkout_request_id')[:batch_size])
+    if not batch:
+        return 0
+    Payment.objects.filter(id__in=[payment_id for payment_id, _ in batch]).update(stk_queried_at=now)
+    checkout_ids = [checkout_request_id for _, checkout_request_id in batch]
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_query_in_thread, checkout_ids))
+    else:
+        results = [query_payment(checkout_request_id) for checkout_request_id in checkout_ids]
+    found = [result for result in results if result is not None]
+    DarajaCallback.objects.bulk_create([DarajaCallback(kind='stk', payload=payload) for payload in found])
+    logger.info("Reconciled %d of %d stale pending payments", len(found), len(batch))
+    return len(batch)
+
+
+def reconcile_metrics(now=None):
+    """Backlog sizes and lag, in seconds, of the STK reconciler and the callback inbox."""
+    now = now or timezone.now()
+    pending = Payment.objects.filter(status='pending', checkout_request_id__isnull=False)
+    stale = pending.filter(created_at__lte=now - timedelta(seconds=settings.STK_QUERY_AFTER_SECONDS))
+    oldest_payment = pending.aggregate(oldest=Min('created_at'))['oldest']
+    inbox = DarajaCallback.objects.filter(status='pending')
+    oldest_callback = inbox.aggregate(oldest=Min('received_at'))['oldest']
+    return {
+        'pending_payments': pending.count(),
+        'stale_pending_payments': stale.count(),
+        'pending_lag_seconds': round((now - oldest_payment).total_seconds(), 1) if oldest_payment else 0,
+        'inbox_backlog': inbox.count(),
+        'inbox_lag_seconds': round((now - oldest_callback).total_seconds(), 1) if oldest_callback else 0,
+        'failed_callbacks': DarajaCallback.objects.filter(status='failed').count(),
+    }
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from django.conf import settings
-from orders.models import Order, Rating, OrderTracking, CustomDesignRequest
+from orders.models import Order, Rating, RatingSummary, OrderTracking, CustomDesignRequest
 from cart.models import ShoppingCart, CartItem
 from products.models import Inventory
 from .daraja import DarajaAPI
@@ -14,6 +14,7 @@ from rest_framework.validators import UniqueValidator
 from rest_framework.authtoken.models import Token
 from users.models import User, ArtisanPortfolio, Profile
 from users.utils import send_forgot_password_email
+from .utils import decode_distance_cursor
 
 class OrderSerializer(serializers.ModelSerializer):
     class Meta:
@@ -45,7 +46,8 @@ class OrderSerializer(serializers.ModelSerializer):
 
 
 class RatingSerializer(serializers.ModelSerializer):
-    order = OrderSerializer(read_only=True)
+    artisan_id = serializers.IntegerField(source='order_id.artisan_id_id', read_only=True)
+    product_id = serializers.IntegerField(source='order_id.product_id_id', read_only=True)
 
     class Meta:
         model = Rating
@@ -57,13 +59,19 @@ class RatingSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Rating must be between 1 and 5.")
         return value
 
-class OrderTrackingSerializer(serializers.ModelSerializer):
-    order = OrderSerializer(read_only=True)
+class RatingSummarySerializer(serializers.ModelSerializer):
+    average = serializers.FloatField(read_only=True)
+    histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
 
+    class Meta:
+        model = RatingSummary
+        fields = ['scope', 'subject_id', 'count', 'average', 'histogram', 'updated_at']
+
+class OrderTrackingSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderTracking
         fields = '__all__'
-        read_only_fields = ['tracking_id', 'update_timestamp', 'created_at', 'approval_timestamp']
+        read_only_fields = ['artisan_id', 'buyer_approval', 'created_at', 'approval_timestamp']
 
 class CustomDesignRequestSerializer(serializers.ModelSerializer):
     class Meta:
@@ -108,7 +116,10 @@ class STKPushSerializer(serializers.Serializer):
     transaction_desc = serializers.CharField(max_length=255)
 
     def validate(self, data):
-        order = Order.objects.get(id=data['order_id'])
+        try:
+            order = Order.objects.select_related('buyer_id', 'artisan_id').get(id=data['order_id'])
+        except Order.DoesNotExist:
+            raise serializers.ValidationError({'order_id': 'Order not found.'})
         buyer = order.buyer_id
         artisan = order.artisan_id
         data['artisan_phone'] = artisan.phone_number
@@ -354,3 +365,17 @@ class NearbyArtisanSearchSerializer(serializers.Serializer):
     latitude = serializers.DecimalField(max_digits=9, decimal_places=6)
     longitude = serializers.DecimalField(max_digits=9, decimal_places=6)
     radius = serializers.DecimalField(max_digits=5, decimal_places=2, default=50)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+    cursor = serializers.CharField(required=False, allow_blank=True)
+
+    def validate_cursor(self, value):
+        if not value:
+            return None
+        try:
+            return decode_distance_cursor(value)
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
+
+
+class NearestArtisansQuerySerializer(serializers.Serializer):
+    k = serializers.IntegerField(min_value=1, max_value=100)
@@ -0,0 +1,138 @@
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from orders.models import Order, OrderTracking, Rating
+from users.models import User, ArtisanPortfolio
+from .geo_index import artisan_index
+from .jobs import enqueue
+from .metrics import FINAL_STATUSES, order_created, order_status_changed, rating_changed
+from .nearby import invalidate_location
+from .ratings import update_summaries
+from .notifications import hub
+from .streams import order_states
+from .transitions import transitioned
+
+ARTISAN_INDEX_FIELDS = {'user_type', 'first_name', 'last_name', 'latitude', 'longitude'}
+
+
+@receiver(post_save, sender=User)
+def update_artisan_index(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not ARTISAN_INDEX_FIELDS & set(update_fields):
+        return
+    if (
+        instance.user_type == User.UserType.ARTISAN
+        and instance.latitude is not None
+        and instance.longitude is not None
+    ):
+        artisan_index.upsert(
+            instance.user_id, instance.first_name, instance.last_name,
+            instance.latitude, instance.longitude,
+        )
+    else:
+        artisan_index.remove(instance.user_id)
+
+
+@receiver(post_delete, sender=User)
+def remove_from_artisan_index(sender, instance, **kwargs):
+    artisan_index.remove(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_nearby_cache_for_user(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not ARTISAN_INDEX_FIELDS & set(update_fields):
+        return
+    invalidate_location(*getattr(instance, '_loaded_location', (None, None)))
+    invalidate_location(instance.latitude, instance.longitude)
+
+
+@receiver(post_delete, sender=User)
+def invalidate_nearby_cache_for_deleted_user(sender, instance, **kwargs):
+    invalidate_location(instance.latitude, instance.longitude)
+
+
+@receiver(post_save, sender=ArtisanPortfolio)
+@receiver(post_delete, sender=ArtisanPortfolio)
+def invalidate_nearby_cache_for_portfolio(sender, instance, **kwargs):
+    location = User.objects.filter(pk=instance.artisan_id_id).values_list('latitude', 'longitude').first()
+    if location:
+        invalidate_location(*location)
+
+
+@receiver(post_save, sender=User)
+def schedule_geocoding(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'address' not in update_fields:
+        return
+    if instance.address and instance.address != getattr(instance, '_loaded_address', None):
+        enqueue('geocode_user', {'user_id': instance.pk, 'address': instance.address})
+
+
+@receiver(post_save, sender=OrderTracking)
+def advance_latest_tracking(sender, instance, created, **kwargs):
+    """
+    Point the order at its newest tracking row. Ids grow with insertion, so
+    the condition keeps a slower concurrent insert from moving it backwards.
+    """
+    if not created:
+        return
+    Order.objects.filter(
+        Q(latest_tracking__isnull=True) | Q(latest_tracking__lt=instance.pk), pk=instance.order_id_id,
+    ).update(latest_tracking=instance)
+    publish_order(instance.order_id_id)
+
+
+@receiver(post_save, sender=Order)
+def publish_order_change(sender, instance, created, **kwargs):
+    if not created:
+        publish_order(instance.pk)
+
+
+def publish_order(order_id):
+    """Push an order's new state to streams in this process once it commits."""
+    if not hub.is_watched('order', order_id):
+        return
+
+    def publish():
+        state = order_states([order_id]).get(order_id)
+        if state is not None:
+            hub.publish('order', order_id, state)
+
+    transaction.on_commit(publish)
+
+
+@receiver(post_save, sender=Order)
+def count_order(sender, instance, created, **kwargs):
+    if created:
+        order_created(instance.artisan_id_id, instance.status)
+    elif instance.status != getattr(instance, '_loaded_status', instance.status):
+        order_status_changed(instance.artisan_id_id, instance._loaded_status, instance.status)
+
+
+@receiver(transitioned, sender=Order)
+def count_order_transition(sender, field, target, filters, **kwargs):
+    # Order transitions only start from open statuses.
+    if field == 'status' and target in FINAL_STATUSES:
+        for artisan_id in Order.objects.filter(**filters).values_list('artisan_id', flat=True):
+            order_status_changed(artisan_id, None, target)
+
+
+@receiver(post_save, sender=Rating)
+def count_rating(sender, instance, created, **kwargs):
+    old = None if created else getattr(instance, '_loaded_rating', instance.rating)
+    rating_changed(instance.order_id_id, int(old is None), instance.rating - (old or 0))
+    update_summaries(instance.order_id_id, old, instance.rating)
+
+
+@receiver(post_delete, sender=Rating)
+def uncount_rating(sender, instance, **kwargs):
+    rating_changed(instance.order_id_id, -1, -instance.rating)
+    update_summaries(instance.order_id_id, instance.rating, None)
+
+
+@receiver(post_migrate)
+def create_cache_table(sender, using, verbosity=1, **kwargs):
+    """Create the DatabaseCache table on ``migrate`` so no separate deploy step is needed."""
+    if sender.name == 'api':
+        call_command('createcachetable', database=using, verbosity=verbosity)
@@ -0,0 +1,219 @@
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class SimulatorConfig:
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, decline_rate=0.0,
+                 callback_delay=1.0, stk_callback_url=None, b2c_result_url=None, callback_workers=8,
+                 drop_callback_rate=0.0, result_ttl=600):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.decline_rate = decline_rate
+        self.callback_delay = callback_delay
+        self.stk_callback_url = stk_callback_url
+        self.b2c_result_url = b2c_result_url
+        self.callback_workers = callback_workers
+        self.drop_callback_rate = drop_callback_rate
+        self.result_ttl = result_ttl
+
+
+class DarajaSimulator(ThreadingHTTPServer):
+    """
+    Stand-in for the Daraja OAuth, STK push and B2C endpoints. Every call
+    waits ``latency_ms`` (+/- ``jitter_ms``) and fails with a 503 at
+    ``error_rate``. Accepted requests get their result callback posted back
+    to the CallBackURL/ResultURL from the payload (or ``stk_callback_url`` /
+    ``b2c_result_url``) after ``callback_delay`` seconds; ``decline_rate`` of
+    STK pushes come back as cancelled by the user and ``drop_callback_rate``
+    of callbacks are never sent, which leaves the STK query endpoint as the
+    only way to learn the result. An STK result stays queryable until its
+    callback is delivered or for ``result_ttl`` seconds after it is ready.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, config=None):
+        super().__init__(address, DarajaSimulatorHandler)
+        self.config = config or SimulatorConfig()
+        self.callbacks = ThreadPoolExecutor(max_workers=self.config.callback_workers)
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            'requests': 0, 'errors': 0, 'callbacks_sent': 0, 'callbacks_failed': 0, 'callbacks_dropped': 0,
+        }
+        self.results_lock = threading.Lock()
+        self.stk_results = {}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def remember_stk_result(self, checkout_request_id, result):
+        """Keep ``result`` for STK queries, first dropping results older than ``result_ttl``."""
+        now = time.monotonic()
+        with self.results_lock:
+            # Every result waits the same callback_delay, so the oldest come first.
+            for key, (ready_at, _) in list(self.stk_results.items()):
+                if ready_at + self.config.result_ttl > now:
+                    break
+                del self.stk_results[key]
+            self.stk_results[checkout_request_id] = (now + self.config.callback_delay, result)
+
+    def stk_result(self, checkout_request_id):
+        with self.results_lock:
+            return self.stk_results.get(checkout_request_id, (None, None))
+
+    def schedule_callback(self, url, body, checkout_request_id=None):
+        if random.random() < self.config.drop_callback_rate:
+            self.count('callbacks_dropped')
+        elif url:
+            self.callbacks.submit(self.send_callback, url, body, checkout_request_id)
+
+    def send_callback(self, url, body, checkout_request_id=None):
+        time.sleep(self.config.callback_delay)
+        try:
+            requests.post(url, json=body, timeout=10).raise_for_status()
+            self.count('callbacks_sent')
+            if checkout_request_id:
+                with self.results_lock:
+                    self.stk_results.pop(checkout_request_id, None)
+        except requests.RequestException as exc:
+            logger.warning("Simulator callback to %s failed: %s", url, exc)
+            self.count('callbacks_failed')
+
+    def server_close(self):
+        super().server_close()
+        self.callbacks.shutdown(wait=False)
+
+
+class DarajaSimulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug("simulator %s", format % args)
+
+    def do_GET(self):
+        if not self.begin():
+            return
+        if self.path.startswith('/oauth/v1/generate'):
+            return self.reply(200, {'access_token': uuid.uuid4().hex, 'expires_in': '3599'})
+        self.reply(404, {'errorMessage': 'Not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self.reply(400, {'errorMessage': 'Invalid JSON'})
+        if not self.begin():
+            return
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            return self.reply(401, {'errorMessage': 'Invalid Access Token'})
+        if self.path == '/mpesa/stkpush/v1/processrequest':
+            return self.stk_push(payload)
+        if self.path == '/mpesa/stkpushquery/v1/query':
+            return self.stk_query(payload)
+        if self.path == '/mpesa/b2c/v1/paymentrequest':
+            return self.b2c_payment(payload)
+        self.reply(404, {'errorMessage': 'Not found'})
+
+    def begin(self):
+        config = self.server.config
+        self.server.count('requests')
+        delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if random.random() < config.error_rate:
+            self.server.count('errors')
+            self.reply(503, {'errorMessage': 'Service temporarily unavailable'})
+            return False
+        return True
+
+    def reply(self, status_code, body):
+        data = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def stk_push(self, payload):
+        merchant_request_id = f"sim-{uuid.uuid4().hex[:12]}"
+        checkout_request_id = f"ws_CO_{uuid.uuid4().hex[:20]}"
+        message = 'Success. Request accepted for processing'
+        self.reply(200, {
+            'MerchantRequestID': merchant_request_id,
+            'CheckoutRequestID': checkout_request_id,
+            'ResponseCode': '0',
+            'ResponseDescription': message,
+            'CustomerMessage': message,
+        })
+        result = {
+            'MerchantRequestID': merchant_request_id,
+            'CheckoutRequestID': checkout_request_id,
+        }
+        if random.random() < self.server.config.decline_rate:
+            result.update(ResultCode=1032, ResultDesc='Request cancelled by user')
+        else:
+            result.update(ResultCode=0, ResultDesc='The service request is processed successfully.')
+            result['CallbackMetadata'] = {'Item': [
+                {'Name': 'Amount', 'Value': float(payload.get('Amount') or 0)},
+                {'Name': 'MpesaReceiptNumber', 'Value': f"SIM{uuid.uuid4().hex[:7].upper()}"},
+                {'Name': 'TransactionDate', 'Value': int(datetime.now().strftime('%Y%m%d%H%M%S'))},
+                {'Name': 'PhoneNumber', 'Value': payload.get('PhoneNumber')},
+            ]}
+        self.server.remember_stk_result(checkout_request_id, result)
+        self.server.schedule_callback(
+            self.server.config.stk_callback_url or payload.get('CallBackURL'),
+            {'Body': {'stkCallback': result}},
+            checkout_request_id,
+        )
+
+    def stk_query(self, payload):
+        ready_at, result = self.server.stk_result(payload.get('CheckoutRequestID'))
+        if result is None:
+            return self.reply(400, {'errorCode': '400.002.02', 'errorMessage': 'Bad Request - Invalid CheckoutRequestID'})
+        if time.monotonic() < ready_at:
+            return self.reply(500, {'errorCode': '500.001.1001', 'errorMessage': 'The transaction is being processed'})
+        self.reply(200, {
+            'ResponseCode': '0',
+            'ResponseDescription': 'The service request has been accepted successfully',
+            'MerchantRequestID': result['MerchantRequestID'],
+            'CheckoutRequestID': result['CheckoutRequestID'],
+            'ResultCode': str(result['ResultCode']),
+            'ResultDesc': result['ResultDesc'],
+        })
+
+    def b2c_payment(self, payload):
+        conversation_id = f"AG_{uuid.uuid4().hex[:20]}"
+        originator_id = f"sim-{uuid.uuid4().hex[:12]}"
+        self.reply(200, {
+            'ConversationID': conversation_id,
+            'OriginatorConversationID': originator_id,
+            'ResponseCode': '0',
+            'ResponseDescription': 'Accept the service request successfully.',
+        })
+        self.server.schedule_callback(self.server.config.b2c_result_url or payload.get('ResultURL'), {'Result': {
+            'ResultType': 0,
+            'ResultCode': 0,
+            'ResultDesc': 'The service request is processed successfully.',
+            'OriginatorConversationID': originator_id,
+            'ConversationID': conversation_id,
+            'TransactionID': f"SIM{uuid.uuid4().hex[:7].upper()}",
+        }})
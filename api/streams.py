@@ -0,0 +1,227 @@
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+from django.http import HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from orders.models import Order, OrderTracking
+from payments.models import Payment
+from users.models import User
+from .notifications import hub
+
+# While a payment is in one of these states a client is waiting on Daraja.
+SETTLING_STATUSES = {'pending', 'releasing'}
+STATE_FIELDS = ('transaction_code', 'status', 'checkout_request_id', 'mpesa_receipt_number', 'result_description')
+
+
+def payment_states(transaction_codes):
+    return {
+        row['transaction_code']: row
+        for row in Payment.objects.filter(transaction_code__in=transaction_codes).values(*STATE_FIELDS)
+    }
+
+
+hub.register('payment', payment_states)
+
+
+def visible_payment_state(user, transaction_code):
+    """State of the payment when ``user`` is its buyer or artisan, else None."""
+    return Payment.objects.filter(
+        Q(order_id__buyer_id=user) | Q(artisan_id=user), transaction_code=transaction_code,
+    ).values(*STATE_FIELDS).first()
+
+# Orders in these states no longer change, so a stream does not follow them.
+FINAL_ORDER_STATUSES = {'completed', 'rejected'}
+ORDER_STATE_FIELDS = ('id', 'status', 'payment_status', 'delivery_confirmed', 'latest_tracking_id')
+TRACKING_EVENT_FIELDS = ('id', 'order_id', 'status', 'description', 'artisan_upload', 'created_at')
+
+
+def order_states(order_ids):
+    return {row['id']: row for row in Order.objects.filter(pk__in=order_ids).values(*ORDER_STATE_FIELDS)}
+
+
+hub.register('order', order_states)
+
+
+def new_trackings(order_id, after_id, upto_id):
+    trackings = OrderTracking.objects.filter(order_id=order_id, pk__lte=upto_id)
+    if after_id is not None:
+        trackings = trackings.filter(pk__gt=after_id)
+    return list(trackings.order_by('pk').values(*TRACKING_EVENT_FIELDS))
+
+
+def streamed_orders(user, requested_ids):
+    """Ids of the user's orders to follow: the requested ones, or all still open."""
+    if user.user_type == User.UserType.BUYER:
+        orders = Order.objects.filter(buyer_id=user)
+    elif user.user_type == User.UserType.ARTISAN:
+        orders = Order.objects.filter(artisan_id=user)
+    else:
+        return {}
+    if requested_ids:
+        orders = orders.filter(pk__in=requested_ids)
+    else:
+        orders = orders.exclude(status__in=FINAL_ORDER_STATUSES)
+    return order_states(orders.order_by('-created_at').values_list('pk', flat=True)[:settings.ORDER_STREAM_MAX_ORDERS])
+
+
+def authenticated_user(request):
+    """The DRF-authenticated user (token or session) of a plain Django request."""
+    authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    return Request(request, authenticators=authenticators).user
+
+
+def wait_seconds(request):
+    try:
+        wait = float(request.GET.get('wait', settings.LONG_POLL_TIMEOUT))
+    except ValueError:
+        wait = settings.LONG_POLL_TIMEOUT
+    return max(0.0, min(wait, settings.LONG_POLL_MAX_TIMEOUT))
+
+
+def wants_event_stream(request):
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def event_stream(kind, key, state, timeout, is_final):
+    """Current state first, then each change until ``is_final(state)`` or the timeout."""
+    subscription = hub.subscribe(kind, key, state)
+    deadline = time.monotonic() + timeout
+    try:
+        yield sse_event(kind, state)
+        while not is_final(state):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            changed = await subscription.get(min(remaining, settings.SSE_KEEPALIVE_SECONDS))
+            if changed is None:
+                yield ": keepalive\n\n"
+                continue
+            state = changed
+            yield sse_event(kind, state)
+    finally:
+        hub.unsubscribe(subscription)
+
+
+def event_stream_response(stream):
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def wait_for_change(kind, key, state, timeout):
+    subscription = hub.subscribe(kind, key, state)
+    try:
+        changed = await subscription.get(timeout)
+    finally:
+        hub.unsubscribe(subscription)
+    return state if changed is None else changed
+
+
+async def payment_status(request, transaction_code):
+    """
+    Status of a payment, for its buyer or artisan waiting on an STK push or
+    payout.
+
+    Long-poll: answers as soon as the status differs from ``?since=``
+    (default: as soon as it leaves pending/releasing) or after ``?wait=``
+    seconds. With ``Accept: text/event-stream`` it streams every change as a
+    server-sent event until the payment settles. Waiting costs no queries
+    of its own: one watcher per worker checks all watched payments each
+    NOTIFICATION_POLL_SECONDS. Needs an ASGI server to hold many
+    connections, e.g. ``gunicorn craftcrest.asgi:application -k
+    uvicorn.workers.UvicornWorker``.
+    """
+    # Not @require_GET: on Django 4.2 its sync wrapper hides the coroutine.
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    user = await sync_to_async(authenticated_user)(request)
+    if not user.is_authenticated:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    state = await sync_to_async(visible_payment_state)(user, transaction_code)
+    if state is None:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    timeout = wait_seconds(request)
+    if wants_event_stream(request):
+        return event_stream_response(event_stream(
+            'payment', transaction_code, state, timeout,
+            lambda current: current['status'] not in SETTLING_STATUSES,
+        ))
+
+    since = request.GET.get('since')
+    while timeout > 0 and (state['status'] == since if since else state['status'] in SETTLING_STATUSES):
+        started = time.monotonic()
+        changed = await wait_for_change('payment', transaction_code, state, timeout)
+        if changed == state:
+            break
+        state = changed
+        timeout -= time.monotonic() - started
+    return JsonResponse(state)
+
+
+async def order_event_stream(states, timeout):
+    """
+    Current state of every order, then each tracking row and order change
+    as it lands. Tracking rows inserted between two checks are all sent,
+    oldest first, before the order state that points at the newest one.
+    """
+    queue = asyncio.Queue()
+    subscriptions = [hub.subscribe('order', order_id, state, queue) for order_id, state in states.items()]
+    deadline = time.monotonic() + timeout
+    try:
+        for state in states.values():
+            yield sse_event('order', state)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                state = await asyncio.wait_for(queue.get(), min(remaining, settings.SSE_KEEPALIVE_SECONDS))
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            previous = states[state['id']]
+            if state['latest_tracking_id'] and state['latest_tracking_id'] != previous['latest_tracking_id']:
+                rows = await sync_to_async(new_trackings)(
+                    state['id'], previous['latest_tracking_id'], state['latest_tracking_id'],
+                )
+                for row in rows:
+                    yield sse_event('tracking', row)
+            states[state['id']] = state
+            yield sse_event('order', state)
+    finally:
+        for subscription in subscriptions:
+            hub.unsubscribe(subscription)
+
+
+async def order_updates(request):
+    """
+    Server-sent events for the caller's orders, replacing repeated fetches
+    of ``trackings/`` and ``orders/``. Follows ``?order=<id>`` (repeatable)
+    or every open order, for ``?wait=`` seconds; clients reconnect after
+    that. Changes made in this process are pushed as they commit, and the
+    shared watcher picks up those made by other workers.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    user = await sync_to_async(authenticated_user)(request)
+    if not user.is_authenticated:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    try:
+        requested = [int(order_id) for order_id in request.GET.getlist('order')]
+    except ValueError:
+        return JsonResponse({'order': 'Order ids must be integers.'}, status=400)
+    states = await sync_to_async(streamed_orders)(user, requested)
+    if requested and not states:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    return event_stream_response(order_event_stream(states, wait_seconds(request)))
@@ -0,0 +1,93 @@
+import logging
+
+import requests
+
+from payments.models import Payment
+from users.models import ArtisanProfile, User
+from . import transitions
+from .daraja import DarajaAPI, DarajaUnavailable
+from .geocoding import locate_user
+from .jobs import job_handler
+from .payouts import send_payout
+
+logger = logging.getLogger(__name__)
+
+
+@job_handler('verify_artisans')
+def verify_artisans(batch, chunk, of, ids):
+    updated = ArtisanProfile.objects.filter(pk__in=ids).update_verification()
+    logger.info("Verification batch %s: chunk %d/%d updated %d profiles", batch, chunk, of, updated)
+    return {'updated': updated}
+
+
+@job_handler('geocode_user')
+def geocode_user(user_id, address):
+    user = User.objects.filter(pk=user_id).first()
+    if user is None or user.address != address:
+        return {'skipped': True}
+    return {'located': locate_user(user)}
+
+
+def _stk_push_gave_up(job):
+    transitions.payments.apply(
+        'fail_push', {'pk': job.payload['payment_id']}, result_description=(job.last_error or '')[:255],
+    )
+
+
+@job_handler('stk_push', on_failure=_stk_push_gave_up)
+def send_stk_push(payment_id, transaction_desc):
+    """
+    Prompt the buyer for a pending payment. Transport failures where the
+    request never reached Safaricom are raised so the job is retried; any
+    other failure marks the payment failed, since a resend could prompt the
+    buyer twice.
+    """
+    payment = Payment.objects.filter(pk=payment_id, status='pending').first()
+    if payment is None or payment.checkout_request_id:
+        return {'skipped': True}
+    try:
+        response = DarajaAPI().stk_push(
+            buyer_phone=payment.buyer_phone,
+            amount=payment.amount,
+            transaction_id=payment.transaction_code,
+            transaction_desc=transaction_desc,
+        )
+    except (DarajaUnavailable, requests.ConnectTimeout):
+        raise
+    except Exception as exc:
+        transitions.payments.apply('fail_push', {'pk': payment_id}, result_description=str(exc)[:255])
+        return {'failed': str(exc)}
+    checkout_request_id = response.get('CheckoutRequestID')
+    if checkout_request_id:
+        Payment.objects.filter(pk=payment_id).update(
+            checkout_request_id=checkout_request_id,
+            result_description=response.get('CustomerMessage'),
+        )
+    else:
+        transitions.payments.apply(
+            'fail_push', {'pk': payment_id},
+            result_description=str(response.get('errorMessage') or response.get('ResponseDescription'))[:255],
+        )
+    return {'checkout_request_id': checkout_request_id}
+
+
+def _payout_gave_up(job):
+    transitions.payments.apply(
+        'fail_payout', {'pk': job.payload['payment_id'], 'b2c_conversation_id__isnull': True},
+        result_description=(job.last_error or '')[:255],
+    )
+
+
+@job_handler('b2c_payout', on_failure=_payout_gave_up)
+def pay_out(payment_id, transaction_desc):
+    """Send the payout for a payment claimed by DeliveryConfirmView; retried like send_stk_push."""
+    if not Payment.objects.filter(pk=payment_id, status='releasing', b2c_conversation_id__isnull=True).exists():
+        return {'skipped': True}
+    try:
+        conversation_id = send_payout(payment_id, transaction_desc)
+    except (DarajaUnavailable, requests.ConnectTimeout):
+        raise
+    except Exception as exc:
+        transitions.payments.apply('fail_payout', {'pk': payment_id}, result_description=str(exc)[:255])
+        return {'failed': str(exc)}
+    return {'conversation_id': conversation_id}
@@ -12,14 +12,58 @@ from api.serializers import (
 )
 from api.views import (
     CustomDesignRequestViewSet, OrderTrackingViewSet,
-    RatingViewSet, OrderViewSet
+    RatingViewSet, OrderViewSet, NearbyArtisansView, STKPushView, STKPushStatusView, daraja_callback,
+    DeliveryConfirmView, RefundPaymentView, b2c_result_callback, b2c_timeout_callback, PaymentViewSet,
+    RatingSummaryView,
 )
 from unittest.mock import patch
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APIRequestFactory
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from rest_framework.authtoken.models import Token
 from users.models import ArtisanPortfolio
+from django.core.cache import cache
+from api.geo_index import _KDTree, artisan_index, get_artisan_index
+from api.nearby import cache_stats
+from api.jobs import work
+from api.payouts import release_due_payments, retry_failed_payouts
+from api.simulator import DarajaSimulator, SimulatorConfig
+from api.notifications import hub
+from api.streams import order_updates, payment_status
+from asgiref.sync import sync_to_async
+from django.test import AsyncRequestFactory
+import asyncio
+import json
+import time
+from api.reconcile import reconcile_metrics, reconcile_pending
+import threading
+from api.callbacks import process_callbacks, record_callback, replay_callbacks
+from api.ledger import PLATFORM_FLOAT, held_for_artisan, ledger_drift, platform_float, take_snapshot
+from payments.models import BalanceSnapshot, LedgerEntry
+from api.archive import archive_cutoff, archive_orders, archive_payments
+from orders.models import ArchivedOrder, RatingSummary
+from api import transitions
+from api.metrics import rebuild_metrics
+from api.verification import update_verification, verification_progress
+from products.models import Inventory
+from users.models import ArtisanProfile
+from rest_framework.test import force_authenticate
+from payments.models import DarajaCallback
+from django.db.models import Count
+from api.geocoding import LocalGeocoder, geocode
+from api.models import Job, GeocodedAddress, IdempotencyKey
+from api.idempotency import request_fingerprint
+from django.test import override_settings
+from django.urls import reverse
+import requests
+from django.conf import settings
+from unittest.mock import MagicMock
+from api import daraja
+from api.daraja import DarajaAPI
+from api.utils import bounding_box, geohash_encode, haversine, haversine_many, nearest, within_radius
+import math
+import os
+import tempfile
 
 User = get_user_model()
 from payments.models import Payment
@@ -276,3 +320,1360 @@ class PaymentModelTest(TestCase):
         self.assertFalse(payment.held_by_platform)
 
 
+
+
+# A cache shared between processes that stays out of assertNumQueries.
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.path.join(tempfile.gettempdir(), 'craftcrest-test-cache'),
+}})
+class NearbyArtisansViewTest(APITestCase):
+    def setUp(self):
+        self.near = User.objects.create_user(
+            user_type=User.UserType.ARTISAN,
+            first_name='Near',
+            email='near@example.com',
+            phone_number='0711111111',
+            national_id='11111111',
+            latitude=Decimal('-1.290000'),
+            longitude=Decimal('36.820000'),
+        )
+        self.far = User.objects.create_user(
+            user_type=User.UserType.ARTISAN,
+            first_name='Far',
+            email='far@example.com',
+            phone_number='0722222222',
+            national_id='22222222',
+            latitude=Decimal('-4.043500'),
+            longitude=Decimal('39.668200'),
+        )
+        self.factory = APIRequestFactory()
+        cache.clear()
+
+    def test_geohash_kept_up_to_date_on_save(self):
+        self.assertEqual(self.near.geohash, geohash_encode(-1.29, 36.82))
+        self.near.latitude = Decimal('-4.043500')
+        self.near.longitude = Decimal('39.668200')
+        self.near.save(update_fields=['latitude', 'longitude'])
+        self.near.refresh_from_db()
+        self.assertEqual(self.near.geohash, self.far.geohash)
+
+    def test_only_artisans_within_radius_are_returned(self):
+        request = self.factory.post('/api/nearby-artisans/', {'latitude': '-1.286389', 'longitude': '36.817223', 'radius': '10'})
+        response = NearbyArtisansView.as_view()(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = [artisan['artisan_id'] for artisan in response.data['artisans']]
+        self.assertEqual(ids, [self.near.user_id])
+
+    def test_results_are_paginated_by_distance_with_batched_portfolios(self):
+        second = User.objects.create_user(
+            user_type=User.UserType.ARTISAN,
+            first_name='Second',
+            email='second@example.com',
+            phone_number='0733333333',
+            national_id='33333333',
+            latitude=Decimal('-1.300000'),
+            longitude=Decimal('36.830000'),
+        )
+        ArtisanPortfolio.objects.bulk_create([
+            ArtisanPortfolio(artisan_id=self.near, title='Baskets', description='Woven'),
+            ArtisanPortfolio(artisan_id=second, title='Pots', description='Clay'),
+        ])
+        view = NearbyArtisansView.as_view()
+        payload = {'latitude': '-1.286389', 'longitude': '36.817223', 'radius': '10', 'limit': 1}
+        with self.assertNumQueries(2):
+            first_page = view(self.factory.post('/api/nearby-artisans/', payload)).data
+        self.assertEqual([a['artisan_id'] for a in first_page['artisans']], [self.near.user_id])
+        self.assertEqual(first_page['artisans'][0]['portfolio'][0]['title'], 'Baskets')
+        payload['cursor'] = first_page['next_cursor']
+        second_page = view(self.factory.post('/api/nearby-artisans/', payload)).data
+        self.assertEqual([a['artisan_id'] for a in second_page['artisans']], [second.user_id])
+        self.assertIsNone(second_page['next_cursor'])
+
+    def test_searches_in_the_same_tile_share_a_cache_entry(self):
+        view = NearbyArtisansView.as_view()
+        view(self.factory.post('/api/nearby-artisans/', {'latitude': '-1.286389', 'longitude': '36.817223', 'radius': '10'}))
+        with self.assertNumQueries(0):
+            response = view(self.factory.post('/api/nearby-artisans/', {'latitude': '-1.288000', 'longitude': '36.819000', 'radius': '8'}))
+        self.assertEqual([a['artisan_id'] for a in response.data['artisans']], [self.near.user_id])
+        self.assertEqual(cache_stats()['hits'], 1)
+        self.assertEqual(cache_stats()['misses'], 1)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_process_local_cache_is_bypassed(self):
+        view = NearbyArtisansView.as_view()
+        payload = {'latitude': '-1.286389', 'longitude': '36.817223', 'radius': '10'}
+        view(self.factory.post('/api/nearby-artisans/', payload))
+        with self.assertNumQueries(2):
+            response = view(self.factory.post('/api/nearby-artisans/', payload))
+        self.assertEqual([a['artisan_id'] for a in response.data['artisans']], [self.near.user_id])
+        self.assertEqual(cache_stats()['misses'], 0)
+
+    def test_moving_an_artisan_invalidates_cached_tiles(self):
+        view = NearbyArtisansView.as_view()
+        payload = {'latitude': '-1.286389', 'longitude': '36.817223', 'radius': '10'}
+        view(self.factory.post('/api/nearby-artisans/', payload))
+        self.far.latitude = Decimal('-1.280000')
+        self.far.longitude = Decimal('36.810000')
+        self.far.save()
+        response = view(self.factory.post('/api/nearby-artisans/', payload))
+        self.assertEqual(
+            [a['artisan_id'] for a in response.data['artisans']],
+            [self.near.user_id, self.far.user_id],
+        )
+
+
+class BatchHaversineTest(TestCase):
+    def setUp(self):
+        self.lats = [Decimal('-1.290000'), Decimal('-4.043500'), Decimal('-0.091700'), Decimal('-1.300000')]
+        self.lons = [Decimal('36.820000'), Decimal('39.668200'), Decimal('34.768000'), Decimal('36.800000')]
+
+    def test_haversine_many_matches_scalar_haversine(self):
+        distances = haversine_many(-1.286389, 36.817223, self.lats, self.lons)
+        for distance, lat, lon in zip(distances, self.lats, self.lons):
+            self.assertAlmostEqual(distance, haversine(-1.286389, 36.817223, lat, lon), places=6)
+
+    def test_within_radius_and_nearest_are_sorted_by_distance(self):
+        indices, distances = within_radius(-1.286389, 36.817223, self.lats, self.lons, 50)
+        self.assertEqual(list(indices), [0, 3])
+        self.assertTrue(distances[0] <= distances[1])
+        indices, _ = nearest(-1.286389, 36.817223, self.lats, self.lons, k=3)
+        self.assertEqual(list(indices), [0, 3, 2])
+
+    def test_bounding_box_contains_points_just_inside_the_radius(self):
+        for lat, lon in ((-1.286389, 36.817223), (60.0, 10.0)):
+            south, west, north, east = bounding_box(lat, lon, 10)
+            self.assertGreater(north, lat + 9.995 / (math.pi * 6371 / 180))
+            # Widest longitude of a 10 km circle sits poleward of its centre.
+            for bearing in range(0, 360, 5):
+                point_lat, point_lon = destination(lat, lon, 9.995, bearing)
+                self.assertAlmostEqual(haversine(lat, lon, point_lat, point_lon), 9.995, places=6)
+                self.assertTrue(south <= point_lat <= north and west <= point_lon <= east)
+
+
+def destination(lat, lon, distance_km, bearing):
+    phi, lam, theta = math.radians(lat), math.radians(lon), math.radians(bearing)
+    delta = distance_km / 6371
+    phi2 = math.asin(math.sin(phi) * math.cos(delta) + math.cos(phi) * math.sin(delta) * math.cos(theta))
+    lam2 = lam + math.atan2(math.sin(theta) * math.sin(delta) * math.cos(phi), math.cos(delta) - math.sin(phi) * math.sin(phi2))
+    return math.degrees(phi2), math.degrees(lam2)
+
+
+class ArtisanIndexTest(APITestCase):
+    def setUp(self):
+        self.artisans = [
+            User.objects.create_user(
+                user_type=User.UserType.ARTISAN,
+                first_name=f'Artisan{i}',
+                email=f'artisan{i}@example.com',
+                phone_number=f'070000000{i}',
+                national_id=f'4000000{i}',
+                latitude=Decimal('-1.286389') + Decimal(i) / 100,
+                longitude=Decimal('36.817223'),
+            )
+            for i in range(5)
+        ]
+        artisan_index.build()
+        self.factory = APIRequestFactory()
+
+    def tearDown(self):
+        artisan_index.clear()
+
+    def test_k_nearest_matches_brute_force_order(self):
+        results = artisan_index.k_nearest(-1.2, 36.817223, 3)
+        self.assertEqual([r['user_id'] for r in results], [a.user_id for a in self.artisans[4:1:-1]])
+        filtered = artisan_index.k_nearest(-1.2, 36.817223, 3, filters={'first_name': 'Artisan0'})
+        self.assertEqual([r['user_id'] for r in filtered], [self.artisans[0].user_id])
+
+    def test_index_follows_saves_and_deletes(self):
+        moved = self.artisans[0]
+        moved.latitude = Decimal('-1.100000')
+        moved.save()
+        self.artisans[4].delete()
+        results = artisan_index.k_nearest(-1.1, 36.817223, 2)
+        self.assertEqual([r['user_id'] for r in results], [moved.user_id, self.artisans[3].user_id])
+
+    def test_query_sees_one_snapshot_while_artisans_change(self):
+        search = _KDTree.search
+
+        def search_while_deleting(tree, *args):
+            artisan_index.remove(self.artisans[4].user_id)
+            return search(tree, *args)
+
+        with patch.object(_KDTree, 'search', search_while_deleting):
+            results = artisan_index.k_nearest(-1.2, 36.817223, 3)
+        self.assertEqual([r['user_id'] for r in results], [a.user_id for a in self.artisans[4:1:-1]])
+        self.assertEqual(len(artisan_index), 4)
+        results = artisan_index.k_nearest(-1.2, 36.817223, 3)
+        self.assertEqual([r['user_id'] for r in results], [a.user_id for a in self.artisans[3:0:-1]])
+
+    def test_view_k_mode_is_served_from_index(self):
+        request = self.factory.post('/api/nearby-artisans/?k=2', {'latitude': '-1.286389', 'longitude': '36.817223'})
+        with self.assertNumQueries(0):
+            response = NearbyArtisansView.as_view()(request)
+        self.assertEqual(
+            [a['artisan_id'] for a in response.data['artisans']],
+            [self.artisans[0].user_id, self.artisans[1].user_id],
+        )
+
+    @override_settings(ARTISAN_INDEX_MAX_ENTRIES=3)
+    def test_oversized_index_is_not_rebuilt_per_request(self):
+        artisan_index.clear()
+        with patch('api.geo_index.logger'):
+            self.assertFalse(artisan_index.build())
+        self.assertTrue(artisan_index.disabled)
+        request = self.factory.post('/api/nearby-artisans/?k=2', {'latitude': '-1.286389', 'longitude': '36.817223'})
+        with patch.object(artisan_index, 'rebuild_async') as rebuild:
+            response = NearbyArtisansView.as_view()(request)
+            self.assertIsNone(get_artisan_index())
+        rebuild.assert_not_called()
+        self.assertEqual(len(response.data['artisans']), 2)
+
+
+@override_settings(GEOCODER_BACKEND='api.geocoding.LocalGeocoder')
+class GeocodingTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            first_name='Wanjiru',
+            email='wanjiru@example.com',
+            phone_number='0744444444',
+            national_id='44444444',
+        )
+
+    def test_address_change_is_geocoded_by_a_background_job(self):
+        self.user.address = 'Kimathi Street,  Nairobi'
+        self.user.save()
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.latitude)
+        self.assertTrue(Job.objects.filter(kind='geocode_user', status='queued').exists())
+        work()
+        self.user.refresh_from_db()
+        expected = LocalGeocoder().geocode('kimathi street, nairobi')
+        self.assertEqual((float(self.user.latitude), float(self.user.longitude)), expected)
+        self.assertEqual(self.user.geohash, geohash_encode(*expected))
+
+    def test_normalized_addresses_are_served_from_the_cache(self):
+        class CountingGeocoder(LocalGeocoder):
+            calls = 0
+
+            def geocode(self, address):
+                CountingGeocoder.calls += 1
+                return super().geocode(address)
+
+        geocoder = CountingGeocoder()
+        first = geocode('Moi Avenue, Mombasa', geocoder)
+        second = geocode('  moi avenue ,mombasa ', geocoder)
+        self.assertEqual(first, second)
+        self.assertEqual(CountingGeocoder.calls, 1)
+        self.assertEqual(GeocodedAddress.objects.get().normalized_address, 'moi avenue, mombasa')
+
+    def test_portfolio_save_no_longer_geocodes(self):
+        artisan = User.objects.create_user(
+            user_type=User.UserType.ARTISAN,
+            email='potter@example.com',
+            phone_number='0755555555',
+            national_id='55555555',
+        )
+        portfolio = ArtisanPortfolio.objects.create(artisan_id=artisan, title='Pots', description='Clay')
+        self.assertIsNotNone(portfolio.pk)
+
+
+def daraja_response(data, status_code=200):
+    response = MagicMock(status_code=status_code, text=str(data))
+    response.json.return_value = data
+    if status_code >= 400:
+        response.raise_for_status.side_effect = Exception(f"HTTP {status_code}")
+    return response
+
+
+class DarajaTokenCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        daraja._local_tokens.clear()
+        daraja.circuit_breaker.record_success()
+        patcher = patch('api.daraja.get_session')
+        self.session = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+    def calls(self, method):
+        return [c for c in self.session.request.call_args_list if c.args[0] == method]
+
+    def test_token_is_fetched_once_and_shared(self):
+        self.session.request.side_effect = [
+            daraja_response({'access_token': 'token-1', 'expires_in': '3599'}),
+            daraja_response({'CheckoutRequestID': 'ws_CO_1'}),
+            daraja_response({'ConversationID': 'AG_1'}),
+        ]
+        DarajaAPI().stk_push('254700000000', 100, 'TX1', 'Order 1')
+        daraja._local_tokens.clear()
+        DarajaAPI().b2c_payment('254700000001', 100, 'TX1', 'Release')
+        self.assertEqual(len(self.calls('GET')), 1)
+        self.assertEqual(self.calls('POST')[-1].kwargs['headers']['Authorization'], 'Bearer token-1')
+
+    def test_rejected_token_is_refreshed_once(self):
+        self.session.request.side_effect = [
+            daraja_response({'access_token': 'stale', 'expires_in': '3599'}),
+            daraja_response({}, status_code=401),
+            daraja_response({'access_token': 'fresh', 'expires_in': '3599'}),
+            daraja_response({'ResponseCode': '0'}),
+        ]
+        self.assertEqual(DarajaAPI().stk_push('254700000000', 100, 'TX1', 'Order 1'), {'ResponseCode': '0'})
+        self.assertEqual(self.calls('POST')[-1].kwargs['headers']['Authorization'], 'Bearer fresh')
+
+
+@patch('api.daraja.time.sleep')
+class DarajaTransportTest(TestCase):
+    def setUp(self):
+        daraja.circuit_breaker.record_success()
+        self.addCleanup(daraja.circuit_breaker.record_success)
+        patcher = patch('api.daraja.get_session')
+        self.session = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        logger_patcher = patch('api.daraja.logger')
+        logger_patcher.start()
+        self.addCleanup(logger_patcher.stop)
+
+    def test_idempotent_calls_retry_transient_failures(self, sleep):
+        self.session.request.side_effect = [
+            requests.ReadTimeout(),
+            daraja_response({}, status_code=503),
+            daraja_response({'ok': True}),
+        ]
+        response = daraja.request('GET', 'https://daraja.test/oauth', idempotent=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.session.request.call_count, 3)
+        self.assertEqual(
+            self.session.request.call_args.kwargs['timeout'],
+            (settings.DARAJA_CONNECT_TIMEOUT, settings.DARAJA_READ_TIMEOUT),
+        )
+
+    def test_payment_requests_are_not_retried_after_sending(self, sleep):
+        self.session.request.side_effect = [requests.ReadTimeout()]
+        with self.assertRaises(requests.ReadTimeout):
+            daraja.request('POST', 'https://daraja.test/stkpush')
+        self.assertEqual(self.session.request.call_count, 1)
+
+    def test_circuit_opens_after_repeated_failures(self, sleep):
+        self.session.request.side_effect = requests.ConnectionError()
+        for _ in range(settings.DARAJA_CIRCUIT_FAILURE_THRESHOLD):
+            with self.assertRaises(requests.ConnectionError):
+                daraja.request('POST', 'https://daraja.test/stkpush')
+        with self.assertRaises(daraja.DarajaUnavailable):
+            daraja.request('POST', 'https://daraja.test/stkpush')
+        self.assertEqual(self.session.request.call_count, settings.DARAJA_CIRCUIT_FAILURE_THRESHOLD)
+
+
+class BuyerArtisanTestCase(TestCase):
+    """Starts each test with buyer Ann and artisan Max."""
+
+    def setUp(self):
+        self.buyer = User.objects.create_user(
+            user_type=User.UserType.BUYER, first_name="Ann", last_name="Buyer",
+            email="ann@example.com", phone_number="254700000001", national_id="11111111",
+        )
+        self.artisan = User.objects.create_user(
+            user_type=User.UserType.ARTISAN, first_name="Max", last_name="Maker",
+            email="max@example.com", phone_number="254700000002", national_id="22222222",
+        )
+
+
+class AsyncSTKPushTest(BuyerArtisanTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create(
+            buyer_id=self.buyer, artisan_id=self.artisan, order_type='ready-made', status='pending',
+            quantity=1, total_amount=Decimal("100.00"), payment_status='pending',
+        )
+        self.payload = {
+            'order_id': self.order.id, 'buyer_phone': '254700000001', 'amount': '100.00',
+            'transaction_code': 'TX-ASYNC-1', 'transaction_desc': 'Order 1',
+        }
+
+    def push(self):
+        request = APIRequestFactory().post('/daraja/stk-push/', self.payload, format='json', HTTP_PREFER='respond-async')
+        return STKPushView.as_view()(request)
+
+    @patch('api.tasks.DarajaAPI')
+    def test_push_is_queued_and_completed_by_worker(self, mock_daraja):
+        mock_daraja.return_value.stk_push.return_value = {'CheckoutRequestID': 'ws_CO_1', 'CustomerMessage': 'Sent'}
+        response = self.push()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'pending')
+        mock_daraja.return_value.stk_push.assert_not_called()
+
+        self.assertEqual(work(kinds=['stk_push']), 1)
+        poll = STKPushStatusView.as_view()(APIRequestFactory().get(response['Location']), pk=response.data['payment_id'])
+        self.assertEqual(poll.data['status'], 'pending')
+        self.assertEqual(poll.data['checkout_request_id'], 'ws_CO_1')
+
+    @patch('api.tasks.DarajaAPI')
+    def test_rejected_push_marks_payment_failed(self, mock_daraja):
+        mock_daraja.return_value.stk_push.return_value = {'errorMessage': 'Invalid PhoneNumber'}
+        payment_id = self.push().data['payment_id']
+        work(kinds=['stk_push'])
+        payment = Payment.objects.get(pk=payment_id)
+        self.assertEqual(payment.status, 'failed')
+        self.assertEqual(payment.result_description, 'Invalid PhoneNumber')
+        self.assertEqual(Job.objects.get(kind='stk_push').status, 'done')
+
+    @patch('api.jobs.logger')
+    @patch('api.tasks.DarajaAPI')
+    def test_unreachable_daraja_retries_then_fails_payment(self, mock_daraja, mock_logger):
+        mock_daraja.return_value.stk_push.side_effect = daraja.DarajaUnavailable('circuit open')
+        payment_id = self.push().data['payment_id']
+        work(kinds=['stk_push'])
+        job = Job.objects.get(kind='stk_push')
+        self.assertEqual(job.status, 'queued')
+        Job.objects.filter(pk=job.pk).update(attempts=job.max_attempts - 1, run_after=timezone.now())
+        work(kinds=['stk_push'])
+        self.assertEqual(Job.objects.get(pk=job.pk).status, 'failed')
+        self.assertEqual(Payment.objects.get(pk=payment_id).status, 'failed')
+
+    @patch('api.callbacks.logger')
+    @patch('api.views.DarajaAPI')
+    def test_sync_push_is_only_escrowed_by_a_successful_callback(self, mock_daraja, mock_logger):
+        mock_daraja.return_value.stk_push.return_value = {'CheckoutRequestID': 'ws_CO_1'}
+        request = APIRequestFactory().post('/daraja/stk-push/', self.payload, format='json')
+        self.assertEqual(STKPushView.as_view()(request).status_code, status.HTTP_200_OK)
+        payment = Payment.objects.get(transaction_code='TX-ASYNC-1')
+        self.assertEqual(payment.status, 'pending')
+        self.assertFalse(LedgerEntry.objects.exists())
+
+        daraja_callback(APIRequestFactory().post('/daraja/callback/', stk_callback('ws_CO_1', result_code=1032), format='json'))
+        process_callbacks()
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'failed')
+        self.assertEqual(held_for_artisan(self.artisan.pk), 0)
+
+    def test_unknown_order_is_rejected(self):
+        self.payload['order_id'] = self.order.id + 1000
+        self.assertEqual(self.push().status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Payment.objects.exists())
+
+    def test_taken_transaction_code_conflicts(self):
+        Payment.objects.create(
+            order_id=self.order, artisan_id=self.artisan, amount=Decimal("100.00"),
+            transaction_code='TX-ASYNC-1', artisan_phone='254700000002', status='held',
+        )
+        self.assertEqual(self.push().status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Job.objects.filter(kind='stk_push').exists())
+
+
+@patch('api.payouts.DarajaAPI')
+class ReleaseDuePaymentsTest(BuyerArtisanTestCase):
+    def payment(self, code, hours_ago, delivery_confirmed=False, status='held'):
+        order = Order.objects.create(
+            buyer_id=self.buyer, artisan_id=self.artisan, order_type='ready-made', status='pending',
+            quantity=1, total_amount=Decimal("100.00"), payment_status='pending',
+            delivery_confirmed=delivery_confirmed,
+        )
+        payment = Payment.objects.create(
+            order_id=order, artisan_id=self.artisan, amount=Decimal("100.00"),
+            transaction_code=code, artisan_phone='254700000002', status=status,
+        )
+        Payment.objects.filter(pk=payment.pk).update(paid_at=timezone.now() - timedelta(hours=hours_ago))
+        return payment
+
+    def test_only_due_unconfirmed_payments_are_paid_out(self, mock_daraja):
+        mock_daraja.return_value.b2c_payment.return_value = {'ConversationID': 'AG_DUE'}
+        due = self.payment('TX-DUE', 30)
+        recent = self.payment('TX-RECENT', 2)
+        confirmed = self.payment('TX-CONFIRMED', 30, delivery_confirmed=True)
+        locked = self.payment('TX-LOCKED', 30, status='releasing')
+
+        self.assertEqual(release_due_payments(workers=1, batch_size=1), 1)
+        self.assertEqual(mock_daraja.return_value.b2c_payment.call_count, 1)
+        statuses = dict(Payment.objects.values_list('transaction_code', 'status'))
+        self.assertEqual(statuses, {
+            due.transaction_code: 'releasing',
+            recent.transaction_code: 'held',
+            confirmed.transaction_code: 'held',
+            locked.transaction_code: 'releasing',
+        })
+        self.assertEqual(Payment.objects.get(pk=due.pk).b2c_conversation_id, 'AG_DUE')
+
+    def test_payout_that_never_left_returns_payment_to_held(self, mock_daraja):
+        mock_daraja.return_value.b2c_payment.side_effect = requests.ConnectTimeout()
+        payment = self.payment('TX-FAIL', 30)
+        with patch('api.payouts.logger'):
+            self.assertEqual(release_due_payments(workers=1), 0)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'held')
+        self.assertIsNone(payment.released_at)
+
+    def test_payout_that_may_have_reached_daraja_stays_releasing(self, mock_daraja):
+        mock_daraja.return_value.b2c_payment.side_effect = requests.ReadTimeout()
+        payment = self.payment('TX-MAYBE', 30)
+        with patch('api.payouts.logger'):
+            self.assertEqual(release_due_payments(workers=1), 0)
+            self.assertEqual(release_due_payments(workers=1), 0)
+        self.assertEqual(Payment.objects.get(pk=payment.pk).status, 'releasing')
+        self.assertEqual(mock_daraja.return_value.b2c_payment.call_count, 1)
+
+
+def stk_callback(checkout_request_id, result_code=0, receipt='QWE123'):
+    body = {'CheckoutRequestID': checkout_request_id, 'ResultCode': result_code, 'ResultDesc': 'Done'}
+    if result_code == 0:
+        body['CallbackMetadata'] = {'Item': [
+            {'Name': 'Amount', 'Value': 100},
+            {'Name': 'MpesaReceiptNumber', 'Value': receipt},
+            {'Name': 'TransactionDate', 'Value': 20260101120000},
+            {'Name': 'PhoneNumber', 'Value': 254700000001},
+        ]}
+    return {'Body': {'stkCallback': body}}
+
+
+class DarajaCallbackInboxTest(TestCase):
+    def setUp(self):
+        self.pending = Payment.objects.create(
+            amount=Decimal("100.00"), transaction_code='TX-1', checkout_request_id='ws_CO_1', status='pending',
+        )
+        self.cancelled = Payment.objects.create(
+            amount=Decimal("50.00"), transaction_code='TX-2', checkout_request_id='ws_CO_2', status='pending',
+        )
+
+    def post_callback(self, payload):
+        request = APIRequestFactory().post('/daraja/callback/', payload, format='json')
+        return daraja_callback(request)
+
+    @patch('api.callbacks.logger')
+    def test_callbacks_are_stored_then_applied_in_a_batch(self, mock_logger):
+        self.post_callback(stk_callback('ws_CO_1'))
+        self.post_callback(stk_callback('ws_CO_2', result_code=1032))
+        self.post_callback({'unexpected': True})
+        self.assertEqual(Payment.objects.get(pk=self.pending.pk).status, 'pending')
+
+        self.assertEqual(process_callbacks(), 3)
+        self.pending.refresh_from_db()
+        self.assertEqual(self.pending.status, 'held')
+        self.assertEqual(self.pending.mpesa_receipt_number, 'QWE123')
+        self.assertEqual(Payment.objects.get(pk=self.cancelled.pk).status, 'failed')
+        self.assertEqual(
+            dict(DarajaCallback.objects.values_list('status').annotate(n=Count('id'))),
+            {'processed': 2, 'failed': 1},
+        )
+
+    def test_replay_does_not_undo_a_release(self):
+        self.post_callback(stk_callback('ws_CO_1'))
+        process_callbacks()
+        Payment.objects.filter(pk=self.pending.pk).update(status='released')
+        self.assertEqual(replay_callbacks(DarajaCallback.objects.all()), 1)
+        process_callbacks()
+        self.assertEqual(Payment.objects.get(pk=self.pending.pk).status, 'released')
+        self.assertEqual(DarajaCallback.objects.get().status, 'processed')
+
+
+class IdempotencyTest(BuyerArtisanTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create(
+            buyer_id=self.buyer, artisan_id=self.artisan, order_type='ready-made', status='pending',
+            quantity=1, total_amount=Decimal("100.00"), payment_status='pending',
+        )
+        Payment.objects.create(
+            order_id=self.order, artisan_id=self.artisan, amount=Decimal("100.00"),
+            transaction_code='TX-1', artisan_phone='254700000002', status='held',
+        )
+
+    def confirm(self, key=None, payload=None):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        request = APIRequestFactory().post(
+            '/delivery/confirm/', payload or {'order_id': self.order.id}, format='json', **headers
+        )
+        return DeliveryConfirmView.as_view()(request)
+
+    def test_retried_confirmation_replays_stored_response(self):
+        first = self.confirm(key='confirm-1')
+        second = self.confirm(key='confirm-1')
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(second.status_code, 202)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Job.objects.filter(kind='b2c_payout').count(), 1)
+
+    def test_key_reused_with_different_body_is_rejected(self):
+        IdempotencyKey.objects.create(
+            scope='delivery-confirm', key='confirm-2', request_hash='other', status='completed',
+            response_status=200, response_body={},
+        )
+        self.assertEqual(self.confirm(key='confirm-2').status_code, 422)
+
+    def test_concurrent_duplicate_gets_conflict(self):
+        request = APIRequestFactory().post('/delivery/confirm/', {'order_id': self.order.id}, format='json')
+        IdempotencyKey.objects.create(
+            scope='delivery-confirm', key=f'derived:{self.order.id}',
+            request_hash=request_fingerprint(DeliveryConfirmView().initialize_request(request)),
+        )
+        self.assertEqual(self.confirm().status_code, 409)
+
+    def test_duplicate_callback_is_stored_once(self):
+        for _ in range(2):
+            response = daraja_callback(APIRequestFactory().post('/daraja/callback/', stk_callback('ws_CO_9'), format='json'))
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(DarajaCallback.objects.count(), 1)
+
+
+class DarajaSimulatorTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        daraja._local_tokens.clear()
+        daraja.circuit_breaker.record_success()
+        self.sent = []
+        self.server = DarajaSimulator(('127.0.0.1', 0), SimulatorConfig(callback_delay=0))
+        self.server.send_callback = lambda url, body, checkout_request_id=None: self.sent.append((url, body))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_stk_push_against_simulator_fires_callback(self):
+        with override_settings(DARAJA_BASE_URL=self.server.url, DARAJA_CALLBACK_URL='http://app.test/daraja/callback/'):
+            response = DarajaAPI().stk_push('254700000001', 100, 'TX1', 'Order 1')
+        self.assertEqual(response['ResponseCode'], '0')
+        self.server.callbacks.shutdown(wait=True)
+        url, body = self.sent[0]
+        self.assertEqual(url, 'http://app.test/daraja/callback/')
+        self.assertEqual(body['Body']['stkCallback']['CheckoutRequestID'], response['CheckoutRequestID'])
+        self.assertEqual(body['Body']['stkCallback']['ResultCode'], 0)
+        self.assertEqual(self.server.stats['requests'], 2)
+
+    @patch('api.simulator.requests.post')
+    def test_stk_results_are_dropped_once_delivered_or_expired(self, mock_post):
+        self.server.config.result_ttl = 0
+        self.server.remember_stk_result('ws_CO_OLD', {})
+        self.server.remember_stk_result('ws_CO_NEW', {})
+        self.assertEqual(list(self.server.stk_results), ['ws_CO_NEW'])
+        DarajaSimulator.send_callback(self.server, 'http://app.test/daraja/callback/', {}, 'ws_CO_NEW')
+        self.assertEqual(self.server.stk_results, {})
+
+    def test_stk_and_b2c_urls_are_overridden_separately(self):
+        self.server.config.stk_callback_url = 'http://app.test/stk/'
+        with override_settings(DARAJA_BASE_URL=self.server.url, DARAJA_B2C_RESULT_URL='http://app.test/b2c/'):
+            api = DarajaAPI()
+            api.stk_push('254700000001', 100, 'TX1', 'Order 1')
+            api.b2c_payment('254700000002', 100, 'TX1', 'Payout')
+        self.server.callbacks.shutdown(wait=True)
+        self.assertCountEqual([url for url, _ in self.sent], ['http://app.test/stk/', 'http://app.test/b2c/'])
+
+
+class StkReconcileTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        daraja._local_tokens.clear()
+        daraja.circuit_breaker.record_success()
+        self.server = DarajaSimulator(('127.0.0.1', 0), SimulatorConfig(callback_delay=0, drop_callback_rate=1.0))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        settings_override = override_settings(DARAJA_BASE_URL=self.server.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def pushed_payment(self, code, seconds_ago=600):
+        checkout_request_id = DarajaAPI().stk_push('254700000001', 100, code, 'Order')['CheckoutRequestID']
+        return Payment.objects.create(
+            amount=Decimal("100.00"), transaction_code=code, checkout_request_id=checkout_request_id,
+            status='pending', created_at=timezone.now() - timedelta(seconds=seconds_ago),
+        )
+
+    def test_lost_callback_is_recovered_through_the_inbox(self):
+        stale = self.pushed_payment('TX-STALE')
+        fresh = self.pushed_payment('TX-FRESH', seconds_ago=5)
+        self.assertEqual(reconcile_metrics()['stale_pending_payments'], 1)
+
+        self.assertEqual(reconcile_pending(workers=1), 1)
+        self.assertEqual(reconcile_metrics()['inbox_backlog'], 1)
+        process_callbacks()
+        self.assertEqual(Payment.objects.get(pk=stale.pk).status, 'held')
+        self.assertEqual(Payment.objects.get(pk=fresh.pk).status, 'pending')
+        self.assertEqual(reconcile_metrics()['stale_pending_payments'], 0)
+
+    def test_unanswered_push_stays_pending_and_is_not_requeried_immediately(self):
+        self.server.config.callback_delay = 3600
+        payment = self.pushed_payment('TX-WAITING')
+        self.assertEqual(reconcile_pending(workers=1), 1)
+        self.assertEqual(reconcile_pending(workers=1), 0)
+        self.assertEqual(DarajaCallback.objects.count(), 0)
+        self.assertEqual(Payment.objects.get(pk=payment.pk).status, 'pending')
+        self.assertFalse(daraja.circuit_breaker.is_open)
+
+
+
+def b2c_result(conversation_id, result_code=0):
+    return {'Result': {
+        'ResultType': 0, 'ResultCode': result_code, 'ResultDesc': 'Done',
+        'OriginatorConversationID': 'sim-1', 'ConversationID': conversation_id, 'TransactionID': 'SIM1',
+    }}
+
+
+@patch('api.payouts.DarajaAPI')
+class B2CSettlementTest(BuyerArtisanTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create(
+            buyer_id=self.buyer, artisan_id=self.artisan, order_type='ready-made', status='pending',
+            quantity=1, total_amount=Decimal("100.00"), payment_status='pending',
+        )
+        self.payment = Payment.objects.create(
+            order_id=self.order, artisan_id=self.artisan, amount=Decimal("100.00"),
+            transaction_code='TX-1', artisan_phone='254700000002', status='held',
+        )
+
+    def confirm(self):
+        request = APIRequestFactory().post('/delivery/confirm/', {'order_id': self.order.id}, format='json')
+        return DeliveryConfirmView.as_view()(request)
+
+    def post_result(self, view, payload):
+        return view(APIRequestFactory().post('/daraja/b2c/result/', payload, format='json'))
+
+    def test_confirmation_queues_payout_and_result_settles_it(self, mock_daraja):
+        mock_daraja.return_value.b2c_payment.return_value = {'ConversationID': 'AG_1'}
+        response = self.confirm()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        mock_daraja.return_value.b2c_payment.assert_not_called()
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, 'releasing')
+
+        work(kinds=['b2c_payout'])
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).b2c_conversation_id, 'AG_1')
+        self.post_result(b2c_result_callback, b2c_result('AG_1'))
+        process_callbacks()
+        payment = Payment.objects.get(pk=self.payment.pk)
+        self.assertEqual(payment.status, 'released')
+        self.assertFalse(payment.held_by_platform)
+        self.assertIsNotNone(payment.released_at)
+
+    def test_confirmation_waits_for_the_payment_to_be_held(self, mock_daraja):
+        Payment.objects.filter(pk=self.payment.pk).update(status='pending')
+        self.assertEqual(self.confirm().status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Order.objects.get(pk=self.order.pk).delivery_confirmed)
+        Payment.objects.filter(pk=self.payment.pk).update(status='held')
+        self.assertEqual(self.confirm().status_code, status.HTTP_202_ACCEPTED)
+
+    def test_timeout_marks_payout_failed(self, mock_daraja):
+        mock_daraja.return_value.b2c_payment.return_value = {'ConversationID': 'AG_2'}
+        self.confirm()
+        work(kinds=['b2c_payout'])
+        self.post_result(b2c_timeout_callback, b2c_result('AG_2', result_code=1))
+        process_callbacks()
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, 'payout_failed')
+        self.assertEqual(retry_failed_payouts([self.payment.pk]), 1)
+        payment = Payment.objects.get(pk=self.payment.pk)
+        self.assertEqual((payment.status, payment.b2c_conversation_id), ('releasing', None))
+        mock_daraja.return_value.b2c_payment.return_value = {'ConversationID': 'AG_2B'}
+        work(kinds=['b2c_payout'])
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).b2c_conversation_id, 'AG_2B')
+
+    @patch('api.callbacks.logger')
+    def test_result_arriving_before_conversation_id_is_replayed(self, mock_logger, mock_daraja):
+        def b2c_payment(**kwargs):
+            self.post_result(b2c_result_callback, b2c_result('AG_3'))
+            process_callbacks()
+            return {'ConversationID': 'AG_3'}
+
+        mock_daraja.return_value.b2c_payment.side_effect = b2c_payment
+        self.confirm()
+        work(kinds=['b2c_payout'])
+        self.assertEqual(DarajaCallback.objects.get().status, 'pending')
+        process_callbacks()
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, 'released')
+
+
+@override_settings(NOTIFICATION_POLL_SECONDS=0.01)
+class PaymentStatusStreamTest(BuyerArtisanTestCase):
+    def setUp(self):
+        super().setUp()
+        order = Order.objects.create(
+            buyer_id=self.buyer, artisan_id=self.artisan, order_type='ready-made', status='pending',
+            quantity=1, total_amount=Decimal("100.00"), payment_status='pending',
+        )
+        self.payment = Payment.objects.create(
+            order_id=order, artisan_id=self.artisan, amount=Decimal("100.00"), transaction_code='TX-WAIT',
+            checkout_request_id='ws_CO_W', status='pending',
+        )
+        self.token = Token.objects.create(user=self.buyer)
+
+    def get(self, path, headers=None, token=None, transaction_code='TX-WAIT'):
+        headers = dict(headers or {}, Authorization=f'Token {(token or self.token).key}')
+        return payment_status(AsyncRequestFactory().get(path, headers=headers), transaction_code=transaction_code)
+
+    async def settle_later(self, new_status, delay=0.05):
+        await asyncio.sleep(delay)
+        await Payment.objects.filter(pk=self.payment.pk).aupdate(status=new_status)
+
+    async def test_long_poll_returns_immediately_when_status_differs(self):
+        response = await self.get('/api/payment-status/TX-WAIT/?since=held')
+        self.assertEqual(json.loads(response.content)['status'], 'pending')
+
+    async def test_long_poll_wakes_when_another_process_settles_payment(self):
+        started = time.monotonic()
+        task = asyncio.ensure_future(self.settle_later('held'))
+        response = await self.get('/api/payment-status/TX-WAIT/?wait=5')
+        await task
+        self.assertEqual(json.loads(response.content)['status'], 'held')
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(hub.watched_keys('payment'), set())
+
+    async def test_long_poll_times_out_with_current_state(self):
+        response = await self.get('/api/payment-status/TX-WAIT/?wait=0.05')
+        self.assertEqual(json.loads(response.content)['status'], 'pending')
+
+    async def test_event_stream_sends_changes_until_settled(self):
+        task = asyncio.ensure_future(self.settle_later('failed'))
+        response = await self.get('/api/payment-status/TX-WAIT/?wait=5', headers={'Accept': 'text/event-stream'})
+        events = [chunk async for chunk in response.streaming_content]
+        await task
+        statuses = [json.loads(event.decode().split('data: ')[1])['status'] for event in events if b'data: ' in event]
+        self.assertEqual(statuses, ['pending', 'failed'])
+
+    async def test_unknown_transaction_code_is_404(self):
+        response = await self.get('/', transaction_code='nope')
+        self.assertEqual(response.status_code, 404)
+
+    # The session and CSRF middleware need a SECRET_KEY, which tests run without.
+    @override_settings(MIDDLEWARE=[])
+    async def test_routed_endpoint_answers_get_only(self):
+        url = reverse('payment-status', args=['TX-WAIT'])
+        headers = {'Authorization': f'Token {self.token.key}'}
+        response = await self.async_client.get(f'{url}?since=held', headers=headers)
+        self.assertEqual(json.loads(response.content)['status'], 'pending')
+        response = await self.async_client.post(url, headers=headers)
+        self.assertEqual(response.status_code, 405)
+
+    async def test_only_the_buyer_and_artisan_may_watch(self):
+        response = await payment_status(AsyncRequestFactory().get('/?wait=0'), transaction_code='TX-WAIT')
+        self.assertEqual(response.status_code, 401)
+        artisan_token = await Token.objects.acreate(user=self.artisan)
+        response = await self.get('/?wait=0', token=artisan_token)
+        self.assertEqual(json.loads(response.content)['status'], 'pending')
+        stranger = await User.objects.acreate(
+            user_type=User.UserType.BUYER, first_name="Bea", last_name="Buyer",
+            email="bea@example.com", phone_number="254700000003", national_id="33333333",
+        )
+        response = await self.get('/?wait=0', token=await Token.objects.acreate(user=stranger))
+        self.assertEqual(response.status_code, 404)
+
+
+class EscrowLedgerTest(BuyerArtisanTestCase):
+    def setUp(self):
+        super().setUp()
+        self.first = Payment.objects.create(
+            artisan_id=self.artisan, amount=Decimal("100.00"), transaction_code='TX-1',
+            checkout_request_id='ws_CO_1', status='pending',
+        )
+        self.second = Payment.objects.create(
+            artisan_id=self.artisan, amount=Decimal("100.00"), transaction_code='TX-2',
+            checkout_request_id='ws_CO_2', status='pending',
+        )
+
+    def callback(self, kind, payload):
+        record_callback(kind, payload)
+        process_callbacks()
+
+    def test_balances_follow_status_transitions(self):
+        self.callback('stk', stk_callback('ws_CO_1'))
+        self.callback('stk', stk_callback('ws_CO_2', receipt='QWE124'))
+        self.assertEqual(held_for_artisan(self.artisan.pk), Decimal("200.00"))
+        self.assertEqual(platform_float(), Decimal("200.00"))
+
+        Payment.objects.filter(pk=self.first.pk).update(status='releasing', b2c_conversation_id='AG_1')
+        self.callback('b2c_result', b2c_result('AG_1'))
+        self.assertEqual(held_for_artisan(self.artisan.pk), Decimal("100.00"))
+        self.assertEqual(platform_float(), Decimal("100.00"))
+        self.assertEqual(ledger_drift(), {})
+        self.assertEqual(
+            list(LedgerEntry.objects.filter(payment=self.first).values_list('kind', flat=True).order_by('id')),
+            ['deposit', 'withdrawal'],
+        )
+
+    def test_replayed_and_failed_callbacks_do_not_move_money(self):
+        self.callback('stk', stk_callback('ws_CO_1'))
+        replay_callbacks(DarajaCallback.objects.all())
+        process_callbacks()
+        self.callback('stk', stk_callback('ws_CO_2', result_code=1032))
+        self.assertEqual(LedgerEntry.objects.count(), 1)
+        self.assertEqual(held_for_artisan(self.artisan.pk), Decimal("100.00"))
+
+    def test_snapshot_copies_running_balances(self):
+        self.callback('stk', stk_callback('ws_CO_1'))
+        self.assertEqual(take_snapshot(), 2)
+        snapshot = BalanceSnapshot.objects.get(account=PLATFORM_FLOAT)
+        self.assertEqual(snapshot.balance, Decimal("100.00"))
+        self.assertEqual(snapshot.last_entry_id, LedgerEntry.objects.get().id)
+
+
+class ArchiveHistoryTest(BuyerArtisanTestCase):
+    def setUp(self):
+        super().setUp()
+        self.old = timezone.now() - timedelta(days=400)
+
+    def order(self, status='completed', rated=False):
+        order = Order.objects.create(
+            buyer_id=self.buyer, artisan_id=self.artisan, order_type='ready-made', status=status,
+            quantity=1, total_amount=Decimal("100.00"), delivery_confirmed=True,
+        )
+        OrderTracking.objects.create(order_id=order, artisan_id=self.artisan, status='completed')
+        if rated:
+            Rating.objects.create(order_id=order, buyer_id=self.buyer, rating=5)
+        Order.objects.filter(pk=order.pk).update(updated_at=self.old)
+        return order
+
+    def payment(self, order, code, status='released'):
+        payment = Payment.objects.create(
+            order_id=order, artisan_id=self.artisan, amount=Decimal("100.00"), transaction_code=code,
+            status=status, created_at=self.old,
+        )
+        LedgerEntry.objects.create(
+            payment=payment, kind='deposit', transition='held', amount=payment.amount,
+            debit_account=PLATFORM_FLOAT, credit_account='escrow:artisan:1',
+        )
+        return payment
+
+    def list_payments(self, query=''):
+        request = APIRequestFactory().get(f'/api/payment/{query}')
+        return PaymentViewSet.as_view({'get': 'list'})(request)
+
+    def test_settled_history_moves_to_archive(self):
+        settled = self.payment(self.order(), 'TX-OLD')
+        held = self.payment(self.order(), 'TX-HELD', status='held')
+        payout_failed = self.payment(self.order(), 'TX-PAYOUT', status='payout_failed')
+        rated = self.order(rated=True)
+        archived_order_id = settled.order_id_id
+
+        self.assertEqual(archive_payments(archive_cutoff(6)), 1)
+        self.assertEqual(archive_orders(archive_cutoff(6)), 1)
+
+        self.assertFalse(Payment.objects.filter(pk=settled.pk).exists())
+        self.assertTrue(Payment.objects.filter(pk=held.pk).exists())
+        self.assertTrue(Payment.objects.filter(pk=payout_failed.pk).exists())
+        self.assertTrue(Order.objects.filter(pk=rated.pk).exists())
+        self.assertEqual(LedgerEntry.objects.filter(payment_id=settled.pk).count(), 1)
+        archived_order = ArchivedOrder.objects.get(pk=archived_order_id)
+        self.assertEqual(archived_order.buyer_id, self.buyer.pk)
+        self.assertEqual(archived_order.data['tracking'][0]['status'], 'completed')
+
+    def test_archive_is_only_served_when_asked_for(self):
+        settled = self.payment(self.order(), 'TX-OLD')
+        self.payment(self.order(), 'TX-HELD', status='held')
+        archive_payments(archive_cutoff(6))
+
+        self.assertEqual([row['transaction_code'] for row in self.list_payments().data], ['TX-HELD'])
+        rows = self.list_payments('?include_archived=1').data
+        self.assertEqual([(row['transaction_code'], row.get('archived', False)) for row in rows],
+                         [('TX-HELD', False), ('TX-OLD', True)])
+        detail = PaymentViewSet.as_view({'get': 'retrieve'})(
+            APIRequestFactory().get(f'/api/payment/{settled.pk}/?include_archived=1'), pk=settled.pk,
+        )
+        self.assertEqual(detail.data['transaction_code'], 'TX-OLD')
+
+
+class OrderListTest(BuyerArtisanTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_buyer = User.objects.create_user(
+            user_type=User.UserType.BUYER, first_name="Bea", last_name="Buyer",
+            email="bea@example.com", phone_number="254700000003", national_id="33333333",
+        )
+        now = timezone.now()
+        for index in range(5):
+            order = Order.objects.create(
+                buyer_id=self.buyer, artisan_id=self.artisan, order_type='ready-made',
+                status='completed' if index % 2 else 'pending', quantity=1, total_amount=Decimal("10.00"),
+            )
+            Order.objects.filter(pk=order.pk).update(created_at=now - timedelta(minutes=index))
+        Order.objects.create(
+            buyer_id=self.other_buyer, artisan_id=self.artisan, order_type='ready-made',
+            quantity=1, total_amount=Decimal("10.00"),
+        )
+
+    def list_orders(self, user, query=''):
+        request = APIRequestFactory().get(f'/api/orders/{query}')
+        force_authenticate(request, user=user)
+        return OrderViewSet.as_view({'get': 'list'})(request)
+
+    def test_orders_are_scoped_to_the_requesting_user(self):
+        self.assertEqual(len(self.list_orders(self.buyer).data['results']), 5)
+        self.assertEqual(len(self.list_orders(self.other_buyer).data['results']), 1)
+        self.assertEqual(len(self.list_orders(self.artisan).data['results']), 6)
+        pending = self.list_orders(self.artisan, '?status=pending').data['results']
+        self.assertEqual({row['status'] for row in pending}, {'pending'})
+
+    def test_cursor_pages_walk_newest_first_without_overlap(self):
+        first = self.list_orders(self.buyer, '?page_size=2').data
+        self.assertIsNone(first['previous'])
+        seen = [row['id'] for row in first['results']]
+        next_url = first['next']
+        while next_url:
+            page = self.list_orders(self.buyer, '?' + next_url.split('?', 1)[1]).data
+            seen.extend(row['id'] for row in page['results'])
+            next_url = page['next']
+        expected = list(Order.objects.filter(buyer_id=self.buyer).order_by('-created_at').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_archived_orders_page_alongside_live_ones(self):
+        old = timezone.now() - timedelta(days=400)
+        for pk in range(9001, 9004):
+            ArchivedOrder.objects.create(
+                id=pk, buyer_id=self.buyer.pk, artisan_id=self.artisan.pk, status='completed',
+                created_at=old + timedelta(minutes=pk), data={'id': pk},
+            )
+        first = self.list_orders(self.buyer, '?page_size=2&include_archived=1').data
+        self.assertEqual([row['id'] for row in first['archived']], [9003, 9002])
+        second = self.list_orders(self.buyer, '?' + first['archived_next'].split('?', 1)[1]).data
+        self.assertEqual([row['id'] for row in second['archived']], [9001])
+        self.assertIsNone(second['archived_next'])
+
+
+class StateTransitionTest(BuyerArtisanTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create(
+            buyer_id=self.buyer, artisan_id=self.artisan, order_type='ready-made',
+            quantity=1, total_amount=Decimal("100.00"),
+        )
+        self.payment = Payment.objects.create(
+            order_id=self.order, artisan_id=self.artisan, amount=Decimal("100.00"),
+            transaction_code='TX-1', artisan_phone='254700000002', status='held',
+        )
+
+    def post(self, view, user, pk):
+        request = APIRequestFactory().post('/')
+        force_authenticate(request, user=user)
+        return view(request, pk=pk)
+
+    def test_transition_only_moves_rows_in_a_source_state(self):
+        self.assertEqual(transitions.payments.apply('claim_release', {'pk': self.payment.pk}), 1)
+        self.assertEqual(transitions.payments.apply('claim_release', {'pk': self.payment.pk}), 0)
+        self.assertEqual(transitions.payments.apply('refund', {'pk': self.payment.pk}), 0)
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, 'releasing')
+
+    @patch('api.payouts.DarajaAPI')
+    def test_second_delivery_confirmation_does_not_queue_another_payout(self, mock_daraja):
+        confirm = DeliveryConfirmView.as_view()
+        first = confirm(APIRequestFactory().post('/delivery/confirm/', {'order_id': self.order.id}, format='json'))
+        second = confirm(APIRequestFactory().post(
+            '/delivery/confirm/', {'order_id': self.order.id}, format='json', HTTP_IDEMPOTENCY_KEY='retry',
+        ))
+        self.assertEqual(first.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(second.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Job.objects.filter(kind='b2c_payout').count(), 1)
+
+    def test_refund_endpoint_refunds_held_payment_once(self):
+        def refund():
+            request = APIRequestFactory().post(
+                '/payment/refund/', {'order_id': self.order.id, 'reason': 'Damaged'}, format='json',
+            )
+            return RefundPaymentView.as_view()(request)
+
+        self.assertEqual(refund().status_code, status.HTTP_200_OK)
+        payment = Payment.objects.get(pk=self.payment.pk)
+        self.assertEqual((payment.status, payment.refunded_reason, payment.held_by_platform), ('refunded', 'Damaged', False))
+        self.assertEqual(refund().status_code, status.HTTP_409_CONFLICT)
+
+    def test_confirm_payment_and_accept_request_are_single_shot(self):
+        confirm = OrderViewSet.as_view({'post': 'confirm_payment'})
+        self.assertEqual(self.post(confirm, self.artisan, self.order.pk).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.post(confirm, self.buyer, self.order.pk).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.post(confirm, self.buyer, self.order.pk).status_code, status.HTTP_400_BAD_REQUEST)
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual((order.payment_status, order.status), ('completed', 'accepted'))
+
+        custom_request = CustomDesignRequest.objects.create(
+            buyer_id=self.buyer, artisan_id=self.artisan, description="Chair",
+            deadline=timezone.now().date(), status='material-sourcing',
+            quote_amount=Decimal("200.00"), material_price=Decimal("50.00"), labour_price=Decimal("50.00"),
+        )
+        accept = CustomDesignRequestViewSet.as_view({'post': 'accept_request'})
+        self.assertEqual(self.post(accept, self.artisan, custom_request.pk).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.post(accept, self.artisan, custom_request.pk).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class OrderTimelineTest(BuyerArtisanTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create(
+            buyer_id=self.buyer, artisan_id=self.artisan, order_type='ready-made',
+            quantity=1, total_amount=Decimal("100.00"),
+        )
+
+    def get(self, action, user, query=''):
+        request = APIRequestFactory().get(f'/api/orders/{self.order.pk}/{action}/{query}')
+        force_authenticate(request, user=user)
+        return OrderViewSet.as_view({'get': action.replace('-', '_')})(request, pk=self.order.pk)
+
+    def add_tracking(self, status_value):
+        request = APIRequestFactory().post(
+            '/api/trackings/', {'order_id': self.order.pk, 'status': status_value}, format='json',
+        )
+        force_authenticate(request, user=self.artisan)
+        return OrderTrackingViewSet.as_view({'post': 'create'})(request)
+
+    def approve(self, tracking_id, user):
+        request = APIRequestFactory().post(f'/api/trackings/{tracking_id}/approve/')
+        force_authenticate(request, user=user)
+        return OrderTrackingViewSet.as_view({'post': 'approve'})(request, pk=tracking_id)
+
+    def test_only_the_buyer_approves_an_upload(self):
+        tracking_id = self.add_tracking('in-progress').data['id']
+        self.assertEqual(self.approve(tracking_id, self.artisan).status_code, status.HTTP_403_FORBIDDEN)
+        response = self.approve(tracking_id, self.buyer)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['buyer_approval'])
+        approved_at = response.data['approval_timestamp']
+        self.assertIsNotNone(approved_at)
+        self.assertEqual(self.approve(tracking_id, self.buyer).data['approval_timestamp'], approved_at)
+
+    def test_inserts_advance_latest_tracking(self):
+        self.assertIsNone(self.get('latest-tracking', self.buyer).data['tracking'])
+        for status_value in ('pending', 'in-progress', 'completed'):
+            self.assertEqual(self.add_tracking(status_value).status_code, status.HTTP_201_CREATED)
+        with self.assertNumQueries(1):
+            response = self.get('latest-tracking', self.buyer)
+        self.assertEqual(response.data['tracking']['status'], 'completed')
+
+    def test_timeline_pages_oldest_first(self):
+        for status_value in ('pending', 'in-progress', 'completed'):
+            self.add_tracking(status_value)
+        with self.assertNumQueries(1):
+            first = self.get('timeline', self.buyer, '?page_size=2')
+        self.assertEqual([row['status'] for row in first.data['results']], ['pending', 'in-progress'])
+        rest = self.get('timeline', self.buyer, '?' + first.data['next'].split('?', 1)[1])
+        self.assertEqual([row['status'] for row in rest.data['results']], ['completed'])
+
+    def test_tracking_is_append_only_and_scoped(self):
+        request = APIRequestFactory().post('/api/trackings/', {'order_id': self.order.pk, 'status': 'pending'}, format='json')
+        force_authenticate(request, user=self.buyer)
+        self.assertEqual(OrderTrackingViewSet.as_view({'post': 'create'})(request).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(hasattr(OrderTrackingViewSet, 'update'))
+        self.assertFalse(hasattr(OrderTrackingViewSet, 'destroy'))
+        outsider = User.objects.create_user(
+            user_type=User.UserType.BUYER, first_name="Bea", last_name="Buyer",
+            email="bea@example.com", phone_number="254700000003", national_id="33333333",
+        )
+        self.add_tracking('pending')
+        self.assertEqual(self.get('timeline', outsider).data['results'], [])
+
+
+class OrderUpdatesStreamTest(BuyerArtisanTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create(
+            buyer_id=self.buyer, artisan_id=self.artisan, order_type='ready-made',
+            quantity=1, total_amount=Decimal("100.00"),
+        )
+        Order.objects.create(
+            buyer_id=self.buyer, artisan_id=self.artisan, order_type='ready-made', status='completed',
+            quantity=1, total_amount=Decimal("100.00"),
+        )
+        self.token = Token.objects.create(user=self.buyer)
+
+    def stream(self, query='?wait=0.5'):
+        request = AsyncRequestFactory().get(
+            f'/api/order-updates/{query}', headers={'Authorization': f'Token {self.token.key}'},
+        )
+        return order_updates(request)
+
+    async def read_events(self, response):
+        events = []
+        async for chunk in response.streaming_content:
+            if b'data: ' in chunk:
+                event, data = chunk.decode().split('\n')[:2]
+                events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+        return events
+
+    def add_trackings(self, *statuses):
+        with self.captureOnCommitCallbacks(execute=True):
+            for status_value in statuses:
+                OrderTracking.objects.create(order_id=self.order, artisan_id=self.artisan, status=status_value)
+
+    @override_settings(MIDDLEWARE=[])
+    async def test_routed_endpoint_answers_get_only(self):
+        url = reverse('order-updates')
+        headers = {'Authorization': f'Token {self.token.key}'}
+        response = await self.async_client.get(f'{url}?wait=0', headers=headers)
+        events = await self.read_events(response)
+        self.assertEqual([(event, data['id']) for event, data in events], [('order', self.order.pk)])
+        response = await self.async_client.post(url, headers=headers)
+        self.assertEqual(response.status_code, 405)
+
+    @override_settings(NOTIFICATION_POLL_SECONDS=60)
+    async def test_new_tracking_rows_are_pushed_in_process(self):
+        response = await self.stream()
+
+        async def insert_later():
+            await asyncio.sleep(0.05)
+            await sync_to_async(self.add_trackings)('in-progress')
+
+        task = asyncio.ensure_future(insert_later())
+        events = await self.read_events(response)
+        await task
+        self.assertEqual(events[0], ('order', {
+            'id': self.order.pk, 'status': 'pending', 'payment_status': 'pending',
+            'delivery_confirmed': False, 'latest_tracking_id': None,
+        }))
+        self.assertEqual([(event, data['status']) for event, data in events[1:]],
+                         [('tracking', 'in-progress'), ('order', 'pending')])
+
+    @override_settings(NOTIFICATION_POLL_SECONDS=0.05)
+    async def test_changes_from_other_workers_are_polled(self):
+        response = await self.stream(f'?order={self.order.pk}&wait=0.5')
+
+        def change():
+            OrderTracking.objects.create(order_id=self.order, artisan_id=self.artisan)
+            Order.objects.filter(pk=self.order.pk).update(status='accepted')
+
+        async def change_later():
+            await asyncio.sleep(0.05)
+            await sync_to_async(change)()
+
+        task = asyncio.ensure_future(change_later())
+        events = await self.read_events(response)
+        await task
+        self.assertEqual([(event, data['status']) for event, data in events],
+                         [('order', 'pending'), ('tracking', 'pending'), ('order', 'accepted')])
+
+    async def test_requires_authentication_and_ownership(self):
+        response = await order_updates(AsyncRequestFactory().get('/api/order-updates/'))
+        self.assertEqual(response.status_code, 401)
+        other = await Order.objects.acreate(
+            buyer_id=self.artisan, artisan_id=self.artisan, order_type='ready-made',
+            quantity=1, total_amount=Decimal("1.00"),
+        )
+        self.assertEqual((await self.stream(f'?order={other.pk}')).status_code, 404)
+
+
+class ArtisanMetricsTest(BuyerArtisanTestCase):
+    def setUp(self):
+        super().setUp()
+        self.profile = ArtisanProfile.objects.create(user=self.artisan)
+
+    def order(self, status='pending'):
+        return Order.objects.create(
+            buyer_id=self.buyer, artisan_id=self.artisan, order_type='ready-made', status=status,
+            quantity=1, total_amount=Decimal("100.00"),
+        )
+
+    def test_counters_follow_order_and_rating_events(self):
+        completed = self.order()
+        rejected = self.order()
+        self.order()
+        transitions.orders.apply('confirm_delivery', {'pk': completed.pk})
+        rejected.status = 'rejected'
+        rejected.save()
+        Rating.objects.create(order_id=completed, buyer_id=self.buyer, rating=4)
+        rating = Rating.objects.create(order_id=rejected, buyer_id=self.buyer, rating=1)
+        rating.rating = 2
+        rating.save()
+
+        profile = ArtisanProfile.objects.get(pk=self.profile.pk)
+        self.assertEqual((profile.total_orders, profile.completed_orders, profile.rejected_orders), (3, 1, 1))
+        self.assertEqual(profile.fulfillment_rate, Decimal('33.33'))
+        self.assertEqual(profile.rejection_rate, Decimal('33.33'))
+        self.assertEqual(profile.average_rating, Decimal('3.0'))
+        self.assertEqual(profile.weekly_order_count, 3)
+        self.assertTrue(profile.can_take_order(500))
+        self.assertEqual(rebuild_metrics(dry_run=True), {})
+
+    def test_rebuild_repairs_drift(self):
+        self.order()
+        self.order('completed')
+        ArtisanProfile.objects.filter(pk=self.profile.pk).update(completed_orders=7, weekly_order_count=9)
+
+        drift = rebuild_metrics(dry_run=True)
+        self.assertEqual(drift[self.artisan.pk]['completed_orders'], (7, 1))
+        self.assertEqual(rebuild_metrics(), drift)
+        profile = ArtisanProfile.objects.get(pk=self.profile.pk)
+        self.assertEqual((profile.completed_orders, profile.weekly_order_count), (1, 2))
+        self.assertEqual(profile.fulfillment_rate, Decimal('50.00'))
+        self.assertEqual(rebuild_metrics(dry_run=True), {})
+
+
+class BulkVerificationTest(TestCase):
+    def setUp(self):
+        self.profiles = []
+        for index in range(5):
+            artisan = User.objects.create_user(
+                user_type=User.UserType.ARTISAN, first_name="Max", last_name=f"Maker{index}",
+                email=f"max{index}@example.com", phone_number=f"25470000010{index}", national_id=f"2222222{index}",
+            )
+            qualifies = index % 2 == 0
+            self.profiles.append(ArtisanProfile.objects.create(
+                user=artisan, fulfillment_rate=95, rejection_rate=5, average_rating=Decimal('4.5'),
+                days_active=90, completed_orders=12 if qualifies else 3,
+                is_verified=not qualifies,
+            ))
+
+    def assert_verified(self):
+        for profile in ArtisanProfile.objects.order_by('pk'):
+            qualifies = profile.completed_orders >= 10
+            self.assertEqual((profile.is_verified, profile.order_value_limit), (qualifies, None if qualifies else 2000))
+
+    def test_small_selection_is_one_update(self):
+        with self.assertNumQueries(2):
+            updated, batch = update_verification(ArtisanProfile.objects.all())
+        self.assertEqual((updated, batch), (5, None))
+        self.assert_verified()
+
+    @override_settings(VERIFICATION_INLINE_LIMIT=1, VERIFICATION_CHUNK_SIZE=2)
+    @patch('api.tasks.logger')
+    def test_large_selection_runs_as_chunked_jobs(self, mock_logger):
+        updated, batch = update_verification(ArtisanProfile.objects.all())
+        self.assertIsNone(updated)
+        self.assertEqual(verification_progress(), {batch: {'chunks': 3, 'done': 0, 'failed': 0}})
+        work(kinds=['verify_artisans'])
+        with self.assertNumQueries(1):
+            self.assertEqual(verification_progress(), {})
+        self.assertEqual(verification_progress(batch), {batch: {'chunks': 3, 'done': 3, 'failed': 0}})
+        self.assert_verified()
+
+
+class RatingSummaryTest(BuyerArtisanTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Inventory.objects.create(
+            artisan_id=self.artisan, product_name="Pot", description="Clay pot", category='pottery',
+            price=Decimal("50.00"), stock_quantity=3, image_url="https://example.com/pot.jpg",
+        )
+
+    def rate(self, stars, product=True):
+        order = Order.objects.create(
+            buyer_id=self.buyer, artisan_id=self.artisan, product_id=self.product if product else None,
+            order_type='ready-made', status='completed', quantity=1, total_amount=Decimal("50.00"),
+        )
+        return Rating.objects.create(order_id=order, buyer_id=self.buyer, rating=stars)
+
+    def summary(self, scope, subject_id=None, query=''):
+        path = f'/api/rating-summaries/{scope}/' + (f'{subject_id}/' if subject_id else '') + query
+        return RatingSummaryView.as_view()(APIRequestFactory().get(path), scope=scope, subject_id=subject_id).data
+
+    def test_summaries_follow_inserts_updates_and_deletes(self):
+        self.rate(5)
+        changed = self.rate(1)
+        self.rate(4, product=False)
+        changed.rating = 3
+        changed.save()
+        self.rate(2).delete()
+
+        artisan = self.summary('artisan', self.artisan.pk)
+        self.assertEqual((artisan['count'], artisan['average']), (3, 4.0))
+        self.assertEqual(artisan['histogram'], {'1': 0, '2': 0, '3': 1, '4': 1, '5': 1})
+        product = self.summary('product', self.product.pk)
+        self.assertEqual((product['count'], product['average']), (2, 4.0))
+        rows = self.summary('product', query=f'?ids={self.product.pk},999')
+        self.assertEqual([(row['subject_id'], row['count']) for row in rows], [(self.product.pk, 2), (999, 0)])
+
+    def test_updated_at_moves_with_each_rating(self):
+        self.rate(5)
+        RatingSummary.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        self.rate(4)
+        summary = RatingSummary.objects.get(scope='artisan', subject_id=self.artisan.pk)
+        self.assertGreater(summary.updated_at, timezone.now() - timedelta(minutes=1))
+
+    def test_rating_list_is_paginated_without_per_row_queries(self):
+        for stars in (1, 2, 3, 4, 5):
+            self.rate(stars)
+        request = APIRequestFactory().get(f'/api/ratings/?product={self.product.pk}&page_size=3')
+        with self.assertNumQueries(1):
+            response = RatingViewSet.as_view({'get': 'list'})(request)
+            rows = response.data['results']
+        self.assertEqual([row['rating'] for row in rows], [5, 4, 3])
+        self.assertEqual(rows[0]['product_id'], self.product.pk)
+        self.assertIsNotNone(response.data['next'])
@@ -0,0 +1,84 @@
+from django.dispatch import Signal
+from django.utils import timezone
+
+from orders.models import CustomDesignRequest, Order
+from payments.models import Payment
+
+
+# Sent after a transition moved at least one row, with ``name``, ``field``,
+# ``target``, ``filters`` and ``rows``; update() bypasses post_save.
+transitioned = Signal()
+
+
+class TransitionNotAllowed(Exception):
+    """Raised by ``StateMachine.require`` when no row was in a source state."""
+
+
+class Transition:
+    def __init__(self, field, sources, target, when=None, **changes):
+        self.field = field
+        self.sources = tuple(sources)
+        self.target = target
+        self.when = when or {}
+        self.changes = changes
+
+
+class StateMachine:
+    """
+    Transitions of one model, each applied as a single conditional
+    ``UPDATE ... WHERE <field> IN (<sources>)``. The row lock taken by that
+    statement is the only synchronisation: of two concurrent callers, only
+    the one whose update matched a row may act on the transition. Only the
+    transition's own columns (plus ``updated_at`` where the model has it)
+    are written.
+    """
+
+    def __init__(self, model, transitions):
+        self.model = model
+        self.transitions = transitions
+        self.touch = any(field.name == 'updated_at' for field in model._meta.concrete_fields)
+
+    def apply(self, name, filters, **changes):
+        """Apply transition ``name`` to the rows matching ``filters``; returns the number of rows moved."""
+        transition = self.transitions[name]
+        values = dict(transition.changes, **changes)
+        values[transition.field] = transition.target
+        if self.touch:
+            values.setdefault('updated_at', timezone.now())
+        queryset = self.model.objects.filter(**filters).filter(**transition.when)
+        rows = queryset.filter(**{f'{transition.field}__in': transition.sources}).update(**values)
+        if rows:
+            transitioned.send(
+                sender=self.model, name=name, field=transition.field, target=transition.target,
+                filters=filters, rows=rows,
+            )
+        return rows
+
+    def require(self, name, filters, **changes):
+        if not self.apply(name, filters, **changes):
+            transition = self.transitions[name]
+            raise TransitionNotAllowed(
+                f'{self.model.__name__} is not {" or ".join(transition.sources)}; cannot {name.replace("_", " ")}.'
+            )
+
+
+orders = StateMachine(Order, {
+    'confirm_payment': Transition('payment_status', ['pending'], 'completed', status='accepted'),
+    'confirm_delivery': Transition(
+        'status', ['pending', 'accepted'], 'completed', when={'delivery_confirmed': False}, delivery_confirmed=True,
+    ),
+})
+
+custom_requests = StateMachine(CustomDesignRequest, {
+    'accept': Transition('status', ['pending', 'material_sourced', 'material-sourcing'], 'accepted'),
+})
+
+payments = StateMachine(Payment, {
+    'fail_push': Transition('status', ['pending'], 'failed'),
+    'claim_release': Transition('status', ['held'], 'releasing'),
+    'return_to_held': Transition('status', ['releasing'], 'held'),
+    # Funded payments whose payout failed stay in escrow until retried.
+    'fail_payout': Transition('status', ['releasing'], 'payout_failed'),
+    'retry_payout': Transition('status', ['payout_failed'], 'releasing', b2c_conversation_id=None),
+    'refund': Transition('status', ['pending', 'held'], 'refunded', held_by_platform=False),
+})
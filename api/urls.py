@@ -1,17 +1,18 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from api.streams import order_updates, payment_status
 from api.views import (
     OrderViewSet, RatingViewSet,
     OrderTrackingViewSet, CustomDesignRequestViewSet,ShoppingCartViewSet, CartItemViewSet,InventoryViewSet,
     PaymentViewSet,
-    daraja_callback,
-    STKPushView,
+    daraja_callback, b2c_result_callback, b2c_timeout_callback,
+    STKPushView, STKPushStatusView, PaymentReconcileStatsView, EscrowBalanceView, RatingSummaryView,
     DeliveryConfirmView,
     RefundPaymentView,
     UserRegistrationView, LoginView, ForgotPasswordView,
     OTPVerificationView, PasswordResetView,
     AdminListUsersView, UserViewSet, ArtisanPortfolioViewSet, UserProfileView,
-    NearbyArtisansView
+    NearbyArtisansView, NearbyCacheStatsView
 )
 
 artisan_portfolio_list = ArtisanPortfolioViewSet.as_view({'get': 'list', 'post': 'create'})
@@ -32,7 +33,16 @@ router.register(r'portfolio', ArtisanPortfolioViewSet, basename='portfolio')
 urlpatterns = [
     path('api/', include(router.urls)),
     path('daraja/stk-push/', STKPushView.as_view(), name='daraja-stk-push'),
+    path('api/payment-status/<str:transaction_code>/', payment_status, name='payment-status'),
+    path('api/order-updates/', order_updates, name='order-updates'),
+    path('daraja/stk-push/<int:pk>/', STKPushStatusView.as_view(), name='daraja-stk-push-status'),
     path('daraja/callback/', daraja_callback, name='daraja-callback'),
+    path('daraja/b2c/result/', b2c_result_callback, name='daraja-b2c-result'),
+    path('daraja/b2c/timeout/', b2c_timeout_callback, name='daraja-b2c-timeout'),
+    path('api/escrow-balance/', EscrowBalanceView.as_view(), name='escrow-balance'),
+    path('api/rating-summaries/<str:scope>/', RatingSummaryView.as_view(), name='rating-summaries'),
+    path('api/rating-summaries/<str:scope>/<int:subject_id>/', RatingSummaryView.as_view(), name='rating-summary'),
+    path('daraja/reconcile-stats/', PaymentReconcileStatsView.as_view(), name='daraja-reconcile-stats'),
     path('delivery/confirm/', DeliveryConfirmView.as_view(), name='delivery-confirm'),
     path('payment/refund/', RefundPaymentView.as_view(), name='payment-refund'),
     path('register/', UserRegistrationView.as_view(), name='register'),
@@ -43,7 +53,8 @@ urlpatterns = [
     path('admin/users/', AdminListUsersView.as_view(), name='admin-list-users'),
     path('artisan-portfolio/', artisan_portfolio_list, name='artisan-portfolio-list'),
     path('profile/',UserProfileView.as_view(), name = 'user-profile'),
-    path('api/nearby-artisans/', NearbyArtisansView.as_view(), name='nearby-artisans')
+    path('api/nearby-artisans/', NearbyArtisansView.as_view(), name='nearby-artisans'),
+    path('api/nearby-artisans/cache-stats/', NearbyCacheStatsView.as_view(), name='nearby-cache-stats'),
 ]
 
 
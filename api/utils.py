@@ -1,7 +1,16 @@
+import base64
+import json
 import math
+import threading
+import time
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+
 
 def haversine(lat1, lon1, lat2, lon2):
-    R = 6371 
+    R = EARTH_RADIUS_KM
     phi1 = math.radians(float(lat1))
     phi2 = math.radians(float(lat2))
     d_phi = math.radians(float(lat2) - float(lat1))
@@ -9,4 +18,173 @@ def haversine(lat1, lon1, lat2, lon2):
 
     a = math.sin(d_phi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(d_lambda/2)**2
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
\ No newline at end of file
+    return R * c
+
+
+def haversine_many(lat, lon, lats, lons):
+    """
+    Distances in km from (lat, lon) to every point of ``lats``/``lons`` in a
+    single vectorized pass. Accepts any sequence of numbers or Decimals.
+    """
+    phi1 = math.radians(float(lat))
+    lambda1 = math.radians(float(lon))
+    phi2 = np.radians(np.asarray(lats, dtype=np.float64))
+    lambda2 = np.radians(np.asarray(lons, dtype=np.float64))
+    a = (
+        np.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * np.cos(phi2) * np.sin((lambda2 - lambda1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def within_radius(lat, lon, lats, lons, radius_km):
+    """Indices and distances of the points inside ``radius_km``, nearest first."""
+    distances = haversine_many(lat, lon, lats, lons)
+    indices = np.flatnonzero(distances <= float(radius_km))
+    order = indices[np.argsort(distances[indices], kind='stable')]
+    return order, distances[order]
+
+
+def nearest(lat, lon, lats, lons, k, radius_km=None):
+    """Indices and distances of the ``k`` closest points, nearest first."""
+    distances = haversine_many(lat, lon, lats, lons)
+    indices = np.arange(len(distances))
+    if radius_km is not None:
+        indices = indices[distances <= float(radius_km)]
+    if k < len(indices):
+        indices = indices[np.argpartition(distances[indices], k)[:k]]
+    order = indices[np.argsort(distances[indices], kind='stable')]
+    return order, distances[order]
+
+GEOHASH_PRECISION = 7
+GEOHASH_MAX_CELLS = 64
+_GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# Widens prefilter boxes slightly so float rounding never drops a point on the edge.
+BOUNDING_BOX_PAD = 1.001
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    lat, lon = float(lat), float(lon)
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(_GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(geohash)
+
+
+def geohash_cell_size(precision):
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = (5 * precision) // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def bounding_box(lat, lon, radius_km):
+    """
+    Box around every point within ``radius_km`` on the same sphere as
+    ``haversine``. The longitude span is the circle's true widest extent,
+    which lies poleward of ``lat``.
+    """
+    lat, lon, radius_km = float(lat), float(lon), float(radius_km)
+    angle = radius_km * BOUNDING_BOX_PAD / EARTH_RADIUS_KM
+    d_lat = math.degrees(angle)
+    cos_lat = math.cos(math.radians(lat))
+    if angle >= math.pi / 2 or cos_lat <= math.sin(angle):
+        d_lon = 180.0
+    else:
+        d_lon = math.degrees(math.asin(math.sin(angle) / cos_lat))
+    south = max(lat - d_lat, -90.0)
+    north = min(lat + d_lat, 90.0)
+    west = lon - d_lon
+    east = lon + d_lon
+    if d_lon >= 180.0:
+        west, east = -180.0, 180.0
+    if west < -180.0:
+        west += 360.0
+    if east > 180.0:
+        east -= 360.0
+    return south, west, north, east
+
+
+def geohash_cover(south, west, north, east, max_cells=GEOHASH_MAX_CELLS):
+    """
+    Geohash prefixes whose cells together cover the bounding box, using the
+    longest prefix that needs at most ``max_cells`` cells.
+    """
+    if west > east:
+        lon_spans = [(west, 180.0), (-180.0, east)]
+    else:
+        lon_spans = [(west, east)]
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        cell_h, cell_w = geohash_cell_size(precision)
+        rows = int((north - south) / cell_h) + 2
+        cols = sum(int((e - w) / cell_w) + 2 for w, e in lon_spans)
+        if rows * cols <= max_cells:
+            break
+    cells = set()
+    for w, e in lon_spans:
+        y = south
+        while True:
+            x = w
+            while True:
+                cells.add(geohash_encode(min(y, 90.0), min(x, 180.0), precision))
+                if x >= e:
+                    break
+                x = min(x + cell_w, e)
+            if y >= north:
+                break
+            y = min(y + cell_h, north)
+    return sorted(cells)
+
+
+def encode_distance_cursor(distance_km, artisan_id):
+    raw = json.dumps({'d': float(distance_km), 'id': artisan_id}).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_distance_cursor(cursor):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(data['d']), int(data['id'])
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Invalid cursor.")
+
+
+class RateLimiter:
+    """Thread-safe token bucket allowing ``rate`` calls per second on average."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,64 @@
+import uuid
+
+from django.conf import settings
+from django.db.models import Count, Q
+
+from .models import Job
+
+JOB_KIND = 'verify_artisans'
+
+
+def queue_verification(queryset, chunk_size=None):
+    """
+    Split the profiles in ``queryset`` into chunks of ``chunk_size`` ids and
+    queue one ``verify_artisans`` job per chunk. Returns ``(batch, chunks)``;
+    ``verification_progress`` reports on the batch while workers run it.
+    """
+    chunk_size = chunk_size or settings.VERIFICATION_CHUNK_SIZE
+    batch = uuid.uuid4().hex[:12]
+    ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+    chunks = [ids[start:start + chunk_size] for start in range(0, len(ids), chunk_size)]
+    Job.objects.bulk_create([
+        Job(kind=JOB_KIND, payload={'batch': batch, 'chunk': index + 1, 'of': len(chunks), 'ids': chunk})
+        for index, chunk in enumerate(chunks)
+    ])
+    return batch, len(chunks)
+
+
+def update_verification(queryset):
+    """
+    Recompute ``is_verified`` for the selection: in place when it is small
+    enough for one request (VERIFICATION_INLINE_LIMIT), otherwise in chunked
+    background jobs. Returns ``(updated, batch)``; exactly one is None.
+    """
+    if queryset.count() <= settings.VERIFICATION_INLINE_LIMIT:
+        return queryset.update_verification(), None
+    batch, _ = queue_verification(queryset)
+    return None, batch
+
+
+def verification_progress(batch=None):
+    """
+    ``{batch: {'chunks', 'done', 'failed'}}`` for every batch still running,
+    or for just ``batch``. Running batches are found through the job status
+    index first, so finished jobs are never grouped on the JSON key.
+    """
+    jobs = Job.objects.filter(kind=JOB_KIND)
+    if batch is not None:
+        jobs = jobs.filter(payload__batch=batch)
+    else:
+        running = set(
+            jobs.filter(status__in=('queued', 'running')).values_list('payload__batch', flat=True)
+        )
+        if not running:
+            return {}
+        jobs = jobs.filter(payload__batch__in=running)
+    rows = jobs.values('payload__batch').annotate(
+        chunks=Count('pk'),
+        done=Count('pk', filter=Q(status='done')),
+        failed=Count('pk', filter=Q(status='failed')),
+    )
+    return {
+        row['payload__batch']: {'chunks': row['chunks'], 'done': row['done'], 'failed': row['failed']}
+        for row in rows
+    }
@@ -1,6 +1,6 @@
 
 from django.shortcuts import render
-from rest_framework import generics, status, viewsets
+from rest_framework import generics, mixins, status, viewsets
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from cart.models import ShoppingCart, CartItem
@@ -10,15 +10,27 @@ from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from products.models import Inventory
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model 
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.views import APIView
-from rest_framework.decorators import api_view
-from payments.models import Payment
-from orders.models import Order
+from rest_framework.decorators import action, api_view
+from payments.models import ArchivedPayment, Payment
+from orders.models import ArchivedOrder, Order, RatingSummary
 from users.models import User
 from django.utils import timezone
-import datetime
-from .daraja import DarajaAPI
+from .daraja import DarajaAPI, DarajaUnavailable
+from .callbacks import record_callback
+from .idempotency import from_field, idempotent
+from .archive import IncludeArchivedMixin
+from .pagination import OrderCursorPagination, RatingCursorPagination, TrackingCursorPagination
+from .jobs import enqueue
+from .ledger import held_for_artisan, platform_float, record_transitions
+from .payouts import claim_for_release, release_due_payments
+from .reconcile import reconcile_metrics
+from . import transitions
+from .transitions import TransitionNotAllowed
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.urls import reverse
 from orders.models import Order, Rating, OrderTracking, CustomDesignRequest
 import logging
 from rest_framework.authtoken.models import Token
@@ -30,10 +42,12 @@ from django_filters.rest_framework import DjangoFilterBackend
 from users.permissions import AdminPermission, ArtisanPermission
 from rest_framework.views import APIView
 from django.db.models import F, FloatField
-from .utils import haversine
+from .utils import encode_distance_cursor, within_radius
+from .geo_index import get_artisan_index
+from .nearby import cache_stats, cached_candidates, load_candidates, load_portfolios
 from django.db.models.functions import ACos, Cos, Radians, Sin
 from .serializers import (
-    OrderSerializer, RatingSerializer,
+    OrderSerializer, RatingSerializer, RatingSummarySerializer,
     OrderTrackingSerializer, CustomDesignRequestSerializer,
     STKPushSerializer,
     PaymentSerializer,
@@ -47,43 +61,131 @@ from .serializers import (
     PasswordResetSerializer,
     ProfileSerializer,
     ArtisanPortfolioSerializer,
-    UserSerializer, NearbyArtisanSearchSerializer,
+    UserSerializer, NearbyArtisanSearchSerializer, NearestArtisansQuerySerializer,
 )
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(IncludeArchivedMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer 
+    archive_model = ArchivedOrder
+    pagination_class = OrderCursorPagination
+    filterset_fields = ['status']
 
     def get_queryset(self):
         user = self.request.user
-        if hasattr(user, 'buyer_orders'):  
-            return Order.objects.filter(buyer_id=user)
-        elif hasattr(user, 'artisan_orders'):
-            return Order.objects.filter(artisan_id=user)
+        if not user.is_authenticated:
+            return Order.objects.none()
+        orders = Order.objects.select_related('product_id')
+        if self.action == 'latest_tracking':
+            orders = orders.select_related('latest_tracking')
+        if user.user_type == User.UserType.BUYER:
+            return orders.filter(buyer_id=user)
+        if user.user_type == User.UserType.ARTISAN:
+            return orders.filter(artisan_id=user)
+        if user.user_type.lower() == 'admin':
+            return orders
         return Order.objects.none()
 
+    def get_archived_queryset(self):
+        user = self.request.user
+        if not user.is_authenticated:
+            return ArchivedOrder.objects.none()
+        if user.user_type == User.UserType.BUYER:
+            return ArchivedOrder.objects.filter(buyer_id=user.pk)
+        if user.user_type == User.UserType.ARTISAN:
+            return ArchivedOrder.objects.filter(artisan_id=user.pk)
+        if user.user_type.lower() == 'admin':
+            return ArchivedOrder.objects.all()
+        return ArchivedOrder.objects.none()
+
+    @action(detail=True, methods=['get'], url_path='latest-tracking')
+    def latest_tracking(self, request, pk=None):
+        order = self.get_object()
+        if order.latest_tracking is None:
+            return Response({"order_id": order.pk, "status": order.status, "tracking": None})
+        return Response({
+            "order_id": order.pk,
+            "status": order.status,
+            "tracking": OrderTrackingSerializer(order.latest_tracking).data,
+        })
+
+    @action(detail=True, methods=['get'])
+    def timeline(self, request, pk=None):
+        trackings = OrderTracking.objects.filter(order_id=pk, order_id__in=self.get_queryset().values('pk'))
+        paginator = TrackingCursorPagination()
+        page = paginator.paginate_queryset(trackings, request, view=self)
+        return paginator.get_paginated_response(OrderTrackingSerializer(page, many=True).data)
+
+    @action(detail=True, methods=['post'], url_path='confirm-payment')
     def confirm_payment(self, request, pk=None):
         order = self.get_object()
-        if order.payment_status != 'pending':
-            raise ValidationError("Payment is not pending.")
-        if self.request.user.user_type != 'buyer':
+        if self.request.user.user_type != User.UserType.BUYER:
             raise PermissionDenied("Only buyers can confirm payment.")
-        order.payment_status = 'completed'
-        order.status = 'confirmed'
-        order.save()
-        return Response({"message": "Payment confirmed", "payment_status": order.payment_status})
+        try:
+            transitions.orders.require('confirm_payment', {'pk': order.pk})
+        except TransitionNotAllowed:
+            raise ValidationError("Payment is not pending.")
+        return Response({"message": "Payment confirmed", "payment_status": "completed"})
+
+class RatingFilter(django_filters.rest_framework.FilterSet):
+    # Plain number filters: a product page should not look the product up first.
+    artisan = django_filters.rest_framework.NumberFilter(field_name='order_id__artisan_id')
+    product = django_filters.rest_framework.NumberFilter(field_name='order_id__product_id')
+
+    class Meta:
+        model = Rating
+        fields = ['artisan', 'product']
+
 
 class RatingViewSet(viewsets.ModelViewSet):
-    queryset = Rating.objects.all()
+    queryset = Rating.objects.select_related('order_id')
     serializer_class = RatingSerializer
+    pagination_class = RatingCursorPagination
+    filterset_class = RatingFilter
 
 
-class OrderTrackingViewSet(viewsets.ModelViewSet):
+class OrderTrackingViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Append-only: artisans add updates to their own orders, and nothing is
+    edited or deleted afterwards except the buyer's approval (``approve``).
+    Per-order history is served by ``OrderViewSet.timeline``.
+    """
     queryset = OrderTracking.objects.all()
     serializer_class = OrderTrackingSerializer
+    pagination_class = TrackingCursorPagination
+    filterset_fields = ['order_id', 'status']
+
+    def get_queryset(self):
+        user = self.request.user
+        if not user.is_authenticated:
+            return OrderTracking.objects.none()
+        if user.user_type == User.UserType.BUYER:
+            return OrderTracking.objects.filter(order_id__buyer_id=user)
+        if user.user_type == User.UserType.ARTISAN:
+            return OrderTracking.objects.filter(order_id__artisan_id=user)
+        if user.user_type.lower() == 'admin':
+            return OrderTracking.objects.all()
+        return OrderTracking.objects.none()
+
+    def perform_create(self, serializer):
+        order = serializer.validated_data['order_id']
+        if order.artisan_id != self.request.user:
+            raise PermissionDenied("Only the order's artisan can add tracking updates.")
+        serializer.save(artisan_id=self.request.user)
+
+    @action(detail=True, methods=['post'])
+    def approve(self, request, pk=None):
+        tracking = self.get_object()
+        if tracking.order_id.buyer_id_id != request.user.pk:
+            raise PermissionDenied("Only the order's buyer can approve tracking updates.")
+        OrderTracking.objects.filter(pk=tracking.pk, buyer_approval=False).update(
+            buyer_approval=True, approval_timestamp=timezone.now(),
+        )
+        tracking.refresh_from_db()
+        return Response(self.get_serializer(tracking).data)
 
 
 class CustomDesignRequestViewSet(viewsets.ModelViewSet):
@@ -92,28 +194,31 @@ class CustomDesignRequestViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        if hasattr(user, 'buyer_requests'):
+        if not user.is_authenticated:
+            return CustomDesignRequest.objects.none()
+        if user.user_type == User.UserType.BUYER:
             return CustomDesignRequest.objects.filter(buyer_id=user)
-        elif hasattr(user, 'artisan_requests'):
+        if user.user_type == User.UserType.ARTISAN:
             return CustomDesignRequest.objects.filter(artisan_id=user)
         return CustomDesignRequest.objects.none()
     
     def perform_create(self, serializer):
-        if self.request.user.user_type != 'buyer':
+        if self.request.user.user_type != User.UserType.BUYER:
             raise PermissionDenied("Only buyers can create custom design requests.")
         serializer.save(buyer_id=self.request.user)
 
+    @action(detail=True, methods=['post'], url_path='accept')
     def accept_request(self, request, pk=None):
         custom_request = self.get_object()
-        if self.request.user.user_type != 'artisan':
+        if self.request.user.user_type != User.UserType.ARTISAN:
             raise PermissionDenied("Only artisans can accept custom design requests.")
         if custom_request.artisan_id != self.request.user:
             raise PermissionDenied("You are not assigned to this request.")
-        if custom_request.status != 'pending':
+        try:
+            transitions.custom_requests.require('accept', {'pk': custom_request.pk})
+        except TransitionNotAllowed:
             raise ValidationError("Request is not pending.")
-        custom_request.status = 'accepted'
-        custom_request.save()
-        return Response({"message": "Custom design request accepted", "status": custom_request.status})
+        return Response({"message": "Custom design request accepted", "status": "accepted"})
 
 
 
@@ -213,15 +318,26 @@ class InventoryViewSet(viewsets.ModelViewSet):
 
 
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(IncludeArchivedMixin, viewsets.ModelViewSet):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
+    archive_model = ArchivedPayment
 
 class STKPushView(APIView):
+    """
+    Synchronous by default. With DARAJA_STK_PUSH_ASYNC, or when the client
+    sends ``Prefer: respond-async``, the payment is written as pending, the
+    push is handed to the job queue and the view answers 202 with a
+    ``status_url`` to poll.
+    """
+
+    @idempotent('stk-push', derive_key=from_field('transaction_code'))
     def post(self, request):
         serializer = STKPushSerializer(data=request.data)
         if serializer.is_valid():
             data = serializer.validated_data
+            if self.respond_async(request):
+                return self.enqueue_push(request, data)
             daraja = DarajaAPI()
             try:
                 response = daraja.stk_push(
@@ -234,53 +350,174 @@ class STKPushView(APIView):
                 if checkout_request_id:
                     order = Order.objects.get(id=data['order_id'])
                     artisan = order.artisan_id
+                    # Escrow is funded by the successful STK callback, not the push.
                     Payment.objects.create(
                         order_id=order,
                         artisan_id=artisan,
                         amount=data['amount'],
                         transaction_code=data['transaction_code'],
+                        checkout_request_id=checkout_request_id,
                         buyer_phone=data['buyer_phone'],
                         artisan_phone=artisan.phone_number,
-                        status='held'
+                        status='pending'
                     )
                 return Response(response, status=status.HTTP_200_OK)
+            except DarajaUnavailable as e:
+                return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
             except Exception as e:
                 return Response(
                     {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def respond_async(self, request):
+        prefer = request.headers.get('Prefer', '')
+        return settings.DARAJA_STK_PUSH_ASYNC or 'respond-async' in prefer.lower()
+
+    def enqueue_push(self, request, data):
+        try:
+            order = Order.objects.select_related('artisan_id').get(id=data['order_id'])
+        except Order.DoesNotExist:
+            return Response({"order_id": ["Order not found."]}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                payment = Payment.objects.create(
+                    order_id=order,
+                    artisan_id=order.artisan_id,
+                    amount=data['amount'],
+                    transaction_code=data['transaction_code'],
+                    buyer_phone=data['buyer_phone'],
+                    artisan_phone=data['artisan_phone'],
+                    status='pending',
+                )
+                enqueue('stk_push', {'payment_id': payment.id, 'transaction_desc': data['transaction_desc']})
+        except IntegrityError:
+            return Response(
+                {"transaction_code": ["A payment with this transaction code already exists."]},
+                status=status.HTTP_409_CONFLICT,
+            )
+        status_url = request.build_absolute_uri(reverse('daraja-stk-push-status', args=[payment.id]))
+        return Response(
+            {"payment_id": payment.id, "status": payment.status, "status_url": status_url},
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": status_url},
+        )
+
+
+class STKPushStatusView(APIView):
+    def get(self, request, pk):
+        payment = get_object_or_404(
+            Payment.objects.only('id', 'status', 'checkout_request_id', 'mpesa_receipt_number', 'result_description'),
+            pk=pk,
+        )
+        return Response({
+            "payment_id": payment.id,
+            "status": payment.status,
+            "checkout_request_id": payment.checkout_request_id,
+            "mpesa_receipt_number": payment.mpesa_receipt_number,
+            "result_description": payment.result_description,
+        })
+
+class EscrowBalanceView(APIView):
+    """
+    Money held in escrow, read from the running ledger balances. Artisans
+    see their own balance; admins see the platform float and, with
+    ``?artisan=<id>``, any artisan's balance.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        user = request.user
+        if user.user_type == User.UserType.ARTISAN:
+            return Response({"artisan": user.pk, "held": held_for_artisan(user.pk)})
+        if not AdminPermission().has_permission(request, self):
+            raise PermissionDenied("Only artisans and admins can view escrow balances.")
+        data = {"platform_float": platform_float()}
+        if request.query_params.get('artisan'):
+            data["artisan"] = request.query_params['artisan']
+            data["held"] = held_for_artisan(request.query_params['artisan'])
+        return Response(data)
+
+
+class RatingSummaryView(APIView):
+    """
+    Rating count, average and 1-5 histogram for one artisan or product, or
+    for up to 100 of them with ``?ids=1,2,3``. Served from the running
+    summaries; subjects without ratings come back with a zero count.
+    """
+    max_ids = 100
+
+    def get(self, request, scope, subject_id=None):
+        if scope not in dict(RatingSummary.SCOPE_CHOICES):
+            raise NotFound("Unknown rating summary scope.")
+        if subject_id is not None:
+            ids = [subject_id]
+        else:
+            try:
+                ids = [int(value) for value in request.query_params.get('ids', '').split(',') if value]
+            except ValueError:
+                raise ValidationError({"ids": "Use a comma-separated list of integer ids."})
+            if not ids or len(ids) > self.max_ids:
+                raise ValidationError({"ids": f"Give between 1 and {self.max_ids} ids."})
+        found = {summary.subject_id: summary for summary in RatingSummary.objects.filter(scope=scope, subject_id__in=ids)}
+        summaries = [found.get(pk) or RatingSummary(scope=scope, subject_id=pk) for pk in ids]
+        data = RatingSummarySerializer(summaries, many=True).data
+        return Response(data[0] if subject_id is not None else data)
+
+
+class PaymentReconcileStatsView(APIView):
+    permission_classes = [IsAuthenticated, AdminPermission]
+
+    def get(self, request):
+        return Response(reconcile_metrics())
+
+
+def callback_key(request):
+    try:
+        stk_callback = request.data['Body']['stkCallback']
+        return f"{stk_callback['CheckoutRequestID']}:{stk_callback['ResultCode']}"
+    except (KeyError, TypeError):
+        return None
+
+
 @api_view(['POST'])
+@idempotent('daraja-callback', derive_key=callback_key, check_body=False)
 def daraja_callback(request):
-    callback_data = request.data
+    """
+    Store the callback in the inbox and acknowledge it straight away;
+    ``manage.py process_callbacks`` applies it to the payment.
+    """
+    record_callback('stk', request.data)
+    return Response({"status": "callback received"})
+
+def b2c_callback_key(request):
     try:
-        stk_callback = callback_data['Body']['stkCallback']
-        checkout_request_id = stk_callback['CheckoutRequestID']
-        result_code = stk_callback['ResultCode']
-        result_desc = stk_callback['ResultDesc']
-        payment = Payment.objects.get(transaction_code=checkout_request_id)
-        payment.result_description = result_desc
-        if result_code == 0:
-            payment.status = 'held'
-            items = stk_callback.get('CallbackMetadata', {}).get('Item', [])
-            item_dict = {item['Name']: item['Value'] for item in items}
-            payment.mpesa_receipt_number = item_dict.get('MpesaReceiptNumber')
-            trans_date_str = str(item_dict.get('TransactionDate'))
-            trans_date = datetime.datetime.strptime(trans_date_str, '%Y%m%d%H%M%S')
-            payment.transaction_date = timezone.make_aware(trans_date, timezone.get_current_timezone())
-            payment.amount = item_dict.get('Amount')
-            payment.buyer_phone = item_dict.get('PhoneNumber')
-            payment.paid_at = timezone.now()
-        elif result_code == 1:
-            payment.status = 'refunded'
-        payment.save()
-    except Payment.DoesNotExist:
-        pass
-    except Exception as e:
-        pass
-    return Response({"status": "callback processed"})
+        return request.data['Result']['ConversationID']
+    except (KeyError, TypeError):
+        return None
+
+
+@api_view(['POST'])
+@idempotent('b2c-result', derive_key=b2c_callback_key, check_body=False)
+def b2c_result_callback(request):
+    record_callback('b2c_result', request.data)
+    return Response({"status": "callback received"})
+
+
+@api_view(['POST'])
+@idempotent('b2c-timeout', derive_key=b2c_callback_key, check_body=False)
+def b2c_timeout_callback(request):
+    record_callback('b2c_timeout', request.data)
+    return Response({"status": "callback received"})
+
 
 class DeliveryConfirmView(APIView):
+    """
+    Confirms delivery and queues the payout; the payment stays releasing
+    until the B2C result callback settles it as released or payout_failed.
+    """
+
+    @idempotent('delivery-confirm', derive_key=from_field('order_id'))
     def post(self, request):
         serializer = DeliveryConfirmSerializer(data=request.data)
         if serializer.is_valid():
@@ -288,23 +525,24 @@ class DeliveryConfirmView(APIView):
             try:
                 order = Order.objects.get(id=data['order_id'])
                 payment = Payment.objects.get(order_id=order)
-                if order.delivery_confirmed:
-                    return Response({"detail": "Already confirmed."}, status=400)
-                order.delivery_confirmed = True
-                order.status = 'completed'
-                order.save()
-                daraja = DarajaAPI()
-                response = daraja.b2c_payment(
-                    artisan_phone=payment.artisan_phone,
-                    amount=payment.amount,
-                    transaction_id=payment.transaction_code,
-                    transaction_desc="Delivery confirmed"
+                if payment.status == 'pending':
+                    # Nothing would pay the artisan once the STK callback lands.
+                    return Response(
+                        {"detail": "Payment has not been received yet; confirm delivery once it is held."},
+                        status=status.HTTP_409_CONFLICT,
+                    )
+                with transaction.atomic():
+                    if not transitions.orders.apply('confirm_delivery', {'pk': order.pk}):
+                        return Response({"detail": "Already confirmed."}, status=400)
+                    queued = claim_for_release(payment.id)
+                    if queued:
+                        enqueue('b2c_payout', {'payment_id': payment.id, 'transaction_desc': "Delivery confirmed"})
+                if not queued:
+                    return Response({"detail": "Delivery confirmed.", "payment_status": payment.status})
+                return Response(
+                    {"detail": "Delivery confirmed and payout queued.", "payment_status": "releasing"},
+                    status=status.HTTP_202_ACCEPTED,
                 )
-                payment.status = "released"
-                payment.released_at = timezone.now()
-                payment.held_by_platform = False
-                payment.save()
-                return Response({"detail": "Delivery confirmed and payout released.", "b2c_response": response})
             except Exception as e:
                 return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -317,38 +555,22 @@ class RefundPaymentView(APIView):
             try:
                 order = Order.objects.get(id=data['order_id'])
                 payment = Payment.objects.get(order_id=order)
-                payment.status = "refunded"
-                payment.refunded_reason = data['reason']
-                payment.held_by_platform = False
-                payment.refund_at = timezone.now()
-                payment.save()
+                with transaction.atomic():
+                    refunded = transitions.payments.apply('refund', {'pk': payment.pk}, refunded_reason=data['reason'])
+                    if not refunded:
+                        return Response(
+                            {"detail": f"Payment is {payment.status}; only pending or held payments can be refunded."},
+                            status=status.HTTP_409_CONFLICT,
+                        )
+                    payment.refresh_from_db()
+                    record_transitions([payment])
                 return Response({"detail": "Refund processed."})
             except Exception as e:
                 return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 def auto_release_payments():
-    now = timezone.now()
-    payments = Payment.objects.filter(status="held")
-    for payment in payments:
-        order = payment.order_id
-        if order.delivery_confirmed:
-            continue
-        if payment.paid_at and (now - payment.paid_at).total_seconds() > 86400:
-            daraja = DarajaAPI()
-            try:
-                response = daraja.b2c_payment(
-                    artisan_phone=payment.artisan_phone,
-                    amount=payment.amount,
-                    transaction_id=payment.transaction_code,
-                    transaction_desc="Auto-release after 24hr"
-                )
-                payment.status = "released"
-                payment.released_at = now
-                payment.held_by_platform = False
-                payment.save()
-            except Exception:
-                continue
+    return release_due_payments()
 
 class UserRegistrationView(generics.CreateAPIView):
     queryset = User.objects.all()
@@ -453,7 +675,7 @@ class ArtisanPortfolioViewSet(viewsets.ModelViewSet):
         serializer.save(artisan=user)
 
 class NearbyArtisansView(APIView):
-    
+
     def post(self, request):
         serializer = NearbyArtisanSearchSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -461,35 +683,77 @@ class NearbyArtisansView(APIView):
         lon = serializer.validated_data['longitude']
         radius = float(serializer.validated_data.get('radius', 50))
 
-        artisans = User.objects.filter(
-            user_type='artisan',
-            latitude__isnull=False,
-            longitude__isnull=False,
+        if 'k' in request.query_params:
+            query = NearestArtisansQuerySerializer(data=request.query_params)
+            query.is_valid(raise_exception=True)
+            k = query.validated_data['k']
+            index = get_artisan_index()
+            if index is not None:
+                results = index.k_nearest(lat, lon, k, max_distance_km=radius)
+                for result in results:
+                    result['artisan_id'] = result.pop('user_id')
+                    result['distance_km'] = round(result['distance_km'], 2)
+            else:
+                results, _ = self.search(lat, lon, radius, k, with_portfolio=False)
+            return Response({"artisans": results, "next_cursor": None})
+
+        results, next_cursor = self.search(
+            lat, lon, radius,
+            serializer.validated_data['limit'],
+            serializer.validated_data.get('cursor'),
+        )
+        return Response({"artisans": results, "next_cursor": next_cursor})
+
+    def search(self, lat, lon, radius, limit, cursor=None, with_portfolio=True):
+        artisans = cached_candidates(lat, lon, radius)
+        if artisans is None:
+            artisans = load_candidates(lat, lon, radius)
+        indices, distances = within_radius(
+            lat, lon,
+            [artisan['latitude'] for artisan in artisans],
+            [artisan['longitude'] for artisan in artisans],
+            radius,
         )
+        ranked = sorted(
+            (float(dist), artisans[index]['user_id'], index)
+            for index, dist in zip(indices, distances)
+        )
+        if cursor:
+            ranked = [row for row in ranked if row[:2] > cursor]
+        page = ranked[:limit]
+
+        portfolios = {}
+        if with_portfolio:
+            portfolios = load_portfolios([
+                artisan_id for _, artisan_id, index in page if 'portfolio' not in artisans[index]
+            ])
+
         results = []
-        for artisan in artisans:
-            dist = haversine(lat, lon, artisan.latitude, artisan.longitude)
-            if dist <= radius:
-                portfolios = ArtisanPortfolio.objects.filter(artisan_id=artisan.user_id)
-                portfolio_data = [
-                    {
-                        "title": p.title,
-                        "description": p.description,
-                        "image_urls": p.image_urls
-                    } for p in portfolios
-                ]
-                results.append({
-                    "artisan_id": artisan.user_id,
-                    "first_name": artisan.first_name,
-                    "last_name": artisan.last_name,
-                    "distance_km": round(dist, 2),
-                    "latitude": artisan.latitude,
-                    "longitude": artisan.longitude,
-                    "portfolio": portfolio_data,
-                })
-
-        results = sorted(results, key=lambda x: x['distance_km'])
-        return Response({"artisans": results})
+        for dist, artisan_id, index in page:
+            artisan = artisans[index]
+            result = {
+                "artisan_id": artisan_id,
+                "first_name": artisan['first_name'],
+                "last_name": artisan['last_name'],
+                "distance_km": round(dist, 2),
+                "latitude": artisan['latitude'],
+                "longitude": artisan['longitude'],
+            }
+            if with_portfolio:
+                result["portfolio"] = artisan.get('portfolio', portfolios.get(artisan_id, []))
+            results.append(result)
+
+        next_cursor = None
+        if len(ranked) > limit:
+            next_cursor = encode_distance_cursor(*page[-1][:2])
+        return results, next_cursor
+
+
+class NearbyCacheStatsView(APIView):
+    permission_classes = [IsAuthenticated, AdminPermission]
+
+    def get(self, request):
+        return Response(cache_stats())
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -167,6 +167,7 @@ EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+DARAJA_BASE_URL = os.getenv("DARAJA_BASE_URL", "https://sandbox.safaricom.co.ke")
 DARAJA_CONSUMER_KEY = os.getenv("DARAJA_CONSUMER_KEY")
 DARAJA_CONSUMER_SECRET = os.getenv("DARAJA_CONSUMER_SECRET")
 DARAJA_SHORTCODE = os.getenv("DARAJA_SHORTCODE")
@@ -184,3 +185,58 @@ CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
 
 
+
+ARTISAN_INDEX_MAX_ENTRIES = int(os.getenv('ARTISAN_INDEX_MAX_ENTRIES', 200000))
+ARTISAN_INDEX_REFRESH_SECONDS = int(os.getenv('ARTISAN_INDEX_REFRESH_SECONDS', 300))
+ARTISAN_INDEX_COMPACT_RATIO = float(os.getenv('ARTISAN_INDEX_COMPACT_RATIO', 0.05))
+
+NEARBY_CACHE_TILE_DEGREES = float(os.getenv('NEARBY_CACHE_TILE_DEGREES', 0.01))
+NEARBY_CACHE_TIMEOUT = int(os.getenv('NEARBY_CACHE_TIMEOUT', 300))
+
+GEOCODER_BACKEND = os.getenv('GEOCODER_BACKEND', 'api.geocoding.LocationIQGeocoder')
+GEOCODER_RATE_PER_SECOND = float(os.getenv('GEOCODER_RATE_PER_SECOND', 2))
+GEOCODER_TIMEOUT = float(os.getenv('GEOCODER_TIMEOUT', 10))
+GEOCODE_CACHE_TTL_DAYS = int(os.getenv('GEOCODE_CACHE_TTL_DAYS', 90))
+
+JOB_LOCK_TIMEOUT = int(os.getenv('JOB_LOCK_TIMEOUT', 300))
+VERIFICATION_INLINE_LIMIT = int(os.getenv('VERIFICATION_INLINE_LIMIT', 5000))
+VERIFICATION_CHUNK_SIZE = int(os.getenv('VERIFICATION_CHUNK_SIZE', 1000))
+
+# Shared by every worker process (Daraja token lock, nearby-search cache).
+# The table is created by ``migrate``; a process-local backend such as
+# LocMemCache is only fit for a single-process development server.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'django_cache'),
+    }
+}
+
+DARAJA_TOKEN_WAIT_SECONDS = float(os.getenv('DARAJA_TOKEN_WAIT_SECONDS', 10))
+DARAJA_CONNECT_TIMEOUT = float(os.getenv('DARAJA_CONNECT_TIMEOUT', 3.05))
+DARAJA_READ_TIMEOUT = float(os.getenv('DARAJA_READ_TIMEOUT', 30))
+DARAJA_POOL_SIZE = int(os.getenv('DARAJA_POOL_SIZE', 20))
+DARAJA_MAX_RETRIES = int(os.getenv('DARAJA_MAX_RETRIES', 2))
+DARAJA_RETRY_BACKOFF_SECONDS = float(os.getenv('DARAJA_RETRY_BACKOFF_SECONDS', 0.5))
+DARAJA_RETRY_BACKOFF_MAX_SECONDS = float(os.getenv('DARAJA_RETRY_BACKOFF_MAX_SECONDS', 5))
+DARAJA_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('DARAJA_CIRCUIT_FAILURE_THRESHOLD', 5))
+DARAJA_CIRCUIT_COOLDOWN_SECONDS = float(os.getenv('DARAJA_CIRCUIT_COOLDOWN_SECONDS', 30))
+DARAJA_STK_PUSH_ASYNC = os.getenv('DARAJA_STK_PUSH_ASYNC', 'False').lower() in ('1', 'true', 'yes')
+
+PAYOUT_WORKERS = int(os.getenv('PAYOUT_WORKERS', 16))
+PAYOUT_RATE_PER_SECOND = float(os.getenv('PAYOUT_RATE_PER_SECOND', 50))
+
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', 60))
+
+STK_QUERY_AFTER_SECONDS = int(os.getenv('STK_QUERY_AFTER_SECONDS', 120))
+STK_QUERY_INTERVAL_SECONDS = int(os.getenv('STK_QUERY_INTERVAL_SECONDS', 60))
+STK_QUERY_WORKERS = int(os.getenv('STK_QUERY_WORKERS', 8))
+
+NOTIFICATION_POLL_SECONDS = float(os.getenv('NOTIFICATION_POLL_SECONDS', 1))
+LONG_POLL_TIMEOUT = float(os.getenv('LONG_POLL_TIMEOUT', 30))
+LONG_POLL_MAX_TIMEOUT = float(os.getenv('LONG_POLL_MAX_TIMEOUT', 120))
+SSE_KEEPALIVE_SECONDS = float(os.getenv('SSE_KEEPALIVE_SECONDS', 15))
+ORDER_STREAM_MAX_ORDERS = int(os.getenv('ORDER_STREAM_MAX_ORDERS', 100))
+
+ARCHIVE_AFTER_MONTHS = int(os.getenv('ARCHIVE_AFTER_MONTHS', 6))
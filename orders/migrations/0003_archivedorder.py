@@ -0,0 +1,29 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:32
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedOrder",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("buyer_id", models.IntegerField(db_index=True)),
+                ("artisan_id", models.IntegerField(db_index=True)),
+                ("status", models.CharField(max_length=20)),
+                ("created_at", models.DateTimeField()),
+                (
+                    "archived_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("data", models.JSONField()),
+            ],
+        ),
+    ]
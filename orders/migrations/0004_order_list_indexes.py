@@ -0,0 +1,26 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0003_archivedorder"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["buyer_id", "created_at"], name="order_buyer_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["artisan_id", "status", "created_at"],
+                name="order_artisan_status_idx",
+            ),
+        ),
+    ]
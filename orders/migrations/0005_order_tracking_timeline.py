@@ -0,0 +1,40 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_latest_tracking(apps, schema_editor):
+    Order = apps.get_model("orders", "Order")
+    OrderTracking = apps.get_model("orders", "OrderTracking")
+    newest = OrderTracking.objects.filter(order_id=models.OuterRef("pk")).order_by("-id").values("pk")[:1]
+    Order.objects.update(latest_tracking=models.Subquery(newest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0004_order_list_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="latest_tracking",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="orders.ordertracking",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ordertracking",
+            index=models.Index(
+                fields=["order_id", "created_at"], name="tracking_order_created_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_latest_tracking, migrations.RunPython.noop),
+    ]
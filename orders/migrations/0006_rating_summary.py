@@ -0,0 +1,66 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:42
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_rating_summaries(apps, schema_editor):
+    Rating = apps.get_model("orders", "Rating")
+    RatingSummary = apps.get_model("orders", "RatingSummary")
+    stars = {f"stars_{value}": Count("pk", filter=Q(rating=value)) for value in range(1, 6)}
+    summaries = []
+    for scope, field in (("artisan", "order_id__artisan_id"), ("product", "order_id__product_id")):
+        rows = Rating.objects.filter(**{f"{field}__isnull": False}).values(field).annotate(
+            count=Count("pk"), total=Sum("rating"), **stars
+        )
+        for row in rows:
+            subject_id = row.pop(field)
+            summaries.append(RatingSummary(scope=scope, subject_id=subject_id, **row))
+    RatingSummary.objects.bulk_create(summaries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0005_order_tracking_timeline"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RatingSummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "scope",
+                    models.CharField(
+                        choices=[("artisan", "Artisan"), ("product", "Product")],
+                        max_length=10,
+                    ),
+                ),
+                ("subject_id", models.BigIntegerField()),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("total", models.PositiveIntegerField(default=0)),
+                ("stars_1", models.PositiveIntegerField(default=0)),
+                ("stars_2", models.PositiveIntegerField(default=0)),
+                ("stars_3", models.PositiveIntegerField(default=0)),
+                ("stars_4", models.PositiveIntegerField(default=0)),
+                ("stars_5", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="ratingsummary",
+            constraint=models.UniqueConstraint(
+                fields=("scope", "subject_id"), name="rating_summary_subject_unique"
+            ),
+        ),
+        migrations.RunPython(backfill_rating_summaries, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from users.models import User
 from products.models import Inventory
@@ -28,9 +29,28 @@ class Order(models.Model):
         choices=[('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed')],
         default='pending'
     )
+    latest_tracking = models.ForeignKey(
+        'OrderTracking', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['buyer_id', 'created_at'], name='order_buyer_created_idx'),
+            models.Index(fields=['artisan_id', 'status', 'created_at'], name='order_artisan_status_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_status = self.status
+
 class CustomDesignRequest(models.Model):
     STATUS_CHOICES = [
         ('material-sourcing', 'Material-sourcing'),
@@ -76,6 +96,11 @@ class OrderTracking(models.Model):
     approval_timestamp = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['order_id', 'created_at'], name='tracking_order_created_idx'),
+        ]
+
 class Rating(models.Model):
     order_id = models.ForeignKey(Order, on_delete=models.CASCADE)
     buyer_id = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ratings_given', limit_choices_to={'user_type': 'buyer'})
@@ -84,4 +109,66 @@ class Rating(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        unique_together = ('order_id', 'buyer_id')
\ No newline at end of file
+        unique_together = ('order_id', 'buyer_id')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_rating = instance.__dict__.get('rating')
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_rating = self.rating
+
+
+class RatingSummary(models.Model):
+    """
+    Running rating totals per artisan and per product, kept current by the
+    Rating signals so summary reads never aggregate the ratings table.
+    """
+    SCOPE_CHOICES = [('artisan', 'Artisan'), ('product', 'Product')]
+
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    subject_id = models.BigIntegerField()
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'subject_id'], name='rating_summary_subject_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.scope} {self.subject_id}: {self.count} ratings'
+
+    @property
+    def average(self):
+        return round(self.total / self.count, 2) if self.count else None
+
+    @property
+    def histogram(self):
+        return {stars: getattr(self, f'stars_{stars}') for stars in range(1, 6)}
+
+
+class ArchivedOrder(models.Model):
+    """
+    Completed and rejected orders moved out of the hot table by
+    ``archive_history``, with their tracking history embedded in ``data``.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    buyer_id = models.IntegerField(db_index=True)
+    artisan_id = models.IntegerField(db_index=True)
+    status = models.CharField(max_length=20)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+    data = models.JSONField()
+
+    def __str__(self):
+        return f'Archived order {self.id} - Status: {self.status}'
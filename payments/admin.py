@@ -1,5 +1,53 @@
 from django.contrib import admin
 
-from .models import Payment
+from .models import AccountBalance, BalanceSnapshot, DarajaCallback, LedgerEntry, Payment
 
-admin.site.register(Payment)
+@admin.register(Payment)
+class PaymentAdmin(admin.ModelAdmin):
+    list_display = ('id', 'transaction_code', 'status', 'amount', 'paid_at', 'released_at')
+    list_filter = ('status',)
+    search_fields = ('transaction_code', 'checkout_request_id', 'b2c_conversation_id')
+    actions = ['retry_payouts']
+
+    @admin.action(description="Retry failed payouts")
+    def retry_payouts(self, request, queryset):
+        from api.payouts import retry_failed_payouts
+
+        count = retry_failed_payouts(queryset.filter(status='payout_failed').values_list('pk', flat=True))
+        self.message_user(request, f"{count} payouts queued again.")
+
+
+@admin.register(DarajaCallback)
+class DarajaCallbackAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'received_at', 'processed_at')
+    list_filter = ('status', 'kind')
+    actions = ['replay']
+
+    @admin.action(description="Replay selected callbacks")
+    def replay(self, request, queryset):
+        from api.callbacks import replay_callbacks
+
+        count = replay_callbacks(queryset)
+        self.message_user(request, f"{count} callbacks queued for replay.")
+
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'payment', 'kind', 'debit_account', 'credit_account', 'amount', 'created_at')
+    list_filter = ('kind',)
+    search_fields = ('debit_account', 'credit_account')
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(AccountBalance)
+class AccountBalanceAdmin(admin.ModelAdmin):
+    list_display = ('account', 'balance', 'updated_at')
+    search_fields = ('account',)
+
+
+admin.site.register(BalanceSnapshot)
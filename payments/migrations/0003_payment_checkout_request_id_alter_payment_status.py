@@ -0,0 +1,33 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="checkout_request_id",
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="payment",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("failed", "Failed"),
+                    ("held", "Held"),
+                    ("released", "Released"),
+                    ("refunded", "Refunded"),
+                ],
+                default="held",
+                max_length=20,
+            ),
+        ),
+    ]
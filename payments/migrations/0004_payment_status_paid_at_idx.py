@@ -0,0 +1,35 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0003_payment_checkout_request_id_alter_payment_status"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="payment",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("failed", "Failed"),
+                    ("held", "Held"),
+                    ("releasing", "Releasing"),
+                    ("released", "Released"),
+                    ("refunded", "Refunded"),
+                ],
+                default="held",
+                max_length=20,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["status", "paid_at"], name="payment_status_paid_at_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:25
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def backfill_created_at(apps, schema_editor):
+    Payment = apps.get_model("payments", "Payment")
+    Payment.objects.filter(paid_at__isnull=False).update(created_at=models.F("paid_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0005_daraja_callback"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="created_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False
+            ),
+        ),
+        migrations.AddField(
+            model_name="payment",
+            name="stk_queried_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_created_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["status", "created_at"], name="payment_status_created_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0006_payment_created_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="b2c_conversation_id",
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="darajacallback",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("stk", "STK push result"),
+                    ("b2c_result", "B2C result"),
+                    ("b2c_timeout", "B2C queue timeout"),
+                ],
+                default="stk",
+                max_length=20,
+            ),
+        ),
+    ]
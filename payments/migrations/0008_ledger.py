@@ -0,0 +1,137 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:30
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+from api.ledger import PLATFORM_FLOAT, escrow_account
+
+
+def backfill_ledger(apps, schema_editor):
+    Payment = apps.get_model("payments", "Payment")
+    LedgerEntry = apps.get_model("payments", "LedgerEntry")
+    AccountBalance = apps.get_model("payments", "AccountBalance")
+    balances = defaultdict(Decimal)
+    batch = []
+    in_escrow = Payment.objects.filter(status__in=["held", "releasing", "released"])
+    for payment in in_escrow.only("id", "artisan_id", "amount", "status").iterator():
+        escrow = escrow_account(payment.artisan_id_id)
+        batch.append(LedgerEntry(
+            payment_id=payment.id, kind="deposit", transition="held",
+            debit_account=PLATFORM_FLOAT, credit_account=escrow, amount=payment.amount,
+        ))
+        balances[PLATFORM_FLOAT] += payment.amount
+        balances[escrow] -= payment.amount
+        if payment.status == "released":
+            batch.append(LedgerEntry(
+                payment_id=payment.id, kind="withdrawal", transition="released",
+                debit_account=escrow, credit_account=PLATFORM_FLOAT, amount=payment.amount,
+            ))
+            balances[PLATFORM_FLOAT] -= payment.amount
+            balances[escrow] += payment.amount
+        if len(batch) >= 1000:
+            LedgerEntry.objects.bulk_create(batch)
+            batch = []
+    LedgerEntry.objects.bulk_create(batch)
+    AccountBalance.objects.bulk_create(
+        [AccountBalance(account=account, balance=amount) for account, amount in balances.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0007_payment_b2c_conversation_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AccountBalance",
+            fields=[
+                (
+                    "account",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                (
+                    "balance",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="LedgerEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("deposit", "Deposit"), ("withdrawal", "Withdrawal")],
+                        max_length=20,
+                    ),
+                ),
+                ("transition", models.CharField(max_length=20)),
+                ("debit_account", models.CharField(max_length=64)),
+                ("credit_account", models.CharField(max_length=64)),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=12)),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        db_index=True, default=django.utils.timezone.now
+                    ),
+                ),
+                (
+                    "payment",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="ledger_entries",
+                        to="payments.payment",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="BalanceSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("account", models.CharField(max_length=64)),
+                ("balance", models.DecimalField(decimal_places=2, max_digits=14)),
+                ("last_entry_id", models.BigIntegerField(default=0)),
+                ("taken_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["account", "-taken_at"],
+                        name="balance_snapshot_account_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="ledgerentry",
+            constraint=models.UniqueConstraint(
+                fields=("payment", "kind"), name="ledger_entry_payment_kind_uniq"
+            ),
+        ),
+        migrations.RunPython(backfill_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0008_ledger"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedPayment",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                (
+                    "order_id",
+                    models.BigIntegerField(blank=True, db_index=True, null=True),
+                ),
+                (
+                    "artisan_id",
+                    models.IntegerField(blank=True, db_index=True, null=True),
+                ),
+                (
+                    "transaction_code",
+                    models.CharField(
+                        blank=True, db_index=True, max_length=50, null=True
+                    ),
+                ),
+                ("status", models.CharField(max_length=20)),
+                ("created_at", models.DateTimeField()),
+                (
+                    "archived_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("data", models.JSONField()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="ledgerentry",
+            name="payment",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="ledger_entries",
+                to="payments.payment",
+            ),
+        ),
+    ]
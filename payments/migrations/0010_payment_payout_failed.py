@@ -0,0 +1,45 @@
+# Generated by Django 4.2.24 on 2026-10-18 06:05
+
+from django.db import migrations, models
+
+
+def mark_failed_payouts(apps, schema_editor):
+    """Failed payments still deposited in escrow are payouts that failed, not pushes."""
+    Payment = apps.get_model("payments", "Payment")
+    LedgerEntry = apps.get_model("payments", "LedgerEntry")
+    funded = LedgerEntry.objects.filter(kind="deposit").values("payment_id")
+    withdrawn = LedgerEntry.objects.filter(kind="withdrawal").values("payment_id")
+    Payment.objects.filter(status="failed", pk__in=funded).exclude(pk__in=withdrawn).update(status="payout_failed")
+
+
+def unmark_failed_payouts(apps, schema_editor):
+    Payment = apps.get_model("payments", "Payment")
+    Payment.objects.filter(status="payout_failed").update(status="failed")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0009_archivedpayment"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="payment",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("failed", "Failed"),
+                    ("held", "Held"),
+                    ("releasing", "Releasing"),
+                    ("released", "Released"),
+                    ("refunded", "Refunded"),
+                    ("payout_failed", "Payout failed"),
+                ],
+                default="held",
+                max_length=20,
+            ),
+        ),
+        migrations.RunPython(mark_failed_payouts, unmark_failed_payouts),
+    ]
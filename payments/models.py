@@ -1,19 +1,28 @@
 from django.db import models
+from django.utils import timezone
 from users.models import User
 from orders.models import Order
 
 class Payment(models.Model):
     STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('failed', 'Failed'),
         ('held', 'Held'),
+        ('releasing', 'Releasing'),
         ('released', 'Released'),
         ('refunded', 'Refunded'),
+        ('payout_failed', 'Payout failed'),
     )
     order_id = models.ForeignKey(Order, on_delete=models.CASCADE, null=True, blank=True)
     artisan_id = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'user_type': 'artisan'}, null=True, blank=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     transaction_code = models.CharField(max_length=50, unique=True, null=True, blank=True)
+    checkout_request_id = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    b2c_conversation_id = models.CharField(max_length=100, unique=True, null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='held')
     paid_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    stk_queried_at = models.DateTimeField(null=True, blank=True)
     released_at = models.DateTimeField(null=True, blank=True)
     held_by_platform = models.BooleanField(default=True)
     mpesa_receipt_number = models.CharField(max_length=50, null=True, blank=True)
@@ -23,5 +32,113 @@ class Payment(models.Model):
     transaction_date = models.DateTimeField(null=True, blank=True)
     refunded_reason = models.CharField(max_length=255, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'paid_at'], name='payment_status_paid_at_idx'),
+            models.Index(fields=['status', 'created_at'], name='payment_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'Payment {self.transaction_code} - Status: {self.status}'
+
+class DarajaCallback(models.Model):
+    """Raw callback bodies as Daraja posted them, applied later in batches."""
+    KIND_CHOICES = (
+        ('stk', 'STK push result'),
+        ('b2c_result', 'B2C result'),
+        ('b2c_timeout', 'B2C queue timeout'),
+    )
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('processed', 'Processed'),
+        ('failed', 'Failed'),
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='stk')
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(null=True, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='daraja_callback_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} callback {self.id} - {self.status}'
+
+
+class LedgerEntry(models.Model):
+    """
+    Append-only record of money entering or leaving escrow. Each row moves
+    ``amount`` from ``credit_account`` to ``debit_account``, so the balances
+    of all accounts always sum to zero. A payment is deposited at most once
+    and withdrawn at most once.
+    """
+    KIND_CHOICES = (
+        ('deposit', 'Deposit'),
+        ('withdrawal', 'Withdrawal'),
+    )
+    # No database constraint: entries outlive payments moved to ArchivedPayment.
+    payment = models.ForeignKey(
+        Payment, on_delete=models.DO_NOTHING, db_constraint=False, related_name='ledger_entries'
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    transition = models.CharField(max_length=20)
+    debit_account = models.CharField(max_length=64)
+    credit_account = models.CharField(max_length=64)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['payment', 'kind'], name='ledger_entry_payment_kind_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.amount} {self.credit_account} -> {self.debit_account}'
+
+
+class AccountBalance(models.Model):
+    account = models.CharField(max_length=64, primary_key=True)
+    balance = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.account}: {self.balance}'
+
+
+class BalanceSnapshot(models.Model):
+    account = models.CharField(max_length=64)
+    balance = models.DecimalField(max_digits=14, decimal_places=2)
+    last_entry_id = models.BigIntegerField(default=0)
+    taken_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', '-taken_at'], name='balance_snapshot_account_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.account}: {self.balance} at {self.taken_at}'
+
+
+class ArchivedPayment(models.Model):
+    """
+    Settled payments moved out of the hot table by ``archive_history``.
+    ``data`` is the payment as the API served it when it was archived.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    order_id = models.BigIntegerField(null=True, blank=True, db_index=True)
+    artisan_id = models.IntegerField(null=True, blank=True, db_index=True)
+    transaction_code = models.CharField(max_length=50, null=True, blank=True, db_index=True)
+    status = models.CharField(max_length=20)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+    data = models.JSONField()
+
     def __str__(self):
-        return f'Payment {self.transaction_code} - Status: {self.status}'
\ No newline at end of file
+        return f'Archived payment {self.transaction_code} - Status: {self.status}'
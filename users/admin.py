@@ -1,4 +1,5 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from api.verification import update_verification, verification_progress
 from .models import User, ArtisanProfile, Profile, ArtisanPortfolio
 
 @admin.register(ArtisanProfile)
@@ -9,11 +10,23 @@ class ArtisanProfileAdmin(admin.ModelAdmin):
     actions = ['update_verification']
 
     def update_verification(self, request, queryset):
-        for profile in queryset:
-            profile.update_verification_status()
-        self.message_user(request, "Verification status updated.")
+        updated, batch = update_verification(queryset)
+        if batch is None:
+            self.message_user(request, f"Verification status updated for {updated} profiles.")
+        else:
+            self.message_user(request, f"Verification recompute queued as batch {batch}; progress is shown on this page.")
     update_verification.short_description = "Update verification status for selected profiles"
 
+    def changelist_view(self, request, extra_context=None):
+        for batch, progress in verification_progress().items():
+            self.message_user(
+                request,
+                f"Verification batch {batch}: {progress['done']}/{progress['chunks']} chunks done"
+                + (f", {progress['failed']} failed" if progress['failed'] else ""),
+                level=messages.INFO,
+            )
+        return super().changelist_view(request, extra_context)
+
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     list_display = ('email', 'user_type', 'is_active', 'image_url')  
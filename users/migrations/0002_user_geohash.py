@@ -0,0 +1,37 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:06
+
+from django.db import migrations, models
+
+from api.utils import geohash_encode
+
+
+def backfill_geohash(apps, schema_editor):
+    User = apps.get_model("users", "User")
+    located = User.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    batch = []
+    for user in located.only("user_id", "latitude", "longitude").iterator():
+        user.geohash = geohash_encode(user.latitude, user.longitude)
+        batch.append(user)
+        if len(batch) >= 1000:
+            User.objects.bulk_update(batch, ["geohash"])
+            batch = []
+    if batch:
+        User.objects.bulk_update(batch, ["geohash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="geohash",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=12, null=True
+            ),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0002_user_geohash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="artisanprofile",
+            name="rating_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="artisanprofile",
+            name="rating_total",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="artisanprofile",
+            name="rejected_orders",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="artisanprofile",
+            name="total_orders",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="artisanprofile",
+            name="week_start",
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+    ]
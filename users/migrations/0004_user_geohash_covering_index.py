@@ -0,0 +1,34 @@
+# Generated by Django 4.2.24 on 2026-10-18 06:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0003_artisan_metric_counters"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                fields=[
+                    "geohash",
+                    "latitude",
+                    "longitude",
+                    "user_type",
+                    "first_name",
+                    "last_name",
+                ],
+                name="user_geohash_covering_idx",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="user",
+            name="geohash",
+            field=models.CharField(
+                blank=True, editable=False, max_length=12, null=True
+            ),
+        ),
+    ]
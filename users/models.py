@@ -5,11 +5,16 @@ from django.core.exceptions import ValidationError
 from datetime import timedelta
 import random
 from django.conf import settings
-import requests
+from django.db.models import Q
+from api.utils import bounding_box, geohash_cover, geohash_encode
 
 def generate_otp():
     return str(random.randint(100000, 999999))
 
+def current_week_start():
+    today = timezone.localdate()
+    return today - timedelta(days=today.weekday())
+
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
@@ -35,6 +40,17 @@ class UserManager(BaseUserManager):
         user.save(using=self._db)
         return user
 
+    def near(self, latitude, longitude, radius_km):
+        south, west, north, east = bounding_box(latitude, longitude, radius_km)
+        cells = Q()
+        for cell in geohash_cover(south, west, north, east):
+            # A range rather than startswith so every backend can use the index.
+            cells |= Q(geohash__gte=cell, geohash__lt=cell + '~')
+        queryset = self.get_queryset().filter(cells, latitude__range=(south, north))
+        if west <= east:
+            queryset = queryset.filter(longitude__range=(west, east))
+        return queryset
+
 class User(AbstractBaseUser, PermissionsMixin):
     class UserType(models.TextChoices):
         ARTISAN = "ARTISAN", "Artisan"
@@ -57,6 +73,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     address = models.CharField(max_length=255, null=True, blank=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    geohash = models.CharField(max_length=12, null=True, blank=True, editable=False)
     otp = models.CharField(max_length=6, null=True, blank=True)
     otp_exp = models.DateTimeField(null=True, blank=True)
     otp_verified = models.BooleanField(default=False)
@@ -66,9 +83,39 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = "phone_number"
     REQUIRED_FIELDS = ["email"]
 
+    class Meta:
+        indexes = [
+            # Covers near() and the nearby-search columns, so the geohash
+            # prefilter is answered from the index without reading table rows
+            # scattered across a large table.
+            models.Index(
+                fields=['geohash', 'latitude', 'longitude', 'user_type', 'first_name', 'last_name'],
+                name='user_geohash_covering_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.first_name or ''} {self.last_name or ''} ({self.email})".strip()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_location = (instance.__dict__.get('latitude'), instance.__dict__.get('longitude'))
+        instance._loaded_address = instance.__dict__.get('address')
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geohash_encode(self.latitude, self.longitude)
+        else:
+            self.geohash = None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
+        self._loaded_location = (self.latitude, self.longitude)
+        self._loaded_address = self.address
+
     def generate_otp(self):
         self.otp = generate_otp()
         self.otp_exp = timezone.now() + timedelta(minutes=10)
@@ -88,7 +135,28 @@ class Profile(models.Model):
     def __str__(self):
         return f"{self.user.email} Profile"
 
+class ArtisanProfileQuerySet(models.QuerySet):
+    def update_verification(self):
+        """Set-based ``update_verification_status``: one UPDATE for the whole queryset."""
+        verified = ArtisanProfile.verification_q()
+        return self.update(
+            is_verified=models.Case(models.When(verified, then=models.Value(True)), default=models.Value(False)),
+            order_value_limit=models.Case(
+                models.When(verified, then=models.Value(None)),
+                default=models.Value(ArtisanProfile.UNVERIFIED_ORDER_VALUE_LIMIT),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
+            ),
+        )
+
+
 class ArtisanProfile(models.Model):
+    MIN_FULFILLMENT_RATE = 90
+    MAX_REJECTION_RATE = 10
+    MIN_AVERAGE_RATING = 4.0
+    MIN_DAYS_ACTIVE = 85
+    MIN_COMPLETED_ORDERS = 10
+    UNVERIFIED_ORDER_VALUE_LIMIT = 2000
+
     user = models.OneToOneField(
         User,
         on_delete=models.CASCADE,
@@ -101,36 +169,54 @@ class ArtisanProfile(models.Model):
     completed_orders = models.PositiveIntegerField(default=0)
     is_verified = models.BooleanField(default=False)
     weekly_order_count = models.PositiveIntegerField(default=0)
+    week_start = models.DateField(null=True, blank=True, editable=False)
+    total_orders = models.PositiveIntegerField(default=0, editable=False)
+    rejected_orders = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_total = models.PositiveIntegerField(default=0, editable=False)
     order_value_limit = models.DecimalField(max_digits=10, decimal_places=2, default=2000, null=True, blank=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
 
+    objects = ArtisanProfileQuerySet.as_manager()
+
     def __str__(self):
         return f"Artisan Profile for {self.user.email}"
 
+    @classmethod
+    def verification_q(cls):
+        return Q(
+            fulfillment_rate__gte=cls.MIN_FULFILLMENT_RATE,
+            rejection_rate__lte=cls.MAX_REJECTION_RATE,
+            average_rating__gte=cls.MIN_AVERAGE_RATING,
+            days_active__gte=cls.MIN_DAYS_ACTIVE,
+            completed_orders__gte=cls.MIN_COMPLETED_ORDERS,
+        )
+
     def clean(self):
         if self.user.user_type != 'ARTISAN':
             raise ValidationError("ArtisanProfile can only be linked to an artisan user.")
 
     def update_verification_status(self):
         if (
-            self.fulfillment_rate >= 90
-            and self.rejection_rate <= 10
-            and self.average_rating >= 4.0
-            and self.days_active >= 85
-            and self.completed_orders >= 10
+            self.fulfillment_rate >= self.MIN_FULFILLMENT_RATE
+            and self.rejection_rate <= self.MAX_REJECTION_RATE
+            and self.average_rating >= self.MIN_AVERAGE_RATING
+            and self.days_active >= self.MIN_DAYS_ACTIVE
+            and self.completed_orders >= self.MIN_COMPLETED_ORDERS
         ):
             self.is_verified = True
             self.order_value_limit = None
         else:
             self.is_verified = False
-            self.order_value_limit = 2000
-        self.save()
+            self.order_value_limit = self.UNVERIFIED_ORDER_VALUE_LIMIT
+        self.save(update_fields=['is_verified', 'order_value_limit'])
 
     def can_take_order(self, order_value):
         if self.is_verified:
             return True
-        return order_value <= 2000 and self.weekly_order_count < 5
+        weekly_order_count = self.weekly_order_count if self.week_start == current_week_start() else 0
+        return order_value <= self.UNVERIFIED_ORDER_VALUE_LIMIT and weekly_order_count < 5
         
 class ArtisanPortfolio(models.Model):
     portfolio_id = models.AutoField(primary_key=True)
@@ -151,54 +237,3 @@ class ArtisanPortfolio(models.Model):
             for url in self.image_urls:
                 if not isinstance(url, str) or not url.startswith(('http://', 'https://')):
                     raise ValidationError(f"Invalid URL in image_urls: {url}")
-    def save(self, *args, **kwargs):
-        if self.user_type == self.ARTISAN and self.address:
-            lat, lon = self.get_lat_lon_from_address(self.address)
-            if lat and lon:
-                self.latitude = lat
-                self.longitude = lon
-        super().save(*args, **kwargs)
-    def get_lat_lon_from_address(self, address):
-        LOCATIONIQ_API_KEY = settings.LOCATIONIQ_API_KEY
-        url = "https://us1.locationiq.com/v1/search.php"
-        params = {
-            'key': LOCATIONIQ_API_KEY,
-            'q': address,
-            'format': 'json',
-            'limit': 1
-        }
-        try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            if data:
-                return float(data[0]['lat']), float(data[0]['lon'])
-        except Exception as e:
-            print(f"Error fetching location: {e}")
-        return None, None
-    def set_location_from_address(self, address):
-        if not address:
-            self.location = None
-            return
-        url = "https://us1.locationiq.com/v1/search"
-        params = {
-            'key': settings.LOCATIONIQ_API_KEY,
-            'q': address,
-            'format': 'json',
-            'limit': 1,
-            'normalizeaddress': 1,
-        }
-        try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            if data:
-                lat = float(data[0]['lat'])
-                lon = float(data[0]['lon'])
-                self.location = Point(lon, lat, srid=4326)
-            else:
-                self.location = None
-        except Exception as e:
-            print(f"Geocoding failed for {address}: {e}")
-            self.location = None
-            